@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+A stand-in for the Qualtrics export API which serves .csv files from this computer, so pid_completion.fetch can be tried
+out and timed without a Qualtrics account or the real data. Each export takes a while to be ready, the files are sent a
+bit at a time at a set speed and some requests fail on purpose, so the retries get used too.
+
+Running this file makes (or reuses) the fake data from synthetic_data.py, starts the stand-in and times fetching one
+export and then many at once, first just reading the bodies and then parsing them with read_qualtrics_data as well:
+
+    python benchmarks/fake_qualtrics.py --rows 10000 --surveys 24
+
+With the exports being fetched at the same time, fetching the many should take not much longer than the one. The
+parsing holds the GIL for most of the time it takes, so parsing many exports still takes about as long as parsing them
+one after the other.
+
+Functions [Order]:
+- FakeQualtricsHandler: Answers the three export API requests.
+
+- start_fake_qualtrics(files, exportdelay, bytespersecond, failurerate, seed): Starts the stand-in in the background.
+
+- count_bytes(name, source): A parse function which just reads the export, to time the fetching on its own.
+
+- parse_export(name, source): Parses an export as the CN or Post CN survey its name says it is.
+
+- time_fetch(baseurl, surveys, connections, parse): Times fetching some exports with pid_completion.fetch.
+"""
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import synthetic_data
+
+#The token the stand-in expects, the fetching is given the same one
+FAKE_TOKEN='fake-token'
+#How much of a file is sent at a time
+SEND_SIZE=64*1024
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+class FakeQualtricsHandler(BaseHTTPRequestHandler):
+    """
+    Answers the export API requests the same way Qualtrics does (see fetch_export), using the settings and the exports
+    in progress kept on the server. HTTP/1.1 so the connections are kept open between requests.
+    """
+    protocol_version='HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections+=1
+
+    def send_json(self, status, reply):
+        body=json.dumps(reply).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def failed(self):
+        #failing some requests on purpose, half with a 503 and half by dropping the connection
+        with self.server.lock:
+            self.server.requests+=1
+            fail=self.server.random.random()<self.server.failurerate
+            drop=self.server.random.random()<0.5
+        if fail and drop:
+            self.close_connection=True
+            return True
+        if fail:
+            self.send_json(503, {'meta': {'error': 'Service unavailable'}})
+            return True
+        if self.headers.get('X-API-TOKEN')!=FAKE_TOKEN:
+            self.send_json(401, {'meta': {'error': 'Bad token'}})
+            return True
+        return False
+
+    def do_POST(self):
+        #reading the body so the connection is ready for the next request
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        parts=self.path.strip('/').split('/')
+        if self.failed():
+            return
+        if len(parts)!=5 or parts[4]!='export-responses' or parts[3] not in self.server.files:
+            self.send_json(404, {'meta': {'error': 'Not found'}})
+            return
+        with self.server.lock:
+            progressid='ES_' + str(len(self.server.exports))
+            self.server.exports[progressid]=(parts[3], time.perf_counter()+self.server.exportdelay)
+        self.send_json(200, {'result': {'progressId': progressid}})
+
+    def do_GET(self):
+        parts=self.path.strip('/').split('/')
+        if self.failed():
+            return
+        if len(parts)==6 and parts[5] in self.server.exports:
+            surveyid, ready=self.server.exports[parts[5]]
+            done=time.perf_counter()>=ready
+            self.send_json(200, {'result': {'status': 'complete' if done else 'inProgress', 'fileId': parts[5] if done else None,
+                                            'percentComplete': 100 if done else 50}})
+        elif len(parts)==7 and parts[6]=='file' and parts[5] in self.server.exports:
+            filename=self.server.files[self.server.exports[parts[5]][0]]
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/csv')
+            self.send_header('Content-Length', str(os.path.getsize(filename)))
+            self.end_headers()
+            with open(filename, 'rb') as file:
+                for block in iter(lambda: file.read(SEND_SIZE), b''):
+                    self.wfile.write(block)
+                    time.sleep(len(block)/self.server.bytespersecond)
+        else:
+            self.send_json(404, {'meta': {'error': 'Not found'}})
+
+    def log_message(self, format, *args):
+        pass
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def start_fake_qualtrics(files, exportdelay=0.5, bytespersecond=20*1024*1024, failurerate=0.05, seed=0):
+    """
+    Starts the stand-in on a free port in a background thread.
+
+    Arguments:
+        files (dict): The .csv file to serve for each survey ID.
+        exportdelay (float): The seconds after an export is started until it is ready.
+        bytespersecond (float): How fast each file is sent.
+        failurerate (float): The fraction of requests which fail on purpose.
+        seed (int): The seed for which requests fail.
+
+    Returns:
+        ThreadingHTTPServer: The server, with its base URL in server.baseurl and the number of connections made to it
+        in server.connections. Stop it with server.shutdown().
+    """
+    server=ThreadingHTTPServer(('127.0.0.1', 0), FakeQualtricsHandler)
+    server.daemon_threads=True
+    server.files, server.exportdelay, server.bytespersecond, server.failurerate=files, exportdelay, bytespersecond, failurerate
+    server.random, server.lock, server.exports, server.connections, server.requests=random.Random(seed), threading.Lock(), {}, 0, 0
+    server.baseurl='http://127.0.0.1:' + str(server.server_address[1])
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def count_bytes(name, source):
+    """
+    Reads an export without parsing it, so the fetching can be timed on its own.
+
+    Arguments:
+        name (str): The name of the survey.
+        source (file-like): The body of the export.
+
+    Returns:
+        int: The number of bytes in the export.
+    """
+    return sum(len(block) for block in iter(lambda: source.read(SEND_SIZE), b''))
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def parse_export(name, source):
+    """
+    Parses an export the same way as fetch.parse_export, as a CN or Post CN one depending on its name.
+
+    Arguments:
+        name (str): The name of the survey.
+        source (file-like): The body of the export.
+
+    Returns:
+        tuple: The same as read_qualtrics_data.
+    """
+    from pid_completion import fetch
+    return fetch.parse_export('POST' if name.startswith('Post') else 'CN', source)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def time_fetch(baseurl, surveys, connections=8, parse=None):
+    """
+    Times fetching some exports with fetch_exports.
+
+    Arguments:
+        baseurl (str): The address of the stand-in.
+        surveys (dict): The survey ID for each name.
+        connections (int): The most connections open at once.
+        parse (function): What is done with each export as it arrives, e.g. parse_export.
+
+    Returns:
+        tuple: The seconds it took and the results.
+    """
+    from pid_completion import fetch
+    start=time.perf_counter()
+    results=fetch.fetch_exports(surveys, baseurl, FAKE_TOKEN, parse, connections=connections, pollinterval=0.1, backoff=0.05)
+    return time.perf_counter()-start, results
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+if __name__ == '__main__':
+    parser=argparse.ArgumentParser(description='Times fetching exports from a stand-in for the Qualtrics export API.')
+    parser.add_argument('--rows', type=int, default=10000, help='rows in the fake data record')
+    parser.add_argument('--surveys', type=int, default=24, help='exports fetched at once')
+    parser.add_argument('--connections', type=int, default=8, help='the most connections open at once')
+    parser.add_argument('--failure-rate', type=float, default=0.05, help='the fraction of requests which fail on purpose')
+    parser.add_argument('--datadir', default=os.path.join(tempfile.gettempdir(), 'participant-completion-benchmarks'))
+    arguments=parser.parse_args()
+    synthetic_data.load_pipeline()
+    sizedir=os.path.join(arguments.datadir, str(arguments.rows))
+    files={'datarecord': os.path.join(sizedir, synthetic_data.DATA_RECORD_FILE), 'CN': os.path.join(sizedir, synthetic_data.CN_FILE),
+           'POST': os.path.join(sizedir, synthetic_data.POST_FILE)}
+    if not all(os.path.exists(filename) for filename in files.values()):
+        files=synthetic_data.generate(sizedir, arguments.rows)
+    #every other survey is a Post CN one
+    surveys={('Post CN ' if number%2 else 'CN ') + 'Questionnaire Results ' + str(number) + '.csv': 'SV_' + str(number) for number in range(arguments.surveys)}
+    server=start_fake_qualtrics({'SV_' + str(number): files['POST' if number%2 else 'CN'] for number in range(arguments.surveys)},
+                                failurerate=arguments.failure_rate)
+    onename=next(iter(surveys))
+    for label, parse in [('fetch', count_bytes), ('fetch and parse', parse_export)]:
+        oneseconds, oneresults=time_fetch(server.baseurl, {onename: surveys[onename]}, arguments.connections, parse)
+        connections, requests=server.connections, server.requests
+        manyseconds, manyresults=time_fetch(server.baseurl, surveys, arguments.connections, parse)
+        print("%-16s 1 export: %7.3fs  %d exports: %7.3fs (%d connections for %d requests)" % (label, oneseconds, len(surveys), manyseconds,
+                                                                                             server.connections-connections, server.requests-requests))
+    server.shutdown()
+    sys.exit(0 if len(manyresults)==len(surveys) else 1)
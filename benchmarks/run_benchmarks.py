@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+Times the main functions of the participant completion pipeline and the whole of get_completion_data (in each mode) on
+fake data from synthetic_data.py, at 1k, 100k, 1M and 10M rows. For each one it reports the time, the throughput (rows
+per second) and the peak memory (measured by tracemalloc in a second run, so it doesn't slow the timed run down).
+
+The results can be saved as .json and compared against an earlier run, so any change can be checked for speed-ups or
+slow-downs:
+
+    python benchmarks/run_benchmarks.py --sizes 1k,100k --output before.json
+    ...make a change...
+    python benchmarks/run_benchmarks.py --sizes 1k,100k --output after.json --baseline before.json
+
+The data for each size is made once and kept in --datadir. The dictionary (original) mode is skipped above --max-dict-rows
+because it needs several times more memory than the others.
+
+Functions [Order]:
+- parse_size(size): Turns '100k' or '1M' into a number of rows.
+
+- measure(function, memory): Runs a function, timing it and optionally measuring its peak memory.
+
+- benchmark_cases(pipeline, files, rows, outputdir, maxdictrows, outputformat): Lists what gets timed at one size.
+
+- run_benchmarks(sizes, datadir, memory, maxdictrows, outputformat, only): Runs every benchmark at every size.
+
+- compare_results(results, baseline): Puts the results next to an earlier run.
+"""
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+import warnings
+import pandas as pd
+
+import synthetic_data
+
+#The sizes asked for in the benchmark suite, the data record has this many rows and each export 90% of it
+SIZES={'1k': 1000, '100k': 100000, '1M': 1000000, '10M': 10000000}
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def parse_size(size):
+    """
+    Turns a size like '100k' or '1M' (or just a number) into a number of rows.
+
+    Arguments:
+        size (str): The size.
+
+    Returns:
+        int: The number of rows.
+    """
+    if size in SIZES:
+        return SIZES[size]
+    multipliers={'k': 1000, 'm': 1000000}
+    if size[-1].lower() in multipliers:
+        return int(float(size[:-1])*multipliers[size[-1].lower()])
+    return int(size)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def measure(function, memory=True):
+    """
+    Runs function once and times it with a clock that can't go backwards, with everything it prints hidden. If memory
+    is True it is then run again with tracemalloc on to get the most memory it used on top of what was already in use.
+
+    Arguments:
+        function (callable): The function to run, with no arguments.
+        memory (bool): If True the peak memory is measured as well.
+
+    Returns:
+        dict: The 'seconds' it took, the 'cpu_seconds' and the 'peak_bytes' (None if memory is False).
+    """
+    gc.collect()
+    with contextlib.redirect_stdout(io.StringIO()):
+        start, cpu=time.perf_counter(), time.process_time()
+        function()
+        seconds, cpuseconds=time.perf_counter()-start, time.process_time()-cpu
+        peak=None
+        if memory:
+            gc.collect()
+            tracemalloc.start()
+            try:
+                base=tracemalloc.get_traced_memory()[0]
+                function()
+                peak=tracemalloc.get_traced_memory()[1]-base
+            finally:
+                tracemalloc.stop()
+    return {'seconds': seconds, 'cpu_seconds': cpuseconds, 'peak_bytes': peak}
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def benchmark_cases(pipeline, files, rows, outputdir, maxdictrows=1000000, outputformat='parquet'):
+    """
+    Lists the benchmarks for one size. The inputs each one needs are worked out first so only the function itself is
+    timed.
+
+    Arguments:
+        pipeline (module): pid_completion.pipeline, from synthetic_data.load_pipeline.
+        files (dict): The files from synthetic_data.generate.
+        rows (int): The number of rows in the data record.
+        outputdir (str): Where get_completion_data saves its output.
+        maxdictrows (int): The dictionary mode benchmarks are skipped above this many rows.
+        outputformat (str): The output format for get_completion_data (Excel can't hold more than about 1M rows).
+
+    Returns:
+        list: (name, rows, function) tuples, where rows is the number of rows the function works through.
+    """
+    cn=pipeline.read_qualtrics_frame(files['CN'], survey='CN')
+    datarecordframe=pipeline.read_data_record_frame(files['datarecord'])
+    pidindex, duplicate_pids=pipeline.build_pid_index(datarecordframe['Participant ID'])
+    CNmatches, joinreport=pipeline.match_qualtrics_frame(pidindex, cn)
+    post=pipeline.read_qualtrics_frame(files['POST'], survey='POST')
+    POSTmatches, joinreport=pipeline.match_qualtrics_frame(pidindex, post)
+    finalframe=pipeline.build_final_frame(datarecordframe, CNmatches, pipeline.CNnames, POSTmatches, pipeline.POSTnames)
+    sheets={'Completion Numbers': (pipeline.completion_data_summary(finalframe), True)}
+    outputfile=os.path.join(outputdir, 'Participant Completion Data.xlsx')
+    arguments=(files['datarecord'], files['CN'], pipeline.CNnames, files['POST'], pipeline.POSTnames)
+    cases=[('read_qualtrics_frame', len(cn), lambda: pipeline.read_qualtrics_frame(files['CN'], survey='CN')),
+           ('classify_pids', len(cn), lambda: pipeline.classify_pids(cn['ParticipantID'])),
+           ('filter_qualtrics_frame', len(cn), lambda: pipeline.filter_qualtrics_frame(cn)),
+           ('read_data_record_frame', rows, lambda: pipeline.read_data_record_frame(files['datarecord'])),
+           ('build_pid_index', rows, lambda: pipeline.build_pid_index(datarecordframe['Participant ID'])),
+           ('match_qualtrics_frame', len(cn), lambda: pipeline.match_qualtrics_frame(pidindex, cn)),
+           ('stream_qualtrics', len(cn), lambda: pipeline.stream_qualtrics(files['CN'], pidindex, survey='CN')),
+           ('build_final_frame', rows, lambda: pipeline.build_final_frame(datarecordframe, CNmatches, pipeline.CNnames, POSTmatches, pipeline.POSTnames)),
+           ('completion_data_summary', rows, lambda: pipeline.completion_data_summary(finalframe)),
+           ('write_outputs', rows, lambda: pipeline.write_outputs(finalframe, sheets, outputfile, outputformat)),
+           ('get_completion_data columnar', rows, lambda: pipeline.get_completion_data(*arguments, columnar=True, outputfile=outputfile, outputformat=outputformat)),
+           ('get_completion_data compact', rows, lambda: pipeline.get_completion_data(*arguments, columnar=True, compact=True, outputfile=outputfile, outputformat=outputformat)),
+           ('get_completion_data sqlite', rows, lambda: pipeline.get_completion_data(*arguments, database=True, chunksize=50000, outputfile=outputfile, outputformat=outputformat)),
+           ('get_completion_data chunksize', rows, lambda: pipeline.get_completion_data(*arguments, chunksize=50000, outputfile=outputfile, outputformat=outputformat))]
+    if rows<=maxdictrows:
+        cndata=pipeline.read_qualtrics_data(files['CN'], survey='CN')[0]
+        datarecord, datarecordpids=pipeline.read_data_record(files['datarecord'])
+        cases+=[('read_qualtrics_data', len(cn), lambda: pipeline.read_qualtrics_data(files['CN'], survey='CN')),
+                ('filter_qualtrics', len(cn), lambda: pipeline.filter_qualtrics(cndata)),
+                #join_qualtrics changes the data record it is given, so each run gets its own copy (copying it is timed too)
+                ('join_qualtrics', len(cn), lambda: pipeline.join_qualtrics({row: dict(data) for row, data in datarecord.items()}, pidindex, cndata)),
+                ('get_completion_data', rows, lambda: pipeline.get_completion_data(*arguments, outputfile=outputfile, outputformat=outputformat))]
+    return cases
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def run_benchmarks(sizes, datadir, memory=True, maxdictrows=1000000, outputformat='parquet', only=None):
+    """
+    Makes the data for each size (if it isn't already in datadir) and runs every benchmark on it, printing each result as
+    it goes.
+
+    Arguments:
+        sizes (list): The sizes, e.g. ['1k', '100k'].
+        datadir (str): Where the fake data is kept between runs.
+        memory (bool): If True the peak memory is measured too.
+        maxdictrows (int): The dictionary mode benchmarks are skipped above this many rows.
+        outputformat (str): The output format for get_completion_data.
+        only (list): If given, only the benchmarks with these names are run.
+
+    Returns:
+        pd.DataFrame: A row for each benchmark and size, with the 'seconds', 'cpu_seconds', 'rows_per_second' and 'peak_bytes'.
+    """
+    pipeline=synthetic_data.load_pipeline()
+    results=[]
+    for size in sizes:
+        rows=parse_size(size)
+        sizedir=os.path.join(datadir, str(rows))
+        files={'datarecord': os.path.join(sizedir, synthetic_data.DATA_RECORD_FILE), 'CN': os.path.join(sizedir, synthetic_data.CN_FILE),
+               'POST': os.path.join(sizedir, synthetic_data.POST_FILE)}
+        if not all(os.path.exists(filename) for filename in files.values()):
+            print("Making " + str(rows) + " rows of data in " + sizedir)
+            files=synthetic_data.generate(sizedir, rows)
+        with tempfile.TemporaryDirectory() as outputdir:
+            for name, caserows, function in benchmark_cases(pipeline, files, rows, outputdir, maxdictrows, outputformat):
+                if only and name not in only:
+                    continue
+                result={'benchmark': name, 'size': size, 'rows': caserows, **measure(function, memory)}
+                result['rows_per_second']=caserows/result['seconds'] if result['seconds'] else float('nan')
+                results.append(result)
+                print("%-32s %8s %12.3fs %14.0f rows/s %10s" % (name, size, result['seconds'], result['rows_per_second'],
+                                                                 '' if result['peak_bytes'] is None else '%.1f MB' % (result['peak_bytes']/1024**2)))
+    return pd.DataFrame(results, columns=['benchmark', 'size', 'rows', 'seconds', 'cpu_seconds', 'rows_per_second', 'peak_bytes'])
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def compare_results(results, baseline):
+    """
+    Puts the results next to an earlier run of the same benchmarks.
+
+    Arguments:
+        results (pd.DataFrame): The results from run_benchmarks.
+        baseline (pd.DataFrame): The results of the earlier run.
+
+    Returns:
+        pd.DataFrame: The time and peak memory of both runs, with 'speedup' (above 1 is faster than the baseline) and
+        'memory_ratio' (below 1 uses less memory).
+    """
+    merged=results.merge(baseline, on=['benchmark', 'size'], how='left', suffixes=('', '_baseline'))
+    merged['speedup']=merged['seconds_baseline']/merged['seconds']
+    merged['memory_ratio']=merged['peak_bytes']/merged['peak_bytes_baseline']
+    return merged[['benchmark', 'size', 'seconds_baseline', 'seconds', 'speedup', 'peak_bytes_baseline', 'peak_bytes', 'memory_ratio']]
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+if __name__ == '__main__':
+    parser=argparse.ArgumentParser(description='Benchmarks the participant completion pipeline on fake data.')
+    parser.add_argument('--sizes', default='1k,100k', help='comma separated sizes out of ' + ', '.join(SIZES) + ' (or any number of rows)')
+    parser.add_argument('--datadir', default=os.path.join(tempfile.gettempdir(), 'participant-completion-benchmarks'))
+    parser.add_argument('--no-memory', action='store_true', help="don't measure peak memory (halves the run time)")
+    parser.add_argument('--max-dict-rows', type=int, default=1000000, help='skip the dictionary mode above this many rows')
+    parser.add_argument('--output-format', default='parquet', help='the output format for get_completion_data')
+    parser.add_argument('--only', help='comma separated benchmark names to run')
+    parser.add_argument('--output', help='save the results to this .json file')
+    parser.add_argument('--baseline', help='compare against the results in this .json file')
+    arguments=parser.parse_args()
+    warnings.simplefilter('ignore')
+    results=run_benchmarks(arguments.sizes.split(','), arguments.datadir, not arguments.no_memory, arguments.max_dict_rows,
+                           arguments.output_format, arguments.only.split(',') if arguments.only else None)
+    if arguments.output:
+        with open(arguments.output, 'w') as file:
+            json.dump(results.to_dict('records'), file, indent=1)
+    if arguments.baseline:
+        with open(arguments.baseline) as file:
+            baseline=pd.DataFrame(json.load(file))
+        with pd.option_context('display.width', 200, 'display.max_columns', 20):
+            print(compare_results(results, baseline).to_string(index=False))
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+Makes fake data records and CN/Post CN Qualtrics exports in the same layout as the real ones, so the pipeline can be run
+and benchmarked without the real (private) files.
+
+The exports have the two header rows Qualtrics gives (the column names then the question text), the metadata columns,
+the PID in Q5 (CN) or Q1 (Post CN), Progress/Finished, the IM_... picture codes for the hair type questions and the
+blank column Post CN exports have at position 18. Some of the PIDs are entered wrong (blank, spaces, symbols, wrong
+length, lowercase or a typo), some people do a questionnaire more than once and some PIDs appear twice in the data
+record, all at rates which can be changed.
+
+Functions [Order]:
+- load_pipeline(): Imports the pipeline so the column names match the ones it expects.
+
+- random_pids(rng, number): Makes unique random PIDs which are in the correct format.
+
+- mangle_pids(rng, pids, malformedrate): Enters some of the PIDs wrong the way people do.
+
+- make_data_record(rng, rows, recordduplicaterate): Makes the data record.
+
+- make_responses(rng, pipeline, pids, rows, post, ...): Makes a chunk of questionnaire responses.
+
+- write_qualtrics_export(filename, rng, pipeline, pids, rows, post, ...): Writes a questionnaire export a chunk at a time.
+
+- generate(outputdir, rows, seed, ...): Writes the data record and both exports.
+
+Usage:
+    python benchmarks/synthetic_data.py OUTPUTDIR --rows 100000
+"""
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+import argparse
+import csv
+import importlib
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+#The folder with the pid_completion package in it, relative to this file
+REPOSITORY=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+#The file names the exports and data record are saved as ('Post' has to be in the Post CN one, see qualtrics_columns)
+DATA_RECORD_FILE='Data Record Sorted Out.csv'
+CN_FILE='CN Questionnaire Results.csv'
+POST_FILE='Post CN Questionnaire Results.csv'
+#The metadata columns at the start of every Qualtrics export, in the order Qualtrics puts them
+METADATA_COLUMNS=['StartDate', 'EndDate', 'Status', 'IPAddress', 'Progress', 'Duration (in seconds)', 'Finished',
+                  'RecordedDate', 'ResponseId', 'RecipientLastName', 'RecipientFirstName', 'RecipientEmail',
+                  'ExternalReference', 'LocationLatitude', 'LocationLongitude', 'DistributionChannel', 'UserLanguage']
+PID_CHARACTERS=np.frombuffer(b'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789', dtype=np.uint8)
+#The answers picked from for the questions which aren't the PID or a hair type
+ANSWERS=np.array(['Strongly agree', 'Agree', 'Neither agree nor disagree', 'Disagree', 'Strongly disagree',
+                  'Yes', 'No', '1', '2', '3', '4', '5', ''], dtype=object)
+#How often a survey gets abandoned part of the way through
+PROGRESS_VALUES=np.array([100, 100, 100, 100, 100, 100, 75, 50, 20, 0])
+SCHOOLS=np.array(['Northfield', 'Riverside', 'Hillcrest', 'Oakwood', 'St Mary\'s', 'Kingsway'], dtype=object)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def load_pipeline():
+    """
+    Imports the pipeline from the pid_completion package next to this folder, so it doesn't need installing first.
+
+    Returns:
+        module: pid_completion.pipeline.
+    """
+    if REPOSITORY not in sys.path:
+        sys.path.insert(0, REPOSITORY)
+    return importlib.import_module('pid_completion.pipeline')
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def random_pids(rng, number):
+    """
+    Makes unique random PIDs in the correct format, a fifth of them 6 characters long and the rest 7.
+
+    Arguments:
+        rng (np.random.Generator): The random number generator.
+        number (int): The number of PIDs.
+
+    Returns:
+        np.ndarray: The PIDs, as an array of str.
+    """
+    pids=np.array([], dtype='U7')
+    while len(pids)<number:
+        missing=number-len(pids)
+        short=missing//5
+        seven=PID_CHARACTERS[rng.integers(0, len(PID_CHARACTERS), (missing-short, 7))].view('S7').ravel()
+        six=PID_CHARACTERS[rng.integers(0, len(PID_CHARACTERS), (short, 6))].view('S6').ravel()
+        new=np.concatenate([seven.astype('U7'), six.astype('U7')])
+        #going round again for any repeats, which are very rare
+        pids=pd.unique(np.concatenate([pids, new])).astype('U7')
+    return rng.permutation(pids[:number]).astype(object)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def mangle_pids(rng, pids, malformedrate):
+    """
+    Enters some of the PIDs wrong, picking evenly between the mistakes people actually make: leaving it blank, adding
+    a space, adding a symbol, missing characters off, typing it in lowercase (which still matches) and a typo (which is
+    the correct format but doesn't match).
+
+    Arguments:
+        rng (np.random.Generator): The random number generator.
+        pids (np.ndarray): The PIDs.
+        malformedrate (float): The fraction of PIDs to enter wrong.
+
+    Returns:
+        np.ndarray: The PIDs as entered.
+    """
+    pids=pd.Series(pids, dtype=object)
+    mistakes=np.where(rng.random(len(pids))<malformedrate, rng.integers(0, 6, len(pids)), -1)
+    pids[mistakes==0]=''
+    pids[mistakes==1]=' '+pids[mistakes==1]
+    pids[mistakes==2]=pids[mistakes==2].str[:3]+'-'+pids[mistakes==2].str[3:]
+    pids[mistakes==3]=pids[mistakes==3].str[:4]
+    pids[mistakes==4]=pids[mistakes==4].str.lower()
+    typos=pids[mistakes==5]
+    replacements=pd.Series(PID_CHARACTERS[rng.integers(0, len(PID_CHARACTERS), len(typos))].view('S1').astype('U1'), index=typos.index)
+    pids[mistakes==5]=typos.str[:-1]+replacements
+    return pids.to_numpy()
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def make_data_record(rng, rows, recordduplicaterate=0.001):
+    """
+    Makes the data record, with a row for each participant saying which school they're from and whether they did the
+    RS and Audio tasks ('Y' or blank).
+
+    Arguments:
+        rng (np.random.Generator): The random number generator.
+        rows (int): The number of participants.
+        recordduplicaterate (float): The fraction of rows which have the same PID as another row by mistake.
+
+    Returns:
+        pd.DataFrame: The data record.
+    """
+    pids=random_pids(rng, rows)
+    duplicates=np.flatnonzero(rng.random(rows)<recordduplicaterate)
+    if len(duplicates):
+        pids[duplicates]=pids[rng.integers(0, rows, len(duplicates))]
+    return pd.DataFrame({'Participant ID': pids,
+                         'School': SCHOOLS[rng.integers(0, len(SCHOOLS), rows)],
+                         'Session': rng.integers(1, 4, rows),
+                         'RS': np.where(rng.random(rows)<0.7, 'Y', None),
+                         'Audio': np.where(rng.random(rows)<0.6, 'Y', None)})
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def make_responses(rng, pipeline, pids, rows, post, startrow=0, malformedrate=0.1, duplicaterate=0.02, unmatchedrate=0.05):
+    """
+    Makes a chunk of responses to one of the questionnaires.
+
+    Arguments:
+        rng (np.random.Generator): The random number generator.
+        pipeline (module): pid_completion.pipeline, from load_pipeline.
+        pids (np.ndarray): The PIDs in the data record.
+        rows (int): The number of responses.
+        post (bool): True for the Post CN questionnaire, False for the CN one.
+        startrow (int): The number of responses in the chunks before this one, for the response IDs.
+        malformedrate (float): The fraction of PIDs entered wrong (see mangle_pids).
+        duplicaterate (float): The fraction of responses from someone who already did the questionnaire.
+        unmatchedrate (float): The fraction of responses from PIDs which aren't in the data record.
+
+    Returns:
+        pd.DataFrame: The responses, with the columns in the same order as the export.
+    """
+    questionno='Q1' if post else 'Q5'
+    questions=list(pipeline.POSTnames if post else pipeline.CNnames)
+    #working through the data record in order so most people only answer once, then adding the repeats and strangers
+    respondents=pids[(startrow+np.arange(rows))%len(pids)]
+    repeats=rng.random(rows)<duplicaterate
+    respondents[repeats]=pids[rng.integers(0, len(pids), repeats.sum())]
+    strangers=rng.random(rows)<unmatchedrate
+    respondents[strangers]=random_pids(rng, strangers.sum())
+    progress=PROGRESS_VALUES[rng.integers(0, len(PROGRESS_VALUES), rows)]
+    start=pd.Timestamp('2023-07-03 09:00:00')+pd.to_timedelta(rng.integers(0, 60*60*24*60, rows), unit='s')
+    duration=rng.integers(60, 3600, rows)
+    responses={'StartDate': start.strftime('%Y-%m-%d %H:%M:%S'),
+               'EndDate': (start+pd.to_timedelta(duration, unit='s')).strftime('%Y-%m-%d %H:%M:%S'),
+               'Status': 'IP Address', 'IPAddress': '192.168.0.1', 'Progress': progress, 'Duration (in seconds)': duration,
+               'Finished': np.where(progress==100, 'True', 'False'),
+               'RecordedDate': (start+pd.to_timedelta(duration, unit='s')).strftime('%Y-%m-%d %H:%M:%S'),
+               'ResponseId': ['R_%015d' % row for row in range(startrow, startrow+rows)],
+               'RecipientLastName': '', 'RecipientFirstName': '', 'RecipientEmail': '', 'ExternalReference': '',
+               'LocationLatitude': '51.5074', 'LocationLongitude': '-0.1278', 'DistributionChannel': 'anonymous',
+               'UserLanguage': 'EN-GB',
+               questionno: mangle_pids(rng, respondents, malformedrate)}
+    hairtypes=pipeline.load_value_mappings()['mappings']['hair types']['values']
+    haircodes=pd.Series(list(hairtypes), index=['Q'+value.split('_')[0] for value in hairtypes.values()])
+    for question in questions:
+        if not post and question in haircodes.index:
+            options=np.append(haircodes[[question]].to_numpy(dtype=object), '')
+        else:
+            options=ANSWERS
+        answers=options[rng.integers(0, len(options), rows)]
+        #people who gave up part of the way through don't answer the later questions
+        answers[progress<100*(questions.index(question)+1)/len(questions)]=''
+        responses[question]=answers
+    responses=pd.DataFrame(responses)
+    columns=METADATA_COLUMNS+[questionno]+[question for question in questions if question!=questionno]
+    if post:
+        #the Post CN export has an empty column straight after the PID
+        responses['']=''
+        columns=columns[:18]+['']+columns[18:]
+    return responses[columns]
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def write_qualtrics_export(filename, rng, pipeline, pids, rows, post, chunksize=100000, **rates):
+    """
+    Writes a questionnaire export with both header rows, chunksize responses at a time so any size can be made without
+    running out of memory.
+
+    Arguments:
+        filename (str): The file path.
+        rng (np.random.Generator): The random number generator.
+        pipeline (module): pid_completion.pipeline, from load_pipeline.
+        pids (np.ndarray): The PIDs in the data record.
+        rows (int): The number of responses.
+        post (bool): True for the Post CN questionnaire, False for the CN one.
+        chunksize (int): The number of responses made at once.
+        **rates: The malformedrate, duplicaterate and unmatchedrate for make_responses.
+    """
+    names=pipeline.POSTnames if post else pipeline.CNnames
+    with open(filename, 'w', newline='', encoding='utf-8') as file:
+        for startrow in range(0, max(rows, 1), chunksize):
+            chunk=make_responses(rng, pipeline, pids, min(chunksize, rows-startrow), post, startrow, **rates)
+            if startrow==0:
+                writer=csv.writer(file)
+                writer.writerow(chunk.columns)
+                #the second header row has the question text, like the real exports
+                writer.writerow([names.get(column, 'What is your participant ID?' if column in ('Q1', 'Q5') else column) for column in chunk.columns])
+            chunk.to_csv(file, header=False, index=False)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def generate(outputdir, rows, seed=0, responserate=0.9, malformedrate=0.1, duplicaterate=0.02, unmatchedrate=0.05,
+             recordduplicaterate=0.001, chunksize=100000):
+    """
+    Writes a data record and both questionnaire exports to outputdir.
+
+    Arguments:
+        outputdir (str): The folder the files are saved in.
+        rows (int): The number of participants in the data record.
+        seed (int): The random seed, the same seed always makes the same files.
+        responserate (float): The number of responses to each questionnaire as a fraction of rows.
+        malformedrate (float): The fraction of PIDs entered wrong (see mangle_pids).
+        duplicaterate (float): The fraction of responses from someone who already did the questionnaire.
+        unmatchedrate (float): The fraction of responses from PIDs which aren't in the data record.
+        recordduplicaterate (float): The fraction of data record rows with the same PID as another row.
+        chunksize (int): The number of responses made at once.
+
+    Returns:
+        dict: The file paths of the 'datarecord', 'CN' and 'POST' files.
+    """
+    pipeline=load_pipeline()
+    rng=np.random.default_rng(seed)
+    os.makedirs(outputdir, exist_ok=True)
+    datarecord=make_data_record(rng, rows, recordduplicaterate)
+    files={'datarecord': os.path.join(outputdir, DATA_RECORD_FILE), 'CN': os.path.join(outputdir, CN_FILE), 'POST': os.path.join(outputdir, POST_FILE)}
+    datarecord.to_csv(files['datarecord'], index=False)
+    pids=datarecord['Participant ID'].to_numpy()
+    rates={'malformedrate': malformedrate, 'duplicaterate': duplicaterate, 'unmatchedrate': unmatchedrate}
+    responses=int(rows*responserate)
+    write_qualtrics_export(files['CN'], rng, pipeline, pids, responses, False, chunksize, **rates)
+    write_qualtrics_export(files['POST'], rng, pipeline, pids, responses, True, chunksize, **rates)
+    return files
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+if __name__ == '__main__':
+    parser=argparse.ArgumentParser(description='Makes a fake data record and CN/Post CN Qualtrics exports.')
+    parser.add_argument('outputdir')
+    parser.add_argument('--rows', type=int, default=1000, help='participants in the data record')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--response-rate', type=float, default=0.9)
+    parser.add_argument('--malformed-rate', type=float, default=0.1)
+    parser.add_argument('--duplicate-rate', type=float, default=0.02)
+    parser.add_argument('--unmatched-rate', type=float, default=0.05)
+    parser.add_argument('--record-duplicate-rate', type=float, default=0.001)
+    arguments=parser.parse_args()
+    files=generate(arguments.outputdir, arguments.rows, arguments.seed, arguments.response_rate, arguments.malformed_rate,
+                   arguments.duplicate_rate, arguments.unmatched_rate, arguments.record_duplicate_rate)
+    print("\n".join(files.values()))
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+Matches the CitizenNeuroscience (CN) and Post CN questionnaire responses to the data record by participant ID (PID) and
+works out how many participants completed each part.
+
+Everything in pid_completion.pipeline can be used straight from here, e.g.
+
+    import pid_completion
+    FINALdatarecordframe, pidformat_summaryinfo, completiondata_summaryinfo = pid_completion.get_completion_data(
+        filenameDatarecord, filenameCN, pid_completion.CNnames, filenamePOST, pid_completion.POSTnames, outputfile='out.xlsx')
+
+but the pipeline (and pandas with it) is only imported the first time something from it is used, so importing the
+package and running the command line (pid_completion.cli) start straight away. Importing doesn't run anything.
+"""
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+import importlib
+
+__version__='1.0.0'
+
+__all__=['get_completion_data', 'get_batch_completion_data', 'check_inputs', 'correct_format', 'find_add_matches',
+         'completion_data_summary', 'participant_id_format_info', 'new_profile', 'save_profile', 'save_trace',
+         'open_published', 'read_published', 'trend_summary', 'update_trends', 'extend_trends', 'CNnames', 'POSTnames']
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def __getattr__(name):
+    """
+    Gets anything from the pipeline the first time it is asked for, importing the pipeline then.
+
+    Arguments:
+        name (str): The name of the function or constant.
+
+    Returns:
+        The function or constant from pid_completion.pipeline (or check_inputs from pid_completion.validate).
+    """
+    #things like __file__ and __path__ are looked up by Python itself and shouldn't import the pipeline
+    if name.startswith('__'):
+        raise AttributeError("module 'pid_completion' has no attribute " + repr(name))
+    if name=='check_inputs':
+        from .validate import check_inputs
+        return check_inputs
+    #import_module rather than 'from . import pipeline', which would look the name up here again and go round in circles
+    pipeline=importlib.import_module(__name__+'.pipeline')
+    try:
+        return getattr(pipeline, name)
+    except AttributeError:
+        raise AttributeError("module 'pid_completion' has no attribute " + repr(name)) from None
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+"""Lets the command line be run with python -m pid_completion (see pid_completion.cli)."""
+import sys
+
+from .cli import main
+
+#guarded so the process pools don't run the command again when they import this on Windows
+if __name__ == '__main__':
+    sys.exit(main())
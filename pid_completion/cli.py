@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+The command line for the participant completion pipeline.
+
+    pid-completion run "Data Record Sorted Out.csv" "CN Questionnaire Results.csv" "Post CN Questionnaire Results.csv" --output out.xlsx
+    pid-completion check "Data Record Sorted Out.csv" "CN Questionnaire Results.csv" "Post CN Questionnaire Results.csv"
+    pid-completion batch Cohorts.csv --output-dir results
+    pid-completion watch "S:/Participant Completion" --port 8765
+    pid-completion fetch Surveys.json --output-dir "S:/Participant Completion"
+
+(or python -m pid_completion ...). Only argparse is imported until a command actually needs the pipeline, so --help and
+check start straight away and never import pandas.
+
+Functions [Order]:
+- add_pipeline_options(parser): Adds the options shared by run and batch.
+
+- build_parser(): Makes the argument parser.
+
+- pipeline_options(arguments): Turns the parsed options into arguments for get_completion_data.
+
+- check_command(arguments) / run_command(arguments) / batch_command(arguments) / watch_command(arguments) /
+  fetch_command(arguments): Run each command.
+
+- main(argv): Runs the command line and returns the exit code.
+"""
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+import argparse
+import sys
+import time
+
+from . import __version__
+from .validate import check_inputs
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+#The ways the data record can be saved, see write_outputs (this is repeated here so --help doesn't import the pipeline)
+OUTPUT_FORMATS=['excel', 'xlsx-stream', 'parquet', 'arrow', 'csv']
+#The ways duplicate responses can be picked between, see resolve_duplicates (also repeated for the same reason)
+DUPLICATE_POLICIES=['progress', 'latest', 'finished', 'flag']
+#What the completion trends can be bucketed by, see trend_row_dates
+TREND_DATES=['recorded', 'session']
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def add_pipeline_options(parser):
+    """
+    Adds the options shared by the run and batch commands, which match the arguments of get_completion_data.
+
+    Arguments:
+        parser (argparse.ArgumentParser): The parser for the command.
+    """
+    parser.add_argument('--format', dest='outputformat', choices=OUTPUT_FORMATS, default='excel',
+                        help="how the data record is saved, the summary sheets always go in the Excel file (default: excel)")
+    parser.add_argument('--batch-size', dest='batchsize', type=int, default=100000, help='rows of the data record written at once')
+    parser.add_argument('--columnar', action='store_true', help='keep the data as dataframes, uses a lot less memory')
+    parser.add_argument('--compact', action='store_true', help="store the PIDs and answers as categories (the tasks become True instead of 'Y')")
+    parser.add_argument('--out-of-core', dest='database', action='store_const', const=True,
+                        help='join in an SQLite database next to the output instead of in memory, for data records too big for memory')
+    parser.add_argument('--chunksize', type=int, help='read the questionnaires this many rows at a time')
+    parser.add_argument('--state', dest='statefile', help='only read the responses added since the last run with this state file')
+    parser.add_argument('--cache', dest='cachedir', help='cache the cleaned .csv files in this folder')
+    parser.add_argument('--workers', type=int, default=1, help='input files read at the same time')
+    parser.add_argument('--processes', action='store_true', help='read the input files in processes instead of threads')
+    parser.add_argument('--keep-first', action='store_true', help='keep the first response for a PID instead of the last')
+    parser.add_argument('--value-mappings', dest='valuemappings',
+                        help='a .json file of the answers to change, like the hair type image codes (default: the one in the package)')
+    parser.add_argument('--recover-pids', dest='recoverpids', action='store_true', help='suggest close matches for PIDs not in the data record')
+    parser.add_argument('--max-distance', dest='maxdistance', type=int, default=1, help='the most typos a close match can have')
+    parser.add_argument('--automerge', type=float, help='merge unambiguous close matches with at least this confidence')
+    parser.add_argument('--duplicates', dest='duplicatepolicy', choices=DUPLICATE_POLICIES,
+                        help="which response to use for PIDs entered more than once (the highest progress, latest, a finished one or "
+                             "the last one but with the number of responses added), every one is listed in a 'Duplicate PIDs' sheet")
+    parser.add_argument('--trends', dest='trenddates', choices=TREND_DATES,
+                        help="also count the numbers by the date the responses were recorded or the 'Session Date' in the data record, in a 'Completion Trend' sheet")
+    parser.add_argument('--trend-frequency', dest='trendfrequency', default='W', help="how long each row of the trend covers, e.g. W or M (default: %(default)s)")
+    parser.add_argument('--surveys', help='a .json file of more surveys to merge after the CN and Post CN ones (see load_survey_registry)')
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def build_parser():
+    """
+    Makes the argument parser with the check, run, batch, watch and fetch commands.
+
+    Returns:
+        argparse.ArgumentParser: The parser.
+    """
+    parser=argparse.ArgumentParser(prog='pid-completion', description='Matches the CN and Post CN questionnaires to the data record and works out the completion numbers.')
+    parser.add_argument('--version', action='version', version='%(prog)s ' + __version__)
+    commands=parser.add_subparsers(dest='command', required=True)
+
+    check=commands.add_parser('check', help='check the input files have the right columns without running anything')
+    run=commands.add_parser('run', help='run the pipeline for one data record and pair of questionnaires')
+    for command in [check, run]:
+        command.add_argument('datarecord', help='the data record .csv')
+        command.add_argument('cn', help='the CN questionnaire export .csv')
+        command.add_argument('post', help='the Post CN questionnaire export .csv (read as the Post CN one because it is given third, whatever its name)')
+    run.add_argument('--output', default='Participant Completion Data.xlsx', help='the Excel file to save (default: %(default)s)')
+    add_pipeline_options(run)
+    run.add_argument('--publish', dest='publishdir', help='also publish the tables as memory mapped Arrow files in this folder (see open_published)')
+    run.add_argument('--trends-file', dest='trendsfile', help='with --trends, save the running totals here for trend_summary, or bring the ones already there up to date')
+    run.add_argument('--profile', help='save the time and memory of each stage to this .json or .csv file')
+    run.add_argument('--trace', help='save the stages as a trace file (open it in https://ui.perfetto.dev)')
+
+    batch=commands.add_parser('batch', help='run every cohort in a manifest .csv in a process pool')
+    batch.add_argument('manifest', help="a .csv with 'Cohort', 'Data Record', 'CN', 'POST' and optionally 'Output' columns")
+    batch.add_argument('--output-dir', dest='outputdir', help="where each cohort's files are saved (default: next to the manifest)")
+    batch.add_argument('--jobs', type=int, help='cohorts run at the same time (default: the number of cores)')
+    add_pipeline_options(batch)
+
+    watch=commands.add_parser('watch', help='keep the tables for a folder of input files up to date and serve them over HTTP')
+    watch.add_argument('inputdir', help="the folder with the 'Data Record Sorted Out.csv', 'CN Questionnaire Results.csv' and 'Post CN Questionnaire Results.csv'")
+    watch.add_argument('--host', default='127.0.0.1', help='the address to listen on (default: %(default)s)')
+    watch.add_argument('--port', type=int, default=8765, help='the port to listen on (default: %(default)s)')
+    watch.add_argument('--interval', type=float, default=1.0, help='seconds between looking at the files (default: %(default)s)')
+    watch.add_argument('--chunksize', type=int, default=50000, help='read the questionnaires this many rows at a time')
+    watch.add_argument('--keep-first', action='store_true', help='keep the first response for a PID instead of the last')
+    watch.add_argument('--value-mappings', dest='valuemappings', help='a .json file of the answers to change (default: the one in the package)')
+    watch.add_argument('--publish', dest='publishdir', help='also publish the tables as memory mapped Arrow files in this folder after each update')
+
+    fetch=commands.add_parser('fetch', help='download the questionnaire exports from the Qualtrics export API')
+    fetch.add_argument('config', help="a .json file with the 'baseurl' and the survey ID for each file name, the token comes from QUALTRICS_API_TOKEN")
+    fetch.add_argument('--output-dir', dest='outputdir', default='.', help='where the exports are saved (default: the current folder)')
+    fetch.add_argument('--connections', type=int, default=8, help='the most connections open at once (default: %(default)s)')
+    fetch.add_argument('--retries', type=int, default=5, help='times to try a failed request again (default: %(default)s)')
+    return parser
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def pipeline_options(arguments):
+    """
+    Turns the parsed options into keyword arguments for get_completion_data.
+
+    Arguments:
+        arguments (argparse.Namespace): The parsed command line.
+
+    Returns:
+        dict: The keyword arguments.
+    """
+    return {'overwrite': not arguments.keep_first, 'columnar': arguments.columnar, 'chunksize': arguments.chunksize,
+            'statefile': arguments.statefile, 'cachedir': arguments.cachedir, 'workers': arguments.workers,
+            'processes': arguments.processes, 'recoverpids': arguments.recoverpids, 'maxdistance': arguments.maxdistance,
+            'automerge': arguments.automerge, 'outputformat': arguments.outputformat, 'batchsize': arguments.batchsize,
+            'compact': arguments.compact, 'valuemappings': arguments.valuemappings,
+            'database': arguments.database, 'surveys': arguments.surveys, 'duplicatepolicy': arguments.duplicatepolicy,
+            'trenddates': arguments.trenddates, 'trendfrequency': arguments.trendfrequency}
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def check_command(arguments):
+    """
+    Checks the input files (see check_inputs) and prints any problems.
+
+    Arguments:
+        arguments (argparse.Namespace): The parsed command line.
+
+    Returns:
+        int: 0 if the files look fine, 1 if not.
+    """
+    problems=check_inputs(arguments.datarecord, arguments.cn, arguments.post)
+    for problem in problems:
+        print(problem, file=sys.stderr)
+    if not problems and arguments.command=='check':
+        print("The input files look fine")
+    return 1 if problems else 0
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def run_command(arguments):
+    """
+    Checks the input files and then runs get_completion_data on them.
+
+    Arguments:
+        arguments (argparse.Namespace): The parsed command line.
+
+    Returns:
+        int: 0 if it worked, 1 if the input files have problems.
+    """
+    if check_command(arguments):
+        return 1
+    start=time.perf_counter()
+    #only importing the pipeline (and pandas) now it's actually needed
+    from . import pipeline
+    profile=pipeline.new_profile() if arguments.profile or arguments.trace else None
+    pipeline.get_completion_data(arguments.datarecord, arguments.cn, pipeline.CNnames, arguments.post, pipeline.POSTnames,
+                                 outputfile=arguments.output, profile=profile, publishdir=arguments.publishdir, trendsfile=arguments.trendsfile,
+                                 **pipeline_options(arguments))
+    if profile is not None:
+        pipeline.finish_profile(profile)
+        if arguments.profile:
+            pipeline.save_profile(profile, arguments.profile)
+        if arguments.trace:
+            pipeline.save_trace(profile, arguments.trace)
+    print("\n" + str(time.perf_counter()-start) + " seconds")
+    return 0
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def batch_command(arguments):
+    """
+    Runs every cohort in the manifest (see get_batch_completion_data).
+
+    Arguments:
+        arguments (argparse.Namespace): The parsed command line.
+
+    Returns:
+        int: 0 if every cohort worked, 1 if any failed.
+    """
+    start=time.perf_counter()
+    from . import pipeline
+    pidformat_summaryinfo, completiondata_summaryinfo, cohortsummary=pipeline.get_batch_completion_data(arguments.manifest, arguments.outputdir, arguments.jobs,
+                                                                                                       **pipeline_options(arguments))
+    print("\n" + str(time.perf_counter()-start) + " seconds")
+    return 1 if (cohortsummary['Error']!='').any() else 0
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def watch_command(arguments):
+    """
+    Serves the tables for a folder of input files until stopped with Ctrl+C (see watch_folder).
+
+    Arguments:
+        arguments (argparse.Namespace): The parsed command line.
+
+    Returns:
+        int: 0 once stopped.
+    """
+    from .service import watch_folder
+    watch_folder(arguments.inputdir, arguments.host, arguments.port, arguments.interval, overwrite=not arguments.keep_first,
+                 chunksize=arguments.chunksize, valuemappings=arguments.valuemappings, publishdir=arguments.publishdir)
+    return 0
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def fetch_command(arguments):
+    """
+    Downloads every export in the config into the output folder at the same time (see fetch_exports).
+
+    Arguments:
+        arguments (argparse.Namespace): The parsed command line.
+
+    Returns:
+        int: 0 if they were all downloaded, 1 if not.
+    """
+    start=time.perf_counter()
+    from . import fetch
+    try:
+        config=fetch.load_fetch_config(arguments.config)
+        filenames=fetch.fetch_exports(config['surveys'], config['baseurl'], parse=fetch.export_saver(arguments.outputdir),
+                                      connections=arguments.connections, retries=arguments.retries)
+    except (OSError, ValueError) as error:
+        print(error, file=sys.stderr)
+        return 1
+    for filename in filenames.values():
+        print("Saved " + filename)
+    print("\n" + str(time.perf_counter()-start) + " seconds")
+    return 0
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def main(argv=None):
+    """
+    Runs the command line.
+
+    Arguments:
+        argv (list): The arguments, defaults to the ones the program was run with.
+
+    Returns:
+        int: The exit code.
+    """
+    arguments=build_parser().parse_args(argv)
+    commands={'check': check_command, 'run': run_command, 'batch': batch_command, 'watch': watch_command, 'fetch': fetch_command}
+    return commands[arguments.command](arguments)
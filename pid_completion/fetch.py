@@ -0,0 +1,485 @@
+# -*- coding: utf-8 -*-
+"""
+Downloads the questionnaire exports straight from a Qualtrics style export API, so they don't have to be downloaded by
+hand before each run:
+
+    surveys={'CN': 'SV_abc123', 'POST': 'SV_def456'}
+    results=fetch_exports(surveys, 'https://yourdatacenter.qualtrics.com', token)
+    CNdata, CNdata_correct, CNdata_incorrect=results['CN']
+
+    pid-completion fetch Surveys.json --output-dir "S:/Participant Completion"
+
+Each export goes through the three steps of the export API (start it, wait for it to be ready, download the file), and
+the exports for all the surveys are fetched at the same time with asyncio, so fetching dozens of surveys takes about as
+long as the slowest one. The file is asked for as an uncompressed .csv and its body is handed to the parsing (by default
+read_qualtrics_data) as it arrives, without being saved anywhere first. The parsing runs in a thread and pulls each
+block of the body from the event loop when it needs it, so a slow parse slows the download down rather than the body
+piling up in memory.
+
+Only the standard library is used. The connections to the server are kept open and reused between requests (HTTP/1.1
+keep-alive), with at most `connections` open at once. A request which fails because of the network or a 429/5xx reply
+is tried again after a wait which doubles each time (with some jitter, or as long as the server's Retry-After says).
+The base URL can point anywhere, so everything can be tried out against a stand-in server on this computer (see
+benchmarks/fake_qualtrics.py).
+
+Functions [Order]:
+- load_fetch_config(filename): Reads the base URL and the survey IDs from a .json file.
+
+- new_pool(baseurl, connections, timeout): Makes the pool of connections to the server.
+
+- open_connection(pool) / close_pool(pool): Open a new connection and close the idle ones.
+
+- send_request(pool, method, path, headers, body): Sends a request, reusing an idle connection if there is one.
+
+- body_blocks(reader, headers, timeout): Reads the body of a response a block at a time.
+
+- pooled_request(pool, method, path, headers, body): Makes a request and gives the connection back to the pool after.
+
+- check_status(response, method, path): Raises an error for a reply which isn't a success.
+
+- with_retries(operation, retries, backoff): Runs an operation, trying again with backoff if the network fails.
+
+- request_json(pool, method, path, headers, payload, retries, backoff): Makes a JSON request.
+
+- BodyFile: Lets the parsing read a body which is being downloaded as if it were a file.
+
+- fetch_export(pool, name, surveyid, headers, parse, pollinterval, retries, backoff): Fetches and parses one export.
+
+- fetch_all(surveys, baseurl, token, parse, ...) / fetch_exports(surveys, baseurl, token, parse, ...): Fetch every
+  export at the same time.
+
+- parse_export(name, source) / export_saver(outputdir): The parsing that is done on each export.
+"""
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+import asyncio
+import io
+import json
+import os
+import random
+import ssl
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+#Where the exports of a survey are started, checked on and downloaded (see fetch_export)
+EXPORT_PATH='/API/v3/surveys/{surveyid}/export-responses'
+#The replies worth trying again after a wait, anything else which isn't a success is an error straight away
+RETRY_STATUSES={429, 500, 502, 503, 504}
+#The environment variable the API token is read from when one isn't given
+TOKEN_VARIABLE='QUALTRICS_API_TOKEN'
+#How much of a body is read at a time
+BLOCK_SIZE=1024*1024
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def load_fetch_config(filename):
+    """
+    Reads which surveys to fetch from a .json file like
+
+        {"baseurl": "https://yourdatacenter.qualtrics.com",
+         "surveys": {"CN Questionnaire Results.csv": "SV_abc123", "Post CN Questionnaire Results.csv": "SV_def456"}}
+
+    The name of each survey is the file name its export would have if it were downloaded by hand (see parse_export for
+    how it is parsed). The token isn't kept in the file, it comes from QUALTRICS_API_TOKEN.
+
+    Arguments:
+        filename (str): The .json file.
+
+    Returns:
+        dict: The 'baseurl' and the 'surveys' mapping each name to its survey ID.
+    """
+    with open(filename, encoding='utf-8') as file:
+        config=json.load(file)
+    if not isinstance(config, dict) or not isinstance(config.get('baseurl'), str) or not isinstance(config.get('surveys'), dict):
+        raise ValueError("The fetch config " + filename + " needs a 'baseurl' and a dictionary of 'surveys'")
+    for name, surveyid in config['surveys'].items():
+        if not isinstance(surveyid, str):
+            raise ValueError("The survey ID for " + repr(name) + " in " + filename + " isn't a string")
+    return config
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def new_pool(baseurl, connections=8, timeout=60):
+    """
+    Makes the pool of connections to the server. Nothing is opened until the first request. This has to be called from
+    inside the event loop the requests are made in.
+
+    Arguments:
+        baseurl (str): The address of the server, e.g. 'https://yourdatacenter.qualtrics.com' or 'http://127.0.0.1:8766'.
+        connections (int): The most connections open at once.
+        timeout (float): The seconds to wait for the server before giving up on a request.
+
+    Returns:
+        dict: The pool, with the 'host', 'port', 'ssl' context, 'prefix' for every path, the 'idle' connections, the
+        'limit' on open connections and the number of connections 'opened' so far.
+    """
+    url=urlsplit(baseurl)
+    if url.scheme not in ('http', 'https'):
+        raise ValueError("The base URL " + baseurl + " needs to start with http:// or https://")
+    return {'host': url.hostname, 'port': url.port or (443 if url.scheme=='https' else 80),
+            'ssl': ssl.create_default_context() if url.scheme=='https' else None, 'prefix': url.path.rstrip('/'),
+            'timeout': timeout, 'idle': [], 'limit': asyncio.Semaphore(connections), 'opened': 0}
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+async def open_connection(pool):
+    """
+    Opens a new connection to the server.
+
+    Arguments:
+        pool (dict): The pool from new_pool.
+
+    Returns:
+        tuple: The (reader, writer) streams.
+    """
+    connection=await asyncio.wait_for(asyncio.open_connection(pool['host'], pool['port'], ssl=pool['ssl']), pool['timeout'])
+    pool['opened']+=1
+    return connection
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def close_pool(pool):
+    """
+    Closes the idle connections in the pool.
+
+    Arguments:
+        pool (dict): The pool from new_pool.
+    """
+    while pool['idle']:
+        pool['idle'].pop()[1].close()
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+async def send_request(pool, method, path, headers=None, body=b''):
+    """
+    Sends a request and reads the status line and headers of the reply. An idle connection is reused if there is one,
+    and if the server turns out to have closed it in the meantime the request is sent again on a new connection.
+
+    Arguments:
+        pool (dict): The pool from new_pool.
+        method (str): 'GET' or 'POST'.
+        path (str): The path, after the pool's prefix.
+        headers (dict): Any headers to send as well.
+        body (bytes): The body to send.
+
+    Returns:
+        tuple: A tuple containing three elements:
+            - connection (tuple): The (reader, writer) streams, with the body of the reply still to be read.
+            - status (int): The status code of the reply.
+            - responseheaders (dict): The headers of the reply, with lowercase names.
+    """
+    lines=[method + ' ' + pool['prefix'] + path + ' HTTP/1.1', 'Host: ' + pool['host'] + ':' + str(pool['port']),
+           'Content-Length: ' + str(len(body)), 'Connection: keep-alive']
+    lines+=[name + ': ' + value for name, value in (headers or {}).items()]
+    request=('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+    while True:
+        reused=bool(pool['idle'])
+        reader, writer=pool['idle'].pop() if reused else await open_connection(pool)
+        try:
+            writer.write(request)
+            await writer.drain()
+            statusline=await asyncio.wait_for(reader.readline(), pool['timeout'])
+            if not statusline:
+                raise ConnectionResetError("The server closed the connection")
+            responseheaders={}
+            while True:
+                line=await asyncio.wait_for(reader.readline(), pool['timeout'])
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value=line.decode('latin-1').partition(':')
+                responseheaders[name.strip().lower()]=value.strip()
+            return (reader, writer), int(statusline.split()[1]), responseheaders
+        except (ConnectionError, asyncio.IncompleteReadError):
+            writer.close()
+            #an idle connection the server has already closed isn't a real failure, so it is tried again straight away
+            if not reused:
+                raise
+        except BaseException:
+            writer.close()
+            raise
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+async def body_blocks(reader, headers, timeout=60):
+    """
+    Reads the body of a reply a block at a time, whether the server says how long it is or sends it in chunks.
+
+    Arguments:
+        reader (asyncio.StreamReader): The connection the reply is coming in on.
+        headers (dict): The headers of the reply.
+        timeout (float): The seconds to wait for each block.
+
+    Returns:
+        async generator: Yields each block of the body as bytes.
+    """
+    if headers.get('transfer-encoding', '').lower()=='chunked':
+        while True:
+            size=int((await asyncio.wait_for(reader.readline(), timeout)).split(b';')[0], 16)
+            if size==0:
+                #skipping any trailers after the last chunk
+                while (await asyncio.wait_for(reader.readline(), timeout)) not in (b'\r\n', b'\n', b''):
+                    pass
+                return
+            yield await asyncio.wait_for(reader.readexactly(size), timeout)
+            await asyncio.wait_for(reader.readexactly(2), timeout)
+    elif 'content-length' in headers:
+        remaining=int(headers['content-length'])
+        while remaining:
+            block=await asyncio.wait_for(reader.read(min(BLOCK_SIZE, remaining)), timeout)
+            if not block:
+                raise asyncio.IncompleteReadError(b'', remaining)
+            remaining-=len(block)
+            yield block
+    else:
+        #no length means the body goes on until the server closes the connection
+        while True:
+            block=await asyncio.wait_for(reader.read(BLOCK_SIZE), timeout)
+            if not block:
+                return
+            yield block
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+@asynccontextmanager
+async def pooled_request(pool, method, path, headers=None, body=b''):
+    """
+    Makes a request, waiting for a free connection if the pool's limit has been reached. Once the block using the reply
+    has finished the connection goes back to the pool if the whole body was read, otherwise it is closed.
+
+        async with pooled_request(pool, 'GET', path) as response:
+            async for block in response['body']: ...
+
+    Arguments:
+        pool (dict): The pool from new_pool.
+        method, path, headers, body: The same as for send_request.
+
+    Returns:
+        async context manager: Gives the reply as a dictionary with its 'status', 'headers' and 'body' (see
+        body_blocks).
+    """
+    async with pool['limit']:
+        (reader, writer), status, responseheaders=await send_request(pool, method, path, headers, body)
+        response={'status': status, 'headers': responseheaders, 'finished': False}
+        async def body():
+            async for block in body_blocks(reader, responseheaders, pool['timeout']):
+                yield block
+            response['finished']=True
+        response['body']=body()
+        try:
+            yield response
+        finally:
+            await response['body'].aclose()
+            #a body without a length ends by closing the connection, so only the others can be reused
+            keepalive=responseheaders.get('connection', '').lower()!='close' and \
+                ('content-length' in responseheaders or responseheaders.get('transfer-encoding', '').lower()=='chunked')
+            if response['finished'] and keepalive and not reader.at_eof():
+                pool['idle'].append((reader, writer))
+            else:
+                writer.close()
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def check_status(response, method, path):
+    """
+    Raises an error if a reply isn't a success. A reply worth trying again (RETRY_STATUSES) raises a ConnectionError
+    so with_retries tries again, with how long the server asked to wait in its 'retryafter'.
+
+    Arguments:
+        response (dict): The reply from pooled_request.
+        method (str): The method of the request, for the error message.
+        path (str): The path of the request, for the error message.
+    """
+    status=response['status']
+    if 200<=status<300:
+        return
+    message=method + ' ' + path + ' got HTTP ' + str(status)
+    if status in RETRY_STATUSES:
+        error=ConnectionError(message)
+        try:
+            error.retryafter=float(response['headers'].get('retry-after', ''))
+        except ValueError:
+            error.retryafter=None
+        raise error
+    raise ValueError(message)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+async def with_retries(operation, retries=5, backoff=0.5):
+    """
+    Runs an operation, and if it fails because of the network (or a reply worth trying again, see check_status) waits
+    and runs it again. The waits double each time, with some jitter so surveys which failed together don't all try
+    again at the same moment.
+
+    Arguments:
+        operation (function): An async function with no arguments.
+        retries (int): The most times to try again.
+        backoff (float): The seconds to wait before the first retry.
+
+    Returns:
+        Whatever the operation returns.
+    """
+    for attempt in range(retries+1):
+        try:
+            return await operation()
+        except (OSError, EOFError, asyncio.TimeoutError) as error:
+            if attempt==retries:
+                raise
+            delay=getattr(error, 'retryafter', None) or backoff*2**attempt*random.uniform(0.5, 1.5)
+            await asyncio.sleep(delay)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+async def request_json(pool, method, path, headers, payload=None, retries=5, backoff=0.5):
+    """
+    Makes a request with a JSON body (or none) and reads the JSON reply, trying again if it fails (see with_retries).
+
+    Arguments:
+        pool (dict): The pool from new_pool.
+        method (str): 'GET' or 'POST'.
+        path (str): The path, after the pool's prefix.
+        headers (dict): The headers to send (the API token).
+        payload (dict): The JSON to send, or None.
+        retries (int) / backoff (float): The same as for with_retries.
+
+    Returns:
+        dict: The JSON reply.
+    """
+    body=b'' if payload is None else json.dumps(payload).encode('utf-8')
+    headers=dict(headers, **({'Content-Type': 'application/json'} if payload is not None else {}))
+    async def operation():
+        async with pooled_request(pool, method, path, headers, body) as response:
+            check_status(response, method, path)
+            return json.loads(b''.join([block async for block in response['body']]))
+    return await with_retries(operation, retries, backoff)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+class BodyFile(io.RawIOBase):
+    """
+    Lets the parsing, which runs in a thread, read a body which is still being downloaded as if it were a file. Each
+    time it runs out it asks the event loop for the next block, so nothing is read before the parsing needs it. Any
+    error downloading is raised in the parsing.
+    """
+    def __init__(self, body, loop):
+        self.body, self.loop, self.block = body, loop, b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self.block:
+            try:
+                self.block=asyncio.run_coroutine_threadsafe(self.body.__anext__(), self.loop).result()
+            except StopAsyncIteration:
+                return 0
+        size=min(len(buffer), len(self.block))
+        buffer[:size]=self.block[:size]
+        self.block=self.block[size:]
+        return size
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+async def fetch_export(pool, name, surveyid, headers, parse, pollinterval=1.0, retries=5, backoff=0.5):
+    """
+    Starts an export of a survey's responses, waits for it to be ready and downloads it, handing the body to parse as
+    it arrives. If the download fails part way through it is started again from the beginning, parse and all.
+
+    Arguments:
+        pool (dict): The pool from new_pool.
+        name (str): The name of the survey, e.g. 'CN Questionnaire Results.csv'.
+        surveyid (str): The ID of the survey.
+        headers (dict): The headers to send (the API token).
+        parse (function): Called in a thread as parse(name, source), where source is the body as a file.
+        pollinterval (float): The seconds between checking whether the export is ready.
+        retries (int) / backoff (float): The same as for with_retries.
+
+    Returns:
+        Whatever parse returns.
+    """
+    exportpath=EXPORT_PATH.format(surveyid=surveyid)
+    #compress=False so the file comes as a plain .csv, which can be parsed as it arrives (a .zip can't be read until it has all arrived)
+    started=await request_json(pool, 'POST', exportpath, headers, {'format': 'csv', 'compress': False}, retries, backoff)
+    progressid=started['result']['progressId']
+    while True:
+        progress=(await request_json(pool, 'GET', exportpath + '/' + progressid, headers, None, retries, backoff))['result']
+        if progress['status']=='complete':
+            break
+        if progress['status']=='failed':
+            raise ValueError("The export of " + name + " (" + surveyid + ") failed")
+        await asyncio.sleep(pollinterval)
+    filepath=exportpath + '/' + progress['fileId'] + '/file'
+    loop=asyncio.get_running_loop()
+    async def operation():
+        async with pooled_request(pool, 'GET', filepath, headers) as response:
+            check_status(response, 'GET', filepath)
+            source=io.BufferedReader(BodyFile(response['body'], loop), BLOCK_SIZE)
+            return await loop.run_in_executor(None, parse, name, source)
+    return await with_retries(operation, retries, backoff)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+async def fetch_all(surveys, baseurl, token, parse, connections=8, pollinterval=1.0, retries=5, backoff=0.5, timeout=60):
+    """
+    Fetches every export at the same time, sharing one pool of connections.
+
+    Arguments:
+        surveys (dict): The survey ID for each name (see load_fetch_config).
+        baseurl (str): The address of the server.
+        token (str): The API token.
+        parse (function): Called on each export as parse(name, source), see fetch_export.
+        connections (int): The most connections open at once.
+        pollinterval (float): The seconds between checking whether an export is ready.
+        retries (int) / backoff (float): The same as for with_retries.
+        timeout (float): The seconds to wait for the server before giving up on a request.
+
+    Returns:
+        dict: What parse returned for each name.
+    """
+    pool=new_pool(baseurl, connections, timeout)
+    headers={'X-API-TOKEN': token}
+    try:
+        results=await asyncio.gather(*[fetch_export(pool, name, surveyid, headers, parse, pollinterval, retries, backoff)
+                                       for name, surveyid in surveys.items()])
+    finally:
+        close_pool(pool)
+    return dict(zip(surveys, results))
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def parse_export(name, source):
+    """
+    The parsing done on each export unless another is given, the same as reading a downloaded file with
+    read_qualtrics_data.
+
+    Arguments:
+        name (str): The name of the survey in the config, either the file name its export has in the folder (see
+            pid_completion.service.INPUT_FILES, e.g. 'Post CN Questionnaire Results.csv') or its name in
+            SURVEY_REGISTRY (e.g. 'POST'), which says which question has the PID.
+        source (file-like): The body of the export.
+
+    Returns:
+        tuple: The same as read_qualtrics_data.
+
+    Raises:
+        ValueError: If the name is neither.
+    """
+    #only importing the pipeline (and pandas) here so the fetching can be used without it
+    from .pipeline import SURVEY_REGISTRY, read_qualtrics_data
+    from .service import INPUT_FILES
+    filenames={filename: survey for survey, filename in INPUT_FILES.items() if survey in SURVEY_REGISTRY}
+    if name not in filenames and name not in SURVEY_REGISTRY:
+        raise ValueError("Don't know which survey " + repr(name) + " is, it has to be one of " + ", ".join(map(repr, [*filenames, *SURVEY_REGISTRY])))
+    return read_qualtrics_data(name, source=source, survey=filenames.get(name, name))
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def export_saver(outputdir):
+    """
+    Makes a parse function which saves each export into a folder under its name instead of parsing it, e.g. for the
+    watch service (see pid_completion.service). Each file is written under a temporary name and renamed once it is
+    all there, so nothing reading the folder sees half an export.
+
+    Arguments:
+        outputdir (str): The folder to save the exports in.
+
+    Returns:
+        function: The parse function, which returns the file path each export was saved to.
+    """
+    def save(name, source):
+        filename=os.path.join(outputdir, name)
+        with open(filename+'.part', 'wb') as file:
+            for block in iter(lambda: source.read(BLOCK_SIZE), b''):
+                file.write(block)
+        os.replace(filename+'.part', filename)
+        return filename
+    os.makedirs(outputdir, exist_ok=True)
+    return save
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def fetch_exports(surveys, baseurl, token=None, parse=None, connections=8, pollinterval=1.0, retries=5, backoff=0.5, timeout=60):
+    """
+    Fetches every export at the same time and parses each one as it arrives (see fetch_all).
+
+    Arguments:
+        surveys (dict): The survey ID for each name (see load_fetch_config), which for parse_export is its file name
+            or its name in SURVEY_REGISTRY.
+        baseurl (str): The address of the server.
+        token (str): The API token, read from QUALTRICS_API_TOKEN if not given.
+        parse (function): Called on each export as parse(name, source), defaults to parse_export.
+        connections, pollinterval, retries, backoff, timeout: The same as for fetch_all.
+
+    Returns:
+        dict: What parse returned for each name.
+    """
+    token=token or os.environ.get(TOKEN_VARIABLE)
+    if not token:
+        raise ValueError("No API token was given and " + TOKEN_VARIABLE + " isn't set")
+    return asyncio.run(fetch_all(surveys, baseurl, token, parse or parse_export, connections, pollinterval, retries, backoff, timeout))
@@ -0,0 +1,3876 @@
+# -*- coding: utf-8 -*-
+"""
+This module processes data from CitizenNeuroscience (CN) and PostCitizenNeuroscience (POST) questionnaires.
+It includes functions to read and filter questionnaire data, find matching Participant IDs (PIDs) in the data record,
+and generate summary information about the completion data and PID formats.
+
+Functions [Order]:
+- correct_format(pid): Checks if a string is alphanumeric and of length 6 to 7 characters, representing a valid PID.
+
+- filter_qualtrics(qualtricsdata): Filters out entries with invalid or missing PIDs from the questionnaire data, using
+  classify_pids and count_pid_classes.
+
+- classify_pids(pids): Sorts every PID into valid, NaN, whitespace-padded, non-alphanumeric or wrong length in one go.
+
+- count_pid_classes(pidclasses, number_of_rows): Counts the PIDs in each class and stops if any rows have been lost.
+
+- filter_qualtrics_frame(qualtricsdataframe): The same as filter_qualtrics but for a dataframe, using classify_pids.
+
+- file_content_hash(filename, cachedir) / save_cached_frame(dataframe, cachefile) / evict_cache(cachedir, maxbytes):
+  Look after the cache of cleaned .csv files.
+
+- read_cached(reader, filename, cachedir, names, maxbytes): Loads a cleaned .csv file from the cache if it has been read
+  before, otherwise reads it and adds it to the cache.
+
+- read_qualtrics_data(filenameQualtrics, cachedir, names, profile, source): Reads the .csv file containing the questionnaire data and sets data types
+  and formats. Calls filter_qualtrics to filter out invalid PIDs and returns three sets of questionnaire data:
+  original, data with correct PIDs, and data with incorrect PIDs.
+
+- qualtrics_columns(filenameQualtrics, survey) / tidy_qualtrics_frame(qualtricsdataframeraw, questionno, renames): Work out
+  and apply the column names and data types for either questionnaire.
+
+- read_qualtrics_chunks(filenameQualtrics, chunksize): Reads the questionnaire data a chunk at a time.
+
+- read_qualtrics_frame(filenameQualtrics, source) / read_data_record_frame(filenameDatarecord): The same as read_qualtrics_data
+  and read_data_record but keep the data as a dataframe.
+
+- tidy_data_record_frame(datarecordframe): Sets the data types of the data record and makes the PIDs uppercase.
+
+- read_data_record(filenameDatarecord, cachedir): Reads the .csv file containing the data record and sets data types and formats.
+  Returns the data record as a dictionary and a series of PIDs from the data record.
+
+- matches(datarecordpids, pid): Checks if a PID from the survey data appears in the data record.
+
+- build_pid_index(datarecordpids): Builds a lookup from each PID in the data record to its row, and lists any PIDs
+  which appear more than once in the data record.
+
+- join_qualtrics(datarecord, pidindex, qualtricsdata, overwrite): Updates the data record with matching data from the
+  questionnaire data using the PID lookup, and reports the unmatched and duplicate PIDs.
+
+- match_qualtrics_frame(pidindex, qualtricsdataframe, overwrite) / add_matches_frame(datarecordframe, matcheddata): Find
+  the data record row for each questionnaire entry and write the matched entries into the data record.
+
+- lookup_rows(pids, pidindex): Finds the data record row for each PID, using the category codes if there are any.
+
+- join_qualtrics_frame(datarecordframe, pidindex, qualtricsdataframe, overwrite): The same as join_qualtrics but for
+  dataframes, adding whole columns at once.
+
+- stream_qualtrics(filenameQualtrics, pidindex, overwrite, chunksize): Checks and matches the questionnaire data one
+  chunk at a time.
+
+- collapse_duplicate_columns(dataframe): Merges columns which have the same name after renaming.
+
+- policy_columns(entries) / resolve_duplicates(entries, rows, duplicatepolicy, overwrite): Pick one entry for each
+  participant who responded more than once, all at once.
+
+- conflict_report(entries, rows, keep) / flag_duplicates(matcheddata, rows): List the responses of participants who
+  responded more than once and say how many there were in the data record.
+
+- combine_matches(matcheddata, newmatches, overwrite, duplicatepolicy): Adds newly matched entries to the ones matched so far.
+
+- overlay_matches(current, matched, matchedrows): Writes a survey's matched values over a column of the data record.
+
+- plan_survey_columns(columns, surveycolumns) / merge_surveys_frame(datarecordframe, surveymatches): Work out where
+  each final column comes from and merge any number of surveys onto the data record in one go.
+
+- build_final_frame(datarecordframe, CNmatches, CNnames, POSTmatches, POSTnames): Writes the matched entries into the
+  data record and renames the columns.
+
+- load_survey_registry(filename): Reads the extra surveys to merge after the CN and POST ones.
+
+- survey_match_report(surveys, results): Makes the table of how many of each survey's responses matched.
+
+- print_join_report(name, joinreport, duplicate_pids): Prints a summary of the matched, unmatched and duplicate PIDs.
+
+- find_add_matches(datarecord, datarecordpids, qualtricsdata): Updates the data record with matching data from the
+  questionnaire data based on the common PIDs.
+
+- normalise_pid(pid) / pid_deletions(pid, maxdistance) / pid_distance(pid, candidate): Tidy up PIDs and count the
+  typos between them.
+
+- build_recovery_index(datarecordpids, maxdistance): Indexes the data record PIDs so close matches can be looked up.
+
+- recover_pids(pids, recoveryindex): Suggests the data record PID that was meant for each unmatched PID.
+
+- recover_pid_frame(qualtricsdataframe, pidindex, recoveryindex, automerge): Suggests (and optionally merges) close
+  matches for the questionnaire PIDs which aren't in the data record.
+
+- participant_id_numbers(data_correct, data_incorrect): Calculates statistics about correct and incorrect PIDs,
+  including the total number of incorrect PIDs, total number of correct PIDs, and the percentage of incorrect PIDs.
+
+- participant_id_format_info(CNdata_correct, CNdata_incorrect, POSTdata_correct, POSTdata_incorrect): Generates a
+  DataFrame summarizing participant ID format information for both CN and POST datasets, including the number of
+  correct and incorrect PIDs and the percentage of incorrect PIDs.
+
+- pid_format_table(surveycounts): The same table for any number of surveys.
+
+- compact_frame(dataframe, categoryratio): Stores the data as categories, nullable integers and booleans instead of
+  Python objects.
+
+- load_value_mappings(filename) / compile_value_mappings(valuemappings, CNnames, POSTnames, surveynames) /
+  apply_value_mappings(dataframe, compiledmappings): Read the answers to change (e.g. the hair type codes), turn them into
+  a lookup table for each column and change them in only those columns.
+
+- completion_categories(names, plural, neither): Works out the row or column labels of the completion table.
+
+- encode_completion(FINALdatarecordframe, tasks, surveys, threshold): Gives each row of the data record one number for
+  the tasks and surveys it has completed.
+
+- completion_table(codes, tasks, surveys, weights): Counts the numbers from encode_completion into the completion table.
+
+- completion_data_summary(FINALdatarecordframe, tasks, surveys, threshold): Generates a summary table of completion data based on the data record
+  DataFrame, showing the number of completed tasks (RS and Audio) for both questionnaires (CN and POST).
+
+- new_prefix_sums(width) / add_prefix_counts(prefixsums, dates, columns, weights) / prefix_counts_between(prefixsums,
+  start, end): Keep running totals by day so the counts for any range of days take one subtraction.
+
+- trend_row_dates(FINALdatarecordframe, trenddates, matcheddates): Gets the date each row of the data record is counted on.
+
+- build_trends(trenddates, codes, rowdates, responses, tasks, surveys) / update_trends(trends, codes, rowdates, ...): Count
+  the completion categories and PID format numbers by day, and add new days on the end.
+
+- extend_trends(trends, trenddates, codes, rowdates, responses, tasks, surveys): Brings saved trends up to date with
+  only the rows and responses which are new or have changed since they were saved.
+
+- trend_summary(trends, start, end) / completion_trend(trends, frequency): Make the tables for a range of days, or a row
+  for each week (or month etc.).
+
+- new_profile(tracememory) / start_stage(profile, name, rowsin, detail) / end_stage(profile, record, rowsout) /
+  profile_stage(...) / profiled(...) / submit_stage(...): Record the wall time, CPU time, peak memory and rows in and
+  out of each stage of the pipeline.
+
+- max_rss_bytes() / count_rows(result): Get the most memory the process has used and the number of rows a stage made.
+
+- profile_frame(profile) / finish_profile(profile) / save_profile(profile, filename) / save_trace(profile, filename):
+  Turn the recorded stages into a table and save them as .json, .csv or a trace file.
+
+- input_pool(workers, processes): Makes the thread or process pool the input files are read in.
+
+- read_survey_frame(filenameQualtrics, cachedir, names): Reads, cleans and checks the PIDs of one questionnaire.
+
+- read_and_match_surveys(filenameDatarecord, surveys, overwrite, cachedir, workers, processes): Reads all the input files
+  at the same time and matches each questionnaire as soon as it and the data record are ready.
+
+- file_signature(filename) / scan_survey(...) / read_appended_rows(...) / update_survey_state(...): Keep track of how
+  much of each questionnaire export has been read so that only new responses are read on the next run.
+
+- refresh_completion_state(state, filenameDatarecord, filenameCN, CNnames, filenamePOST, POSTnames, overwrite,
+  chunksize, valuemappings): Adds the new responses to the state in memory and only reworks the rows they change.
+
+- update_completion_state(statefile, filenameDatarecord, filenameCN, CNnames, filenamePOST, POSTnames, overwrite,
+  chunksize, valuemappings): Loads the saved state, adds the new responses and only reworks the rows they change.
+
+- arrow_schema(dataframe) / frame_columns(dataframe) / arrow_batches(dataframe, schema, textcolumns, batchsize): Turn
+  a dataframe into Arrow batches a few rows at a time.
+
+- write_parquet(...) / write_arrow(...) / write_csv_parts(...) / clear_csv_parts(dirname) / write_xlsx_stream(...) /
+  write_sheet_rows(...) / append_sheet_rows(...): Save the data record in batches as Parquet, Arrow IPC, a folder of
+  .csv files or a constant memory Excel file.
+
+- write_outputs(FINALdatarecordframe, sheets, outputfile, outputformat, batchsize): Saves the data record in the chosen
+  format and the summary sheets in Excel.
+
+- publish_outputs(FINALdatarecordframe, sheets, publishdir, keep): Publishes the data record and summary tables as
+  memory mapped Arrow files, swapping the new version in all at once.
+
+- sqlite_name(position) / combine_dtypes(dtype, otherdtype) / append_sqlite_chunk(...): Load files into an SQLite
+  database a chunk at a time.
+
+- load_data_record_sqlite(...) / load_survey_sqlite(...): Load the data record and a questionnaire into the database
+  and match the PIDs with indexed queries.
+
+- sqlite_final_columns(...) / sqlite_expression(sources): Work out which table and column each final column comes from.
+
+- sqlite_completion_table(connection, sources, tasks, surveys, threshold) / sqlite_final_batches(...) /
+  write_output_batches(...): Make the completion table with a query and save the final data record a batch at a time.
+
+- sqlite_completion_data(database, ...): Does the same as get_completion_data out of memory in an SQLite database.
+
+- get_completion_data(filenameDatarecord, filenameCN, CNnames, filenamePOST, POSTnames, overwrite, columnar, chunksize, statefile, cachedir, workers,
+  processes, recoverpids, maxdistance, automerge, outputfile, outputformat, batchsize, profile, compact, valuemappings, database, publishdir, surveys, duplicatepolicy, trenddates, trendfrequency,
+  trendsfile): Processes and merges data from
+  the CN and POST questionnaires with the data record, renames columns, handles hair type values, and calculates summary
+  information about participant ID formats and completion data.
+
+- published_version(publishdir) / open_published(publishdir) / read_published(publishdir, name, columns): Memory map
+  or read the tables published by get_completion_data for other programs.
+
+- read_manifest(filenameManifest, outputdir): Reads the list of cohorts (e.g. schools, waves or terms) to run in one go.
+
+- run_cohort(cohort, filenameDatarecord, filenameCN, filenamePOST, outputfile, options): Runs get_completion_data for
+  one cohort and returns just the summary tables.
+
+- combine_pid_format_info(summaries) / combine_completion_tables(tables): Add the summary tables of several cohorts up.
+
+- get_batch_completion_data(filenameManifest, outputdir, workers, **options): Runs every cohort in the manifest in a
+  process pool and saves the combined summary tables.
+
+Author: Layla Abbott
+
+Date: [06/08/2023]
+"""
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import tracemalloc
+import numpy as np
+import pandas as pd 
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import ExitStack, contextmanager
+from itertools import combinations, compress
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+POSTnames={
+'Q2': 'Have you heard of EEG before today?',
+'Q3': 'How would you describe what EEG is and how it works?',
+'Q5': 'Do you think measuring brain waves is important for understanding how the brain works?',
+'Q6': "The systems capabilities meet my requirements",
+'Q7': 'The system is easy to use',
+'Q8': 'Were the instructions for the EEG session clear and easy to follow?',
+'Q9': 'How comfortable did you find the EEG headset during the session?',
+'Q10': 'Rate your agreement: I have a better understanding of brain activity after participating in this EEG session',
+'Q11': 'What questions or concerns do you have about the use of EEG in research, commercial, or medical settings?',
+'Q12': 'In your opinion, what are some of the most exciting potential applications of EEG in the future?'}
+
+CNnames= {
+'Q2' : 'Consent',
+'Q3' : 'First Name',	
+'Q4' : 'Last Name',		
+'Q6' : 'What best describes your ethnic origin?',
+'Q7' : 'Date of Birth (dd/mm/yyyy)'	,
+'Q8' : 'Gender'	,
+'Q9_1' : 'Handedness - Writing',
+'Q9_2' : 'Handedness - Drawing',
+'Q9_3': 'Handedness - Throwing',
+'Q9_4': 'Handedness - Scissors',
+'Q9_5': 'Handedness - Toothbrush',
+'Q9_6': 'Handedness - Knife (without fork)',
+'Q9_7' : 'Handedness - Spoon',
+'Q9_8' : 'Handedness - Broom (upper hand)',
+'Q9_9' : 'Handedness - Striking a match (match)',
+'Q9_10' : 'Handedness - Opening a box (lid)',
+'Q12_4' : 'MacArthur SES Family - Mark the rung that best represents where your family would be on this ladder',
+'Q15_4' :'Mark the rung that best represents where you would be on this ladder.',
+'Q16_1': "A persons family is the most important thing in life.",
+'Q16_2': 'Even if something bad is about to happen to me, I rarely experience fear or nervousness.',
+'Q16_3': 'I go out of my way to get things I want.',
+'Q16_4': "When I’m doing well at something I love to keep at it.",
+'Q16_5': 'Im always willing to try something new if I think it will be fun.',
+'Q16_6': 'How I dress is important to me.',
+'Q16_7': 'When I get something I want, I feel excited and energized.',
+'Q16_8': 'Criticism or scolding hurts me quite a bit.',
+'Q16_9': 'When I want something, I usually go all-out to get it.',
+'Q16_10': 'I will often do things for no other reason than that they might be fun.',
+'Q16_11': "It's hard for me to find the time to do things such as get a haircut.",
+'Q16_12': 'If I see a chance to get something I want, I move on it right away.',
+'Q16_13': 'I feel pretty worried or upset when I think or know somebody is angry at me.',
+'Q16_14': 'When I see an opportunity for something I like, I get excited right away.',
+'Q16_15': 'I often act on the spur of the moment.',
+'Q16_16': 'If I think something unpleasant is going to happen, I usually get pretty "worked up".',
+'Q16_17': 'I often wonder why people act the way they do.',
+'Q16_18': 'When good things happen to me, it affects me strongly.',
+'Q16_19': 'I feel worried when I think I have done poorly at something important.',
+'Q16_20': 'I crave excitement and new sensations.',
+'Q16_21': 'When I go after something, I use a "no holds barred" approach.',
+'Q16_22': 'I have very few fears compared to my friends.',
+'Q16_23': 'It would excite me to win a contest.',
+'Q16_24': 'I worry about making mistakes.',
+'Q17_1': 'I see myself as someone who... - Worries a lot',
+'Q17_2': 'Gets nervous easily',
+'Q17_3': 'Remains calm in tense situations',
+'Q17_4': 'Is talkative',
+'Q17_5': 'Is outgoing, sociable',
+'Q17_6': 'Is reserved',
+'Q17_7': 'Is original, comes up with new ideas',
+'Q17_8': 'Values artistic, aesthetic experiences',
+'Q17_9': 'Has an active imagination',
+'Q17_10': 'Is sometimes rude to others',
+'Q17_11': 'Has a forgiving nature',
+'Q17_12': 'Is considerate and kind to almost anyone',
+'Q17_13': 'Does a thorough job',
+'Q17_14': 'Tends to be lazy',
+'Q17_15': 'Does things efficiently',
+'Q18_1': 'I feel calm.',
+'Q18_2': 'I feel secure.',
+'Q18_3': 'I feel tense.',
+'Q18_4': 'I feel strained.',
+'Q18_5': 'I feel at ease.',
+'Q18_6': 'I feel upset.',
+'Q18_7': 'I am presently worrying over possible misfortunes.',
+'Q18_8': 'I feel satisfied.',
+'Q18_9': 'I feel frightened.',
+'Q18_10': 'I feel comfortable.',
+'Q18_11': 'I feel self-confident.',
+'Q18_12': 'I feel nervous.',
+'Q18_13': 'I am jittery.',
+'Q18_14': 'I feel indecisive.',
+'Q18_15': 'I am relaxed.',
+'Q18_16': 'I feel content.',
+'Q18_17': 'I am worried.',
+'Q18_18': 'I feel confused.',
+'Q18_19': 'I feel steady.',
+'Q18_20': 'I feel pleasant.',
+'Q19_1': 'I have disturbing thoughts.',
+'Q19_2': 'I lack self-confidence.',
+'Q19_3': 'I feel secure.',
+'Q19_4': 'I make decisions easily.',
+'Q19_5': 'I feel inadequate.',
+'Q19_6': 'I am content.',
+'Q19_7': 'Some unimportant thought runs through my mind and bothers me.',
+'Q19_8': 'I take disappointments so keenly that I can’t put them out of my mind.',
+'Q19_9': 'I am a steady person.',
+'Q19_10': 'I get in a state of tension or turmoil as I think over my recent concerns and interests.',
+'Q19_11': 'I feel pleasant.',
+'Q19_12': 'I have disturbing thoughts.',
+'Q19_13': 'I lack self-confidence.',
+'Q19_14': 'I feel secure.',
+'Q19_15': 'I make decisions easily.',
+'Q19_16': 'I feel inadequate.',
+'Q19_17': 'I am content.',
+'Q19_18': 'Some unimportant thought runs through my mind and bothers me.',
+'Q19_19': 'I take disappointments so keenly that I can’t put them out of my mind.',
+'Q19_20': 'I am a steady person.',
+'Q21' : 'TYPE 1 Straight hair: fine and fragile to coarse and thin (curl resistant)',
+'Q22'	: 'TYPE 2 Wavy hair: fine and thin to coarse and frizzy',
+'Q23'	: 'TYPE 3 Curly hair: loose curls to corkscrew curls',
+'Q24'	: 'TYPE 4 Kinky hair: tight coils to z-angled coils',
+'Q25'	: 'On a scale of 1 through 9 indicate how sleepy you are feeling',
+'Q26_1': 'I try to be nice to other people. I care about their feelings.',
+'Q26_2': 'I am restless, I cannot stay still for long.',
+'Q26_3': 'I get a lot of headaches, stomach-aches, or sickness.',
+'Q26_4': 'I usually share with others (food, games, pens, etc.).',
+'Q26_5': 'I usually share with others (food, games, pens, etc.).',
+'Q26_6': 'I am usually on my own. I generally play alone or keep to myself.',
+'Q26_7': 'I usually do as I am told.',
+'Q26_8': 'I usually do as I am told.',
+'Q26_9': 'I am helpful if someone is hurt, upset, or feeling ill.',
+'Q26_10': 'I am constantly fidgeting or squirming.',
+'Q26_11': 'I have one good friend or more.',
+'Q26_12': 'I fight a lot. I can make other people do what I want.',
+'Q26_13': 'I am often unhappy, down-hearted, or tearful.',
+'Q26_14': 'Other people my age generally like me.',
+'Q26_15': 'I am easily distracted. I find it difficult to concentrate.',
+'Q26_16': 'I am nervous in new situations. I easily lose confidence.',
+'Q27': 'To what extent do you control your screen behaviours',
+'Q28': 'To what extent do you feel dependent on screens in order to function effectively in day-to-day life?',
+'Q29': 'Do you feel addicted to any screen based activities?',
+'Q30': 'How many social media apps do you have on your smartphone?',
+'Q31': 'Are the impacts of social media on your well-being mostly positive or mostly negative?',
+'Q32': 'To what extent do you find social media essential for day-to-day life?',
+'Q33':'‘Do you avoid any social media?'}
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+#The categories a PID can be sorted into by classify_pids, 'valid' is the only one counted as correctly entered
+PID_CLASSES=['valid', 'nan', 'whitespace', 'non_alphanumeric', 'wrong_length']
+#The tasks and surveys in the completion table, mapped to the column in the data record they are worked out from
+COMPLETION_TASKS={'RS': 'RS', 'Audio': 'Audio'}
+COMPLETION_SURVEYS={'CN': 'CNProgress', 'Post CN': 'PostProgress'}
+#What the completion trends can be bucketed by, the date each response was recorded or the date of each participant's
+#session in this column of the data record (see trend_row_dates)
+TREND_DATES=['recorded', 'session']
+SESSION_DATE_COLUMN='Session Date'
+#The surveys which are merged onto the data record, in the order they are merged. Each one says which question asks for
+#the PID, the prefix its Progress/Finished/Duration columns get, any more columns to skip, the names its questions are
+#given, its row in the PID format table and its name in the completion table. More can be added with load_survey_registry
+SURVEY_REGISTRY={'CN': {'pidcolumn': 'Q5', 'prefix': 'CN', 'dropcolumns': [], 'names': CNnames, 'label': 'During session', 'completion': 'CN'},
+                 'POST': {'pidcolumn': 'Q1', 'prefix': 'Post', 'dropcolumns': ['Unnamed: 18'], 'names': POSTnames, 'label': 'After session',
+                          'completion': 'Post CN'}}
+#The keys every survey in a registry file needs, the others default to nothing extra to skip and the survey's own name
+SURVEY_KEYS=['file', 'pidcolumn', 'prefix', 'names']
+#The hair type questions export the ID of the picture that was picked, this file says which question and option each
+#one is (and any other answers that need changing), see load_value_mappings
+VALUE_MAPPINGS_FILE=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'value_mappings.json')
+#The keys every mapping in that file needs
+VALUE_MAPPING_KEYS=['survey', 'columns', 'values']
+#Characters that are easy to mix up when copying a PID, swapping one for the other only counts as half a mistake
+CONFUSABLE_CHARACTERS=[('O', '0'), ('I', '1'), ('L', '1'), ('S', '5'), ('B', '8'), ('Z', '2'), ('G', '6')]
+#Bump this whenever the way the .csv files are read and cleaned changes, so cached files get read again
+CLEANING_VERSION=1
+#Bump this whenever the way the data is joined changes, so saved incremental states get rebuilt
+STATE_VERSION=2
+#In compact mode, text columns with at most this many different values per row are stored as categories
+COMPACT_CATEGORY_RATIO=0.5
+#Where the completion data is saved if nowhere else is given, in the folder it is run from (the same as the command line)
+OUTPUT_FILE='Participant Completion Data.xlsx'
+#The optional packages (see pyproject.toml) each output format needs, 'excel' and 'csv' only need what is always installed
+OUTPUT_MODULES={'xlsx-stream': 'xlsxwriter', 'parquet': 'pyarrow', 'arrow': 'pyarrow'}
+#The most rows an Excel sheet can have, including the header
+EXCEL_MAX_ROWS=1048576
+#The most space the cache of read .csv files can take up before the least recently used files are deleted
+CACHE_MAX_BYTES=2*1024**3
+#The ways a participant's repeated responses to a survey can be picked between, see resolve_duplicates, and any of the
+#POINTLESS_COLUMNS each one needs read
+DUPLICATE_POLICIES={'progress': [], 'latest': ['RecordedDate'], 'finished': [], 'flag': []}
+#Getting rid of some of the nonsense columns like start date and location since it tells us nothing
+POINTLESS_COLUMNS=['StartDate', 'RecipientEmail' , 'RecipientFirstName', 'RecipientLastName', 'EndDate', 'Status', 
+                   'IPAddress', 'ExternalReference', 'LocationLatitude', 'LocationLongitude', 
+                   'DistributionChannel', 'ResponseId', 'RecordedDate', 'UserLanguage']
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def correct_format(pid):
+    "Checks to see if a string is alphanumeric and of length 6 to 7 characters. This is because of the format used to create PIDs for the students."
+    "Arguments: (pid) an uppercase string"
+    "Returns: (False) if the string is NAN or doesn't meet the criteria. (True) if it does meet the criteria."
+    #isalnum() is already False if there are any spaces so the string doesn't need stripping
+    return pid.isalnum() and len(pid) in (6, 7)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def classify_pids(pids):
+    """
+    Sorts every PID into one of the PID_CLASSES in one go over the whole column, instead of calling correct_format on
+    each PID. A PID is 'nan' if it was left blank, 'whitespace' if it has spaces at the start or end, 'non_alphanumeric'
+    if it has any other characters which aren't letters or numbers, 'wrong_length' if it isn't 6 or 7 characters long
+    and 'valid' otherwise (the same PIDs that correct_format accepts).
+
+    Arguments:
+        pids (pd.Series): The uppercased PIDs from the questionnaire data.
+
+    Returns:
+        pd.Series: A categorical series with the class of each PID, with the same index as pids.
+    """
+    alnum=pids.str.isalnum().to_numpy(dtype=bool)
+    length=pids.str.len().to_numpy()
+    #a PID which is all letters and numbers can't have spaces, so only the (few) others need stripping
+    padded=np.zeros(len(pids), dtype=bool)
+    padded[~alnum]=(pids[~alnum].str.strip().str.len().to_numpy()!=length[~alnum])
+    blank=(pids=='NAN').to_numpy()
+    valid=alnum & ((length==6) | (length==7))
+    #np.select picks the first condition which is true, so the order here decides which class a PID ends up in
+    codes=np.select([blank, valid, padded, ~alnum], [1, 0, 2, 3], default=4)
+    return pd.Series(pd.Categorical.from_codes(codes, categories=PID_CLASSES), index=pids.index, name='PIDClass')
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def count_pid_classes(pidclasses, number_of_rows):
+    """
+    Counts how many PIDs are in each class and checks that every row of the questionnaire data has been counted exactly
+    once.
+
+    Arguments:
+        pidclasses (pd.Series): The classes returned by classify_pids.
+        number_of_rows (int): The number of rows in the questionnaire data.
+
+    Returns:
+        dict: A dictionary mapping each of the PID_CLASSES to the number of PIDs in it.
+
+    Raises:
+        ValueError: If the counts don't add up to the number of rows in the questionnaire data.
+    """
+    pidcounts={pidclass: int(count) for pidclass, count in pidclasses.value_counts(sort=False).items()}
+    if sum(pidcounts.values())!=number_of_rows:
+        raise ValueError("The PID classes add up to " + str(sum(pidcounts.values())) + " rows but the questionnaire has " + str(number_of_rows))
+    return pidcounts
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def filter_qualtrics(qualtricsdata):
+    """
+    Checks the PIDs and filters them out. The PIDs are all sorted at once with classify_pids, so each entry only has to
+    be looked at once to put it in with the correct or the incorrect ones.
+
+    Arguments:
+        qualtricsdata (dict): A dictionary of dictionaries representing the entries in the questionnaire data.
+
+    Returns:
+        tuple: A tuple containing three elements:
+            - qualtricsdata (dict): The original dictionary of dictionaries.
+            - qualtricsdata_correct (dict): A dictionary of dictionaries representing the filtered questionnaire data
+              with correct format PIDs.
+            - qualtricsdata_incorrect (dict): A dictionary of dictionaries representing the filtered questionnaire data
+              with incorrect format PIDs (including the NaN ones).
+
+    Raises:
+        ValueError: If any rows have been lost, see count_pid_classes.
+    """
+    pidclasses=classify_pids(pd.Series([data['ParticipantID'] for data in qualtricsdata.values()], dtype=object))
+    #Checking no rows have been lost, this stops the whole thing if they have
+    count_pid_classes(pidclasses, len(qualtricsdata))
+    entries=list(qualtricsdata.items())
+    valid=(pidclasses=='valid').to_numpy().tolist()
+    qualtricsdata_correct=dict(compress(entries, valid))
+    qualtricsdata_incorrect=dict(compress(entries, [not isvalid for isvalid in valid]))
+    return qualtricsdata, qualtricsdata_correct, qualtricsdata_incorrect
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def filter_qualtrics_frame(qualtricsdataframe):
+    """
+    Checks the PIDs in the questionnaire data, the same as filter_qualtrics but keeping the questionnaire data as a
+    dataframe. Instead of copying the rows with correct and incorrect PIDs out, each row gets a class from classify_pids
+    which can be used as a mask (e.g. pidclasses=='valid').
+
+    Arguments:
+        qualtricsdataframe (pd.DataFrame): The questionnaire data returned by read_qualtrics_frame.
+
+    Returns:
+        tuple: A tuple containing three elements:
+            - qualtricsdataframe (pd.DataFrame): The original questionnaire data.
+            - pidclasses (pd.Series): The class of each PID, with the same index as qualtricsdataframe.
+            - pidcounts (dict): The number of PIDs in each class.
+    """
+    pidclasses=classify_pids(qualtricsdataframe['ParticipantID'])
+    #Checking no rows have been lost, this stops the whole thing if they have
+    pidcounts=count_pid_classes(pidclasses, len(qualtricsdataframe))
+    return qualtricsdataframe, pidclasses, pidcounts
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def qualtrics_columns(filenameQualtrics, survey):
+    """
+    Works out which question asks for the participant ID and how the columns need renaming and dropping for a
+    questionnaire, from its entry in SURVEY_REGISTRY. This function has been designed for the July 2023 versions of the
+    questionnaires, please double check the column names if the survey is updated.
+
+    Arguments:
+        filenameQualtrics (str): The file path for either the CN or the Post CN questionnaire.
+        survey (dict): The survey's entry in the registry, or its name in SURVEY_REGISTRY (e.g. 'POST').
+
+    Returns:
+        tuple: A tuple containing three elements:
+            - questionno (str): The question which asks for the participant ID.
+            - renames (dict): A dictionary mapping the important columns to their new names.
+            - dropcolumns (list): The columns which aren't needed, so they don't have to be read in.
+
+    Raises:
+        ValueError: If no survey is given, as nothing in the file says which question has the PID.
+    """
+    #Accounting for the fact that participant ID is asked for in different questions
+    #For the CN it is Q5 and for PostCN it is Q1
+    if isinstance(survey, str) and survey in SURVEY_REGISTRY:
+        survey = SURVEY_REGISTRY[survey]
+    if not isinstance(survey, dict):
+        raise ValueError("The survey for " + filenameQualtrics + " has to be its entry in the registry or one of " + ", ".join(SURVEY_REGISTRY) + ", not " + repr(survey))
+    questionno = survey['pidcolumn']
+    prefix = survey['prefix']
+    dropcolumns = POINTLESS_COLUMNS+survey.get('dropcolumns', [])
+    #Change name of columns so the functions can just refer to Participant ID
+    renames={questionno: 'ParticipantID', 
+             'Progress': prefix+'Progress', 
+             'Finished' : prefix+'Finished',
+             'Duration (in seconds)': prefix+'Duration (in seconds)'}
+    return questionno, renames, dropcolumns
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def tidy_qualtrics_frame(qualtricsdataframeraw, questionno, renames):
+    """
+    Sets the data types, renames the important columns and makes the PIDs uppercase.
+
+    Arguments:
+        qualtricsdataframeraw (pd.DataFrame): The questionnaire data (or part of it) as read from the .csv.
+        questionno (str): The question which asks for the participant ID, from qualtrics_columns.
+        renames (dict): The columns to rename, from qualtrics_columns.
+
+    Returns:
+        pd.DataFrame: The questionnaire data with the participant ID column renamed to 'ParticipantID' and uppercased.
+    """
+    qualtricsdataframe = qualtricsdataframeraw.astype({questionno: 'str', 'Progress': 'int32', 'Finished': 'bool'})
+    qualtricsdataframe.rename(columns=renames, inplace=True)
+    #Making all the PIDs uppercase
+    qualtricsdataframe['ParticipantID'] = qualtricsdataframe['ParticipantID'].str.upper()
+    return qualtricsdataframe
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def read_qualtrics_frame(filenameQualtrics, source=None, survey=None, keep=()):
+    """
+    Reads the .csv file which contains the qualtricsdata and sets some data types and formats, keeping it as a dataframe.
+    The columns in POINTLESS_COLUMNS are skipped while reading so they never take up any memory.
+
+    Arguments:
+        filenameQualtrics (str): The file path for either the CN or the Post CN questionnaire.
+        source (file-like): Something to read instead of the file with the same rows as the file, e.g. the body of an
+            export as it is downloaded (see pid_completion.fetch). filenameQualtrics is then just used as its name.
+        survey (dict): The survey's entry in the registry or its name, see qualtrics_columns.
+        keep (list): Any of the POINTLESS_COLUMNS which should be read anyway (e.g. 'RecordedDate').
+
+    Returns:
+        pd.DataFrame: The questionnaire data with the participant ID column renamed to 'ParticipantID' and uppercased.
+    """
+    questionno, renames, dropcolumns = qualtrics_columns(filenameQualtrics, survey)
+    dropcolumns=[column for column in dropcolumns if column not in keep]
+    #Reading .csv to a dataframe (Skipping first row as qualtrics exports two header rows)    
+    qualtricsdataframeraw = pd.read_csv(filenameQualtrics if source is None else source, skiprows=[1], usecols=lambda column: column not in dropcolumns)
+    return tidy_qualtrics_frame(qualtricsdataframeraw, questionno, renames)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def read_qualtrics_chunks(filenameQualtrics, chunksize, keep=(), source=None, survey=None):
+    """
+    Reads the .csv file which contains the qualtricsdata a few rows at a time, so only chunksize rows are ever in memory.
+    Each chunk is tidied up the same way as read_qualtrics_frame and keeps its row numbers from the whole file.
+
+    Arguments:
+        filenameQualtrics (str): The file path for either the CN or the Post CN questionnaire.
+        chunksize (int): The number of rows to read at a time.
+        keep (list): Any of the POINTLESS_COLUMNS which should be read anyway (e.g. 'ResponseId').
+        source (file-like): Something to read instead of the file, which has the column names as its first row and no
+            second header row (e.g. just the rows added to the file since it was last read).
+        survey (dict): The survey's entry in the registry or its name, see qualtrics_columns.
+
+    Returns:
+        generator: Yields a pd.DataFrame for each chunk of the questionnaire data.
+    """
+    questionno, renames, dropcolumns = qualtrics_columns(filenameQualtrics, survey)
+    dropcolumns=[column for column in dropcolumns if column not in keep]
+    if source is None:
+        source, skiprows = filenameQualtrics, [1]
+    else:
+        skiprows = None
+    with pd.read_csv(source, skiprows=skiprows, usecols=lambda column: column not in dropcolumns, chunksize=chunksize) as reader:
+        for qualtricsdataframeraw in reader:
+            yield tidy_qualtrics_frame(qualtricsdataframeraw, questionno, renames)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def file_content_hash(filename, cachedir):
+    """
+    Gets a hash of everything in a file. The hashes are remembered in the cache directory against the file's size and
+    modified time, so an unchanged file doesn't have to be read again to work it out.
+
+    Arguments:
+        filename (str): The file path.
+        cachedir (str): The cache directory.
+
+    Returns:
+        str: The SHA-256 hash of the file.
+    """
+    indexfile=os.path.join(cachedir, 'hashes.json')
+    try:
+        with open(indexfile) as file:
+            hashes=json.load(file)
+    except (OSError, ValueError):
+        hashes={}
+    path=os.path.abspath(filename)
+    signature=list(file_signature(filename))
+    if path in hashes and hashes[path]['signature']==signature:
+        return hashes[path]['hash']
+    content=hashlib.sha256()
+    with open(filename, 'rb') as file:
+        for block in iter(lambda: file.read(1024*1024), b''):
+            content.update(block)
+    hashes[path]={'signature': signature, 'hash': content.hexdigest()}
+    #each thread/process writes its own temporary file so files being read at the same time don't clash
+    temporaryfile=indexfile+'.'+str(os.getpid())+'.'+str(threading.get_ident())+'.tmp'
+    with open(temporaryfile, 'w') as file:
+        json.dump(hashes, file)
+    os.replace(temporaryfile, indexfile)
+    return hashes[path]['hash']
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def save_cached_frame(dataframe, cachefile):
+    """
+    Saves a dataframe in the cache as a Feather (Arrow) file, which can be loaded back much faster than a .csv can be
+    read. If pyarrow isn't installed, or the dataframe has columns Arrow can't store, it is pickled instead.
+
+    Arguments:
+        dataframe (pd.DataFrame): The dataframe to save.
+        cachefile (str): The file path without an extension.
+
+    Returns:
+        str: The file path it was saved to.
+    """
+    try:
+        dataframe.to_feather(cachefile+'.tmp')
+        extension='.feather'
+    except (ImportError, ValueError, TypeError):
+        dataframe.to_pickle(cachefile+'.tmp')
+        extension='.pkl'
+    os.replace(cachefile+'.tmp', cachefile+extension)
+    return cachefile+extension
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def evict_cache(cachedir, maxbytes=CACHE_MAX_BYTES):
+    """
+    Deletes the least recently used files from the cache until it takes up no more than maxbytes.
+
+    Arguments:
+        cachedir (str): The cache directory.
+        maxbytes (int): The most space the cached files can take up.
+    """
+    cached=[entry for entry in os.scandir(cachedir) if entry.name.endswith(('.feather', '.pkl'))]
+    #the modified time is updated every time a file is used, so the oldest one is the least recently used
+    cached.sort(key=lambda entry: entry.stat().st_mtime_ns)
+    total=sum(entry.stat().st_size for entry in cached)
+    for entry in cached:
+        if total<=maxbytes:
+            break
+        total-=entry.stat().st_size
+        os.remove(entry.path)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def read_cached(reader, filename, cachedir=None, names=None, maxbytes=CACHE_MAX_BYTES, options=None):
+    """
+    Calls reader(filename), unless the same file has been read before with the same cleaning rules, in which case the
+    cleaned dataframe is loaded straight from the cache without reading the .csv at all. The cache is keyed by a hash of
+    the file's contents, the reader, CLEANING_VERSION and names, so changing any of them means the file is read again.
+
+    Arguments:
+        reader (function): The function which reads and cleans the file, e.g. read_qualtrics_frame.
+        filename (str): The file path.
+        cachedir (str): The cache directory. If None nothing is cached and reader(filename) is returned.
+        names (dict): The names the columns will be given (e.g. CNnames), so the cache is redone if they change.
+        maxbytes (int): The most space the cached files can take up.
+        options (dict): Any keyword arguments to give reader (e.g. the survey), which are part of the key too.
+
+    Returns:
+        pd.DataFrame: The dataframe returned by reader.
+    """
+    options=options or {}
+    if cachedir is None:
+        return reader(filename, **options)
+    os.makedirs(cachedir, exist_ok=True)
+    #options are only added to the key when there are some, so files cached before they existed are still found
+    key=hashlib.sha256(json.dumps([file_content_hash(filename, cachedir), reader.__name__, CLEANING_VERSION, names]+([options] if options else [])).encode()).hexdigest()
+    cachefile=os.path.join(cachedir, key)
+    for extension in ['.feather', '.pkl']:
+        if os.path.exists(cachefile+extension):
+            #marking it as recently used
+            os.utime(cachefile+extension)
+            if extension=='.pkl':
+                return pd.read_pickle(cachefile+extension)
+            dataframe=pd.read_feather(cachefile+extension)
+            #Arrow gives back blanks in text columns as None, putting them back to NaN like read_csv does
+            textcolumns=dataframe.select_dtypes(object).columns
+            dataframe[textcolumns]=dataframe[textcolumns].fillna(np.nan)
+            return dataframe
+    dataframe=reader(filename, **options)
+    save_cached_frame(dataframe, cachefile)
+    evict_cache(cachedir, maxbytes)
+    return dataframe
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def read_qualtrics_data(filenameQualtrics, cachedir=None, names=None, profile=None, source=None, survey=None):
+    """
+    Reads the .csv file which contains the qualtricsdata and sets some data types and formats. This function has been designed for the July 2023
+    versions of the questionnaires, please double check the column names if the survey is updated.
+
+    Arguments:
+        filenameQualtrics (str): The file path for either the CN or the Post CN questionnaire.
+        cachedir (str): If given, the cleaned data is cached here (see read_cached).
+        names (dict): The names the columns will be given, so the cache is redone if they change.
+        profile (dict): If given, reading and filtering are timed as separate stages (see start_stage).
+        source (file-like): Something to read instead of the file, see read_qualtrics_frame. Nothing is cached then.
+        survey (dict): The survey's entry in the registry or its name, see qualtrics_columns.
+
+    Returns:
+        tuple: A tuple containing three elements:
+            - qualtricsdata (dict): A dictionary of dictionaries representing the entries in the questionnaire data.
+            - qualtricsdata_correct (dict): A dictionary of dictionaries representing the filtered questionnaire data
+              with correct PIDs.
+            - qualtricsdata_incorrect (dict): A dictionary of dictionaries representing the filtered questionnaire data
+              with incorrect PIDs.
+    """    
+    detail=os.path.basename(filenameQualtrics)
+    with profile_stage(profile, 'read_qualtrics_frame', detail=detail) as record:
+        #Reading and tidying up the .csv
+        if source is None:
+            qualtricsdataframe=read_cached(read_qualtrics_frame, filenameQualtrics, cachedir, names, options={'survey': survey} if survey else None)
+        else:
+            qualtricsdataframe=read_qualtrics_frame(filenameQualtrics, source, survey)
+        #Turning the dataframe into a dictionary
+        qualtricsdata=qualtricsdataframe.to_dict('index')
+        record['rows_out']=len(qualtricsdata)
+    with profile_stage(profile, 'filter_qualtrics', len(qualtricsdata), detail) as record:
+        #Calling filter_qualtrics to get the original data, the data for correct pids and the data for incorrect pids
+        qualtricsdata, qualtricsdata_correct, qualtricsdata_incorrect=filter_qualtrics(qualtricsdata)
+        record['rows_out']=len(qualtricsdata_correct)
+    return qualtricsdata, qualtricsdata_correct, qualtricsdata_incorrect
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def read_data_record_frame(filenameDatarecord):
+    """
+    Reads the .csv file which contains the data record and sets some data types and formats, keeping it as a dataframe.
+
+    Arguments:
+        filenameDatarecord (str): The file path for the data record.
+
+    Returns:
+        pd.DataFrame: The data record with the 'Participant ID' column uppercased.
+    """
+    #reads the .csv datarecord
+    datarecordframe=pd.read_csv(filenameDatarecord)
+    return tidy_data_record_frame(datarecordframe)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def tidy_data_record_frame(datarecordframe):
+    """
+    Sets the data types of the data record (or part of it) and makes the PIDs uppercase.
+
+    Arguments:
+        datarecordframe (pd.DataFrame): The data record as read from the .csv.
+
+    Returns:
+        pd.DataFrame: The data record with the 'Participant ID' column uppercased.
+    """
+    #sets the data types
+    datarecordframe = datarecordframe.astype({'Participant ID': 'str'})
+    #ensures all strings are uppercase
+    datarecordframe['Participant ID'] = datarecordframe['Participant ID'].str.upper()
+    return datarecordframe
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def read_data_record(filenameDatarecord, cachedir=None):
+    """
+    Reads the .csv file which contains the data record. Sets some data types and formats.
+
+    Arguments:
+        filenameDatarecord (str): The file path for the data record.
+        cachedir (str): If given, the cleaned data record is cached here (see read_cached).
+
+    Returns:
+        tuple: A tuple containing two elements:
+            - datarecord (dict): A dictionary of dictionaries representing the entries in the data record.
+            - datarecordpids (pd.Series): A series containing the participant IDs contained in the data record.
+    """
+    datarecordframe=read_cached(read_data_record_frame, filenameDatarecord, cachedir)
+    #creating a series which contains the participant IDs contained in the data record                    
+    datarecordpids=datarecordframe['Participant ID']
+    #creates a dictionary of the data record so its easier to handle
+    datarecord=datarecordframe.to_dict('index')
+    return datarecord, datarecordpids
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def matches(datarecordpids, pid):
+    """
+    Checks if the PID from the survey data appears in the data record.
+    
+    Arguments:
+        datarecordpids (pd.Series): A series containing the participant IDs from the data record.
+        pid (str): A string representing the PID taken from the survey data.
+    
+    Returns:
+        bool: True if the PID appears in the data record, False otherwise.
+    """
+    if pid in datarecordpids:
+        return True
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def build_pid_index(datarecordpids):
+    """
+    Builds a lookup from each PID in the data record to the row it is in, so that a questionnaire entry can be matched
+    straight away instead of searching through the whole data record every time.
+
+    Arguments:
+        datarecordpids (pd.Series): A series containing the participant IDs from the data record.
+
+    Returns:
+        tuple: A tuple containing two elements:
+            - pidindex (dict): A dictionary mapping each PID to the index of its first row in the data record.
+            - duplicate_pids (list): The PIDs which appear more than once in the data record (only the first row is matched).
+    """
+    pidindex={}
+    #a dictionary rather than a list so checking for a PID doesn't mean searching all of them, and it keeps their order
+    duplicate_pids={}
+    for index, pid in datarecordpids.items():
+        #only keeping the first row for each PID, same as searching the data record from the top
+        if pid not in pidindex:
+            pidindex[pid]=index
+        else:
+            duplicate_pids[pid]=None
+    return pidindex, list(duplicate_pids)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def join_qualtrics(datarecord, pidindex, qualtricsdata, overwrite=True):
+    """
+    Updates the datarecord dictionary with the data from matching PIDs in the qualtricsdata, using the lookup made by
+    build_pid_index so that each entry only takes one step to match.
+
+    Arguments:
+        datarecord (dict): A dictionary of the data record.
+        pidindex (dict): A dictionary mapping each PID to the index of its row in the data record.
+        qualtricsdata (dict): A dictionary of dictionaries representing the entries in the questionnaire data.
+        overwrite (bool): If True (the original behaviour) a later entry with the same PID overwrites an earlier one.
+            If False the first entry for each PID is kept and any later ones are skipped.
+
+    Returns:
+        tuple: A tuple containing two elements:
+            - datarecord (dict): The updated datarecord dictionary with merged data.
+            - joinreport (dict): A dictionary with the number of 'matched' entries, a list of the 'unmatched' PIDs which
+              are not in the data record and a list of the 'duplicate' PIDs which were entered more than once.
+    """
+    #picking the one entry for each row of the data record first, so each row is only written to once
+    picked={}
+    unmatched=[]
+    duplicates={}
+    for data in qualtricsdata.values():
+        participant_id = data['ParticipantID']
+        matching_index = pidindex.get(participant_id)
+        if matching_index is None:
+            unmatched.append(participant_id)
+            continue
+        if matching_index in picked:
+            duplicates[participant_id]=None
+            if not overwrite:
+                continue
+        picked[matching_index]=data
+    #every entry has the same keys, so writing just the picked one is the same as writing them all in order
+    for matching_index, data in picked.items():
+        datarecord[matching_index].update(data)
+    joinreport={'matched': len(picked), 'unmatched': unmatched, 'duplicate': list(duplicates)}
+    return datarecord, joinreport
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def lookup_rows(pids, pidindex):
+    """
+    Finds the data record row for each PID. If the PIDs are categorical (see compact_frame) each different PID is only
+    looked up once and the rows are spread out using the category codes, which are just integers.
+
+    Arguments:
+        pids (pd.Series): The PIDs.
+        pidindex (dict): A dictionary mapping each PID to the index of its row in the data record.
+
+    Returns:
+        pd.Series: The data record row for each PID (as floats), NaN if it isn't in the data record.
+    """
+    if isinstance(pids.dtype, pd.CategoricalDtype):
+        #a code of -1 (a blank) picks the NaN added on the end
+        categoryrows=np.append(pids.cat.categories.map(pidindex).to_numpy(dtype=float, na_value=np.nan), np.nan)
+        return pd.Series(categoryrows[pids.cat.codes.to_numpy()], index=pids.index)
+    return pids.map(pidindex)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def match_qualtrics_frame(pidindex, qualtricsdataframe, overwrite=True, duplicatepolicy=None):
+    """
+    Finds the data record row for every entry in the questionnaire data in one go, and picks the one entry which will
+    be written for each participant.
+
+    Arguments:
+        pidindex (dict): A dictionary mapping each PID to the index of its row in the data record.
+        qualtricsdataframe (pd.DataFrame): The questionnaire data.
+        overwrite (bool): If True (the original behaviour) the last entry for each PID is picked, otherwise the first.
+        duplicatepolicy (str): If given, how a participant's entries are picked between (see resolve_duplicates), with
+            overwrite only used for ties.
+
+    Returns:
+        tuple: A tuple containing two elements:
+            - matcheddata (pd.DataFrame): The picked entries, indexed by the data record row they belong to.
+            - joinreport (dict): The same report as join_qualtrics, and with a duplicatepolicy the 'conflicts' too
+              (see conflict_report).
+    """
+    pids=qualtricsdataframe['ParticipantID']
+    rows=lookup_rows(pids, pidindex)
+    found=rows.notna()
+    repeated=found & rows.duplicated(keep='first')
+    joinreport={'matched': int(rows[found].nunique()),
+                'unmatched': pids[~found].tolist(),
+                'duplicate': pids[repeated].drop_duplicates().tolist()}
+    if duplicatepolicy is None:
+        #only one entry per participant is written, the last one unless overwrite is False
+        keep=found & ~rows.duplicated(keep='last' if overwrite else 'first')
+        return qualtricsdataframe[keep].set_index(rows[keep].astype('int64').values), joinreport
+    entries=qualtricsdataframe[found]
+    rows=rows[found].astype('int64').to_numpy()
+    keep=resolve_duplicates(entries, rows, duplicatepolicy, overwrite)
+    joinreport['conflicts']=conflict_report(entries, rows, keep)
+    matcheddata=entries[keep].set_index(rows[keep])
+    if duplicatepolicy=='flag':
+        matcheddata=flag_duplicates(matcheddata, rows)
+    return matcheddata, joinreport
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def policy_columns(entries):
+    """
+    Finds the Progress and Finished columns of a questionnaire's entries, whatever prefix the survey gives them (see
+    qualtrics_columns). The questions still have their question numbers when the entries are matched, so these are the
+    only columns ending in 'Progress' and 'Finished'.
+
+    Arguments:
+        entries (pd.DataFrame): The questionnaire data.
+
+    Returns:
+        tuple: The names of the Progress and Finished columns.
+    """
+    progress=[column for column in entries.columns if str(column).endswith('Progress')]
+    finished=[column for column in entries.columns if str(column).endswith('Finished')]
+    if len(progress)!=1 or len(finished)!=1:
+        raise ValueError("Can't tell which columns are the survey's Progress and Finished out of " + ", ".join(map(str, progress+finished)))
+    return progress[0], finished[0]
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def resolve_duplicates(entries, rows, duplicatepolicy, overwrite=True):
+    """
+    Picks one entry for each participant who responded to a survey more than once, for all of them at once by sorting
+    the entries rather than going through them one at a time:
+
+        'progress'  the one with the highest Progress
+        'latest'    the one recorded last (needs the 'RecordedDate' column, see DUPLICATE_POLICIES)
+        'finished'  a finished one over an unfinished one
+        'flag'      the same as without a policy, but the data record says how many responses there were (see flag_duplicates)
+
+    Ties are picked between the same way as without a policy, the last entry unless overwrite is False. The same
+    entries are picked whatever order they are given in, so picking in chunks and then between the chunks' picks (see
+    combine_matches) gives the same result as picking from everything at once.
+
+    Arguments:
+        entries (pd.DataFrame): The matched questionnaire entries, in the order they are in the export.
+        rows (np.ndarray): The data record row of each entry.
+        duplicatepolicy (str): One of the DUPLICATE_POLICIES.
+        overwrite (bool): If True later entries win ties, otherwise earlier ones.
+
+    Returns:
+        np.ndarray: True for the one entry picked for each row.
+    """
+    if duplicatepolicy not in DUPLICATE_POLICIES:
+        raise ValueError("The duplicate policy has to be one of " + ", ".join(DUPLICATE_POLICIES) + ", not " + repr(duplicatepolicy))
+    rows=np.asarray(rows)
+    if not len(rows):
+        return np.zeros(0, dtype=bool)
+    position=np.arange(len(rows))
+    #np.lexsort sorts by the last key first, so within each row the entry picked ends up last
+    keys=[position if overwrite else -position]
+    progresscolumn, finishedcolumn=policy_columns(entries)
+    if duplicatepolicy=='progress':
+        keys.append(pd.to_numeric(entries[progresscolumn], errors='coerce').fillna(-1).to_numpy())
+    elif duplicatepolicy=='finished':
+        keys.append(entries[finishedcolumn].fillna(False).to_numpy(dtype=bool))
+    elif duplicatepolicy=='latest':
+        #responses without a date go first, so any with a date wins
+        keys.append(pd.to_datetime(entries['RecordedDate'], errors='coerce').fillna(pd.Timestamp.min).to_numpy())
+    keys.append(rows)
+    order=np.lexsort(keys)
+    sortedrows=rows[order]
+    last=np.append(sortedrows[1:]!=sortedrows[:-1], True)
+    keep=np.zeros(len(rows), dtype=bool)
+    keep[order[last]]=True
+    return keep
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def conflict_report(entries, rows, keep):
+    """
+    Lists every response of the participants who responded to a survey more than once, and which one was kept.
+
+    Arguments:
+        entries (pd.DataFrame): The matched questionnaire entries.
+        rows (np.ndarray): The data record row of each entry.
+        keep (np.ndarray): True for the entries which were kept, from resolve_duplicates.
+
+    Returns:
+        pd.DataFrame: The 'ParticipantID', 'Response' (the row of the export), 'Progress', 'Finished' (and 'RecordedDate'
+        if it was read), the number of 'Responses' the participant gave and whether it was 'Kept', grouped by participant.
+    """
+    progresscolumn, finishedcolumn=policy_columns(entries)
+    columns=['ParticipantID', progresscolumn, finishedcolumn]+(['RecordedDate'] if 'RecordedDate' in entries.columns else [])
+    rows=pd.Series(np.asarray(rows), index=entries.index)
+    responses=rows.map(rows.value_counts())
+    repeated=(responses>1).to_numpy()
+    report=entries.loc[repeated, columns].rename(columns={progresscolumn: 'Progress', finishedcolumn: 'Finished'})
+    report.insert(1, 'Response', report.index)
+    report['Responses']=responses[repeated].to_numpy()
+    report['Kept']=np.asarray(keep)[repeated]
+    #keeping each participant's responses together, in the order they were given
+    report=report.iloc[np.lexsort([report['Response'].to_numpy(), rows[repeated].to_numpy()])]
+    return report.reset_index(drop=True)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def flag_duplicates(matcheddata, rows):
+    """
+    Adds a column to the picked entries saying how many responses each participant gave to the survey, for the 'flag'
+    duplicate policy. The column is named after the survey's Progress column, e.g. 'CNResponses' for 'CNProgress'.
+
+    Arguments:
+        matcheddata (pd.DataFrame): The picked entries, indexed by their data record row.
+        rows (np.ndarray): The data record row of every matched entry, including the ones not picked.
+
+    Returns:
+        pd.DataFrame: The picked entries with the number of responses added.
+    """
+    progresscolumn, finishedcolumn=policy_columns(matcheddata)
+    counts=pd.Series(np.asarray(rows)).value_counts()
+    return matcheddata.assign(**{progresscolumn[:-len('Progress')]+'Responses': counts.reindex(matcheddata.index).to_numpy()})
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def overlay_matches(current, matched, matchedrows):
+    """
+    Puts the matched entries' values over a column of the data record, for the matched rows only.
+
+    Arguments:
+        current (pd.Series): The column in the data record.
+        matched (pd.Series): The same column of the matched entries, reindexed to the data record.
+        matchedrows (np.ndarray): True for the rows which matched.
+
+    Returns:
+        pd.Series: The column with the matched values in.
+    """
+    #compact columns (see compact_frame) can only be mixed once they share the same categories
+    if isinstance(current.dtype, pd.CategoricalDtype) and isinstance(matched.dtype, pd.CategoricalDtype):
+        categories=current.cat.categories.union(matched.cat.categories)
+        current, matched=current.cat.set_categories(categories), matched.cat.set_categories(categories)
+    elif current.dtype!=matched.dtype and isinstance(current.dtype, pd.CategoricalDtype)!=isinstance(matched.dtype, pd.CategoricalDtype):
+        current, matched=current.astype(object), matched.astype(object)
+    return current.mask(matchedrows, matched)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def add_matches_frame(datarecordframe, matcheddata):
+    """
+    Writes the entries picked by match_qualtrics_frame into the data record. Columns the data record already has are
+    only overwritten for the matched rows, and new columns are left blank for everyone else.
+
+    Arguments:
+        datarecordframe (pd.DataFrame): The data record.
+        matcheddata (pd.DataFrame): The entries returned by match_qualtrics_frame.
+
+    Returns:
+        pd.DataFrame: The data record with the questionnaire columns added.
+    """
+    #nothing is added if nobody matched, the same as updating the dictionaries
+    if matcheddata.empty:
+        return datarecordframe
+    matchedrows=datarecordframe.index.isin(matcheddata.index)
+    matcheddata=matcheddata.reindex(datarecordframe.index)
+    datarecordframe=datarecordframe.copy()
+    for column in matcheddata.columns.intersection(datarecordframe.columns):
+        datarecordframe[column]=overlay_matches(datarecordframe[column], matcheddata[column], matchedrows)
+    newcolumns=matcheddata.columns.difference(datarecordframe.columns, sort=False)
+    return pd.concat([datarecordframe, matcheddata[newcolumns]], axis=1)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def join_qualtrics_frame(datarecordframe, pidindex, qualtricsdataframe, overwrite=True):
+    """
+    Adds the data from matching PIDs in the questionnaire data to the data record, the same as join_qualtrics but working
+    on whole columns of the dataframes rather than one entry at a time.
+
+    Arguments:
+        datarecordframe (pd.DataFrame): The data record.
+        pidindex (dict): A dictionary mapping each PID to the index of its row in the data record.
+        qualtricsdataframe (pd.DataFrame): The questionnaire data.
+        overwrite (bool): If True (the original behaviour) a later entry with the same PID overwrites an earlier one.
+            If False the first entry for each PID is kept and any later ones are skipped.
+
+    Returns:
+        tuple: A tuple containing two elements:
+            - datarecordframe (pd.DataFrame): The data record with the questionnaire columns added.
+            - joinreport (dict): The same report as join_qualtrics.
+    """
+    matcheddata, joinreport=match_qualtrics_frame(pidindex, qualtricsdataframe, overwrite)
+    return add_matches_frame(datarecordframe, matcheddata), joinreport
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def combine_matches(matcheddata, newmatches, overwrite=True, duplicatepolicy=None):
+    """
+    Adds the entries matched from more of the questionnaire data (e.g. the next chunk) to the ones matched so far,
+    keeping one entry per participant.
+
+    Arguments:
+        matcheddata (pd.DataFrame): The entries matched so far, from match_qualtrics_frame.
+        newmatches (pd.DataFrame): The entries matched from the new data, from match_qualtrics_frame.
+        overwrite (bool): If True the new entry replaces the old one for participants in both, otherwise the old one is kept.
+        duplicatepolicy (str): If given, the entries are picked between with resolve_duplicates, with overwrite only used
+            for ties.
+
+    Returns:
+        tuple: A tuple containing two elements:
+            - matcheddata (pd.DataFrame): One entry per matched participant.
+            - repeated (list): The PIDs which had already been matched, so have been entered more than once.
+    """
+    if matcheddata.empty:
+        return newmatches, []
+    repeated=newmatches.loc[newmatches.index.isin(matcheddata.index), 'ParticipantID'].tolist()
+    matcheddata=pd.concat([matcheddata, newmatches])
+    if duplicatepolicy is None:
+        matcheddata=matcheddata[~matcheddata.index.duplicated(keep='last' if overwrite else 'first')]
+    else:
+        matcheddata=matcheddata[resolve_duplicates(matcheddata, matcheddata.index.to_numpy(), duplicatepolicy, overwrite)]
+    return matcheddata, repeated
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def stream_qualtrics(filenameQualtrics, pidindex, overwrite=True, chunksize=50000, source=None, responses=None, survey=None, duplicatepolicy=None,
+                     dates=None):
+    """
+    Reads the questionnaire data in chunks and checks and matches the PIDs one chunk at a time, so that only one chunk
+    and the entries which matched the data record are ever kept in memory, however big the export is.
+
+    Arguments:
+        filenameQualtrics (str): The file path for either the CN or the Post CN questionnaire.
+        pidindex (dict): A dictionary mapping each PID to the index of its row in the data record.
+        overwrite (bool): If True (the original behaviour) a later entry with the same PID overwrites an earlier one.
+            If False the first entry for each PID is kept and any later ones are skipped.
+        chunksize (int): The number of rows to read at a time.
+        source (file-like): Something to read instead of the file, see read_qualtrics_chunks.
+        responses (dict): If given, the 'ResponseId' and 'RecordedDate' of every response are added to it.
+        survey (dict): The survey's entry in the registry or its name, see qualtrics_columns.
+        duplicatepolicy (str): If given, how a participant's entries are picked between (see resolve_duplicates).
+        dates (dict): If given, the 'recorded' date and whether the PID is 'valid' for every response and the
+            'matcheddates' of the picked entries are put in it, the same as read_and_match_surveys gives for the trends.
+
+    Returns:
+        tuple: A tuple containing four elements:
+            - matcheddata (pd.DataFrame): One entry per matched participant, to be given to add_matches_frame.
+            - pidcounts (dict): The number of PIDs in each of the PID_CLASSES.
+            - number_of_rows (int): The number of rows in the questionnaire data.
+            - joinreport (dict): The same report as match_qualtrics_frame.
+    """
+    matcheddata=pd.DataFrame()
+    pidcounts=dict.fromkeys(PID_CLASSES, 0)
+    number_of_rows=0
+    unmatched=[]
+    #using a dictionary to keep the duplicate PIDs in the order they were found without repeats
+    duplicates={}
+    keep=['ResponseId', 'RecordedDate'] if responses is not None else []
+    policykeep=DUPLICATE_POLICIES[duplicatepolicy] if duplicatepolicy is not None else []
+    #the recorded date is matched along with everything else so the picked entry's date comes out with it
+    matchkeep=list(dict.fromkeys(policykeep+(['RecordedDate'] if dates is not None else [])))
+    #just the columns the duplicate policy needs for every matched entry, so the conflicts between chunks can be found
+    candidates=[]
+    recorded, valid=[], []
+    for chunk in read_qualtrics_chunks(filenameQualtrics, chunksize, list(dict.fromkeys(keep+matchkeep)), source, survey):
+        if keep:
+            responses.update(zip(chunk['ResponseId'], chunk['RecordedDate']))
+            chunk=chunk.drop(columns=[column for column in keep if column not in matchkeep])
+        number_of_rows+=len(chunk)
+        pidclasses=classify_pids(chunk['ParticipantID'])
+        for pidclass, count in count_pid_classes(pidclasses, len(chunk)).items():
+            pidcounts[pidclass]+=count
+        if dates is not None:
+            recorded.append(chunk['RecordedDate'].to_numpy(dtype=object))
+            valid.append((pidclasses=='valid').to_numpy())
+        chunkmatches, chunkreport=match_qualtrics_frame(pidindex, chunk, overwrite, duplicatepolicy)
+        unmatched.extend(chunkreport['unmatched'])
+        duplicates.update(dict.fromkeys(chunkreport['duplicate']))
+        if duplicatepolicy is not None:
+            rows=lookup_rows(chunk['ParticipantID'], pidindex)
+            candidates.append(chunk.loc[rows.notna(), ['ParticipantID', *policy_columns(chunk), *policykeep]].assign(Row=rows[rows.notna()].astype('int64')))
+        #participants who already matched in an earlier chunk have entered their PID more than once
+        matcheddata, repeated=combine_matches(matcheddata, chunkmatches, overwrite, duplicatepolicy)
+        duplicates.update(dict.fromkeys(repeated))
+    joinreport={'matched': len(matcheddata), 'unmatched': unmatched, 'duplicate': list(duplicates)}
+    if duplicatepolicy is not None:
+        #picking again from just these columns gives the same entries as the chunks did (see resolve_duplicates)
+        candidates=pd.concat(candidates) if candidates else pd.DataFrame(columns=['ParticipantID', 'Progress', 'Finished', *policykeep, 'Row'])
+        rows=candidates['Row'].to_numpy(dtype='int64')
+        joinreport['conflicts']=conflict_report(candidates, rows, resolve_duplicates(candidates, rows, duplicatepolicy, overwrite))
+        if duplicatepolicy=='flag' and not matcheddata.empty:
+            matcheddata=flag_duplicates(matcheddata, rows)
+    if dates is not None:
+        dates.update({'recorded': np.concatenate(recorded) if recorded else np.array([], dtype=object),
+                      'valid': np.concatenate(valid) if valid else np.array([], dtype=bool),
+                      'matcheddates': matcheddata['RecordedDate'] if 'RecordedDate' in matcheddata.columns else pd.Series(dtype=object)})
+    #the columns only read to pick between duplicates or for the trends don't go in the data record
+    matcheddata=matcheddata.drop(columns=matchkeep, errors='ignore')
+    #Checking no rows have been lost
+    if sum(pidcounts.values())!=number_of_rows:
+        raise ValueError("The PID classes add up to " + str(sum(pidcounts.values())) + " rows but the questionnaire has " + str(number_of_rows))
+    return matcheddata, pidcounts, number_of_rows, joinreport
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def collapse_duplicate_columns(dataframe):
+    """
+    Merges columns which have ended up with the same name after renaming (e.g. 'I feel secure.' for Q18_2 and Q19_3).
+    This keeps the values of the last column in the position of the first one, which is what the original dictionary
+    round trip in get_completion_data does.
+
+    Arguments:
+        dataframe (pd.DataFrame): The dataframe with possibly repeated column names.
+
+    Returns:
+        pd.DataFrame: The dataframe with every column name appearing once.
+    """
+    duplicated=dataframe.columns.duplicated(keep='first')
+    if not duplicated.any():
+        return dataframe
+    collapsed=dataframe.loc[:, ~duplicated].copy()
+    for column in dataframe.columns[duplicated].unique():
+        collapsed[column]=dataframe.loc[:, dataframe.columns==column].iloc[:, -1]
+    return collapsed
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def plan_survey_columns(columns, surveycolumns):
+    """
+    Works out where each column of the final data record comes from, using just the column names. This follows what
+    adding each survey's matches with add_matches_frame and then renaming would do, one survey after another: a
+    column the data record already has gets the survey's values over it for the matched rows, new columns go on the
+    end, each survey's names are used on the whole data record so far, and columns which end up with the same name are
+    merged with collapse_duplicate_columns after every survey but the last.
+
+    Arguments:
+        columns (pd.Index): The columns of the data record.
+        surveycolumns (list): For each survey in order, a tuple of its matched columns (pd.Index, or None if nobody
+            matched, which adds nothing) and its names.
+
+    Returns:
+        list: A (name, sources) tuple for each final column, where sources are the (survey number, column position)
+        which go over each other in order. The first survey number is None for a column of the data record.
+    """
+    plan=[(column, [(None, position)]) for position, column in enumerate(columns)]
+    for number, (matchedcolumns, names) in enumerate(surveycolumns):
+        if matchedcolumns is not None and len(matchedcolumns):
+            positions={column: position for position, (column, sources) in enumerate(plan)}
+            for position, column in enumerate(matchedcolumns):
+                if column in positions:
+                    plan[positions[column]][1].append((number, position))
+                else:
+                    plan.append((column, [(number, position)]))
+        plan=[(names.get(column, column), sources) for column, sources in plan]
+        if number<len(surveycolumns)-1:
+            #the first column with a name keeps its place and takes the values of the last one
+            merged={}
+            for column, sources in plan:
+                merged[column]=(merged[column][0], sources) if column in merged else (len(merged), sources)
+            plan=[(column, sources) for column, (order, sources) in merged.items()]
+    return plan
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def merge_surveys_frame(datarecordframe, surveymatches):
+    """
+    Writes the matched entries of any number of surveys into the data record and renames the columns, all in one go.
+    Where each column comes from is worked out first from the names (see plan_survey_columns) and then each final column
+    is made once, so the cost grows with the size of the final data record rather than with it times the number of
+    surveys. The result is the same as adding and renaming the surveys one after another.
+
+    Arguments:
+        datarecordframe (pd.DataFrame): The data record (or just some of its rows).
+        surveymatches (list): For each survey in the order they are merged, a tuple of its matched entries (from
+            match_qualtrics_frame or stream_qualtrics) and its names.
+
+    Returns:
+        pd.DataFrame: The final data record, before the hair type values are changed.
+    """
+    surveycolumns=[(None if matches.empty else matches.columns, names) for matches, names in surveymatches]
+    plan=plan_survey_columns(datarecordframe.columns, surveycolumns)
+    index=datarecordframe.index
+    matchedrows=[None if matches.empty else index.isin(matches.index) for matches, names in surveymatches]
+    #only reindexing the columns which are used, one at a time
+    def matched_column(number, position):
+        return surveymatches[number][0].iloc[:, position].reindex(index)
+    columns=[]
+    for column, sources in plan:
+        number, position=sources[0]
+        values=datarecordframe.iloc[:, position] if number is None else matched_column(number, position)
+        for number, position in sources[1:]:
+            values=overlay_matches(values, matched_column(number, position), matchedrows[number])
+        columns.append(values.rename(column))
+    if not columns:
+        return datarecordframe.copy()
+    FINALdatarecordframe=pd.concat(columns, axis=1)
+    FINALdatarecordframe.columns=pd.Index([column for column, sources in plan], dtype=object)
+    return FINALdatarecordframe
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def build_final_frame(datarecordframe, CNmatches, CNnames, POSTmatches, POSTnames):
+    """
+    Writes the matched CN and POST entries into the data record and renames the columns, the same way the rest of
+    get_completion_data does (see merge_surveys_frame).
+
+    Arguments:
+        datarecordframe (pd.DataFrame): The data record (or just some of its rows).
+        CNmatches (pd.DataFrame): The matched CN entries, from match_qualtrics_frame or stream_qualtrics.
+        CNnames (dict): A dictionary mapping the question numbers from CN to desired names.
+        POSTmatches (pd.DataFrame): The matched POST entries, from match_qualtrics_frame or stream_qualtrics.
+        POSTnames (dict): A dictionary mapping the question numbers from POST to desired names.
+
+    Returns:
+        pd.DataFrame: The final data record, before the hair type values are changed.
+    """
+    return merge_surveys_frame(datarecordframe, [(CNmatches, CNnames), (POSTmatches, POSTnames)])
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def load_survey_registry(filename):
+    """
+    Reads the extra surveys (e.g. follow up questionnaires) to merge onto the data record after the CN and POST ones,
+    in the order they are merged:
+
+        {"version": 1,
+         "surveys": {"FollowUp": {"file": "Follow Up Results.csv", "pidcolumn": "Q2", "prefix": "FollowUp",
+                                  "names": {"Q3": "How are you feeling today?"}, "label": "Follow up",
+                                  "dropcolumns": [], "completion": "Follow up"}}}
+
+    The file is relative to the .json file. The prefix goes on the survey's Progress, Finished and Duration columns so
+    they don't clash with the other surveys' ones, so it has to be different for each survey. The label is the
+    survey's row in the PID format table and the completion name its column in the completion table, both defaulting
+    to the survey's name.
+
+    Arguments:
+        filename (str): The .json file.
+
+    Returns:
+        dict: A dictionary mapping the name of each survey to its entry, in the same form as SURVEY_REGISTRY with its
+        'file' as well.
+    """
+    with open(filename, encoding='utf-8') as file:
+        registry=json.load(file)
+    if 'version' not in registry or not isinstance(registry.get('surveys'), dict):
+        raise ValueError("The survey registry " + filename + " needs a 'version' and 'surveys'")
+    surveys={}
+    prefixes=[survey['prefix'] for survey in SURVEY_REGISTRY.values()]
+    for name, survey in registry['surveys'].items():
+        missing=[key for key in SURVEY_KEYS if key not in survey]
+        if missing:
+            raise ValueError("The survey " + repr(name) + " in " + filename + " is missing " + ", ".join(missing))
+        if name in SURVEY_REGISTRY or survey['prefix'] in prefixes:
+            raise ValueError("The survey " + repr(name) + " in " + filename + " needs a name and prefix no other survey has")
+        prefixes.append(survey['prefix'])
+        surveys[name]={'dropcolumns': [], 'label': name, 'completion': name, **survey,
+                       'file': os.path.join(os.path.dirname(os.path.abspath(filename)), survey['file'])}
+    return surveys
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def survey_match_report(surveys, results):
+    """
+    Makes a table of how many of each survey's responses matched the data record.
+
+    Arguments:
+        surveys (dict): The entry in the registry for each survey.
+        results (dict): For each survey, a dictionary with its 'pidcounts', number of 'rows' and 'joinreport' (see
+            read_and_match_surveys).
+
+    Returns:
+        pd.DataFrame: A row for each survey with its 'Responses', 'Correctly Entered PIDs', 'Matched' participants,
+        'Not in Data Record' and 'Entered More Than Once'.
+    """
+    report={'Responses': [results[name]['rows'] for name in surveys],
+            'Correctly Entered PIDs': [results[name]['pidcounts']['valid'] for name in surveys],
+            'Matched': [results[name]['joinreport']['matched'] for name in surveys],
+            'Not in Data Record': [len(results[name]['joinreport']['unmatched']) for name in surveys],
+            'Entered More Than Once': [len(results[name]['joinreport']['duplicate']) for name in surveys]}
+    return pd.DataFrame(report, index=list(surveys))
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def print_join_report(name, joinreport, duplicate_pids):
+    """
+    Prints a short summary of a join so that any PIDs which could not be matched can be followed up.
+
+    Arguments:
+        name (str): The name of the questionnaire, e.g. 'CN' or 'POST'.
+        joinreport (dict): The report returned by join_qualtrics.
+        duplicate_pids (list): The PIDs which appear more than once in the data record.
+    """
+    print(name + ": " + str(joinreport['matched']) + " PIDs matched, " + str(len(joinreport['unmatched'])) + " not in the data record, "
+          + str(len(joinreport['duplicate'])) + " entered more than once")
+    if duplicate_pids:
+        print(name + ": only the first row was used for PIDs which appear more than once in the data record: " + ", ".join(map(str, duplicate_pids)))
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def find_add_matches(datarecord, datarecordpids, qualtricsdata):
+    """
+    Updates the datarecord dictionary with the data from matching PIDs in the qualtricsdata.
+
+    Arguments:
+        datarecord (dict): A dictionary of the data record.
+        datarecordpids (pd.Series): A Series containing the Participant IDs from the data record.
+        qualtricsdata (dict): A dictionary of dictionaries representing the entries in the questionnaire data.
+
+    Returns:
+        dict: The updated datarecord dictionary with merged data.
+    """
+    #Building the PID lookup once rather than searching datarecordpids for every entry
+    pidindex, duplicate_pids = build_pid_index(datarecordpids)
+    datarecord, joinreport = join_qualtrics(datarecord, pidindex, qualtricsdata)
+    return datarecord
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def normalise_pid(pid):
+    """
+    Tidies up a PID before looking for a close match, by making it uppercase and taking out anything that isn't a
+    letter or a number (e.g. spaces and dashes).
+
+    Arguments:
+        pid (str): A PID as it was entered.
+
+    Returns:
+        str: The tidied PID.
+    """
+    return ''.join(character for character in pid.upper() if character.isalnum())
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def pid_deletions(pid, maxdistance):
+    """
+    Gets every string that can be made by deleting up to maxdistance characters from pid. Two PIDs within maxdistance
+    typos of each other (a wrong, missing, extra or swapped character) always share at least one of these.
+
+    Arguments:
+        pid (str): The PID.
+        maxdistance (int): The most characters to delete.
+
+    Returns:
+        set: The PID itself and every string with up to maxdistance characters deleted.
+    """
+    deletions={pid}
+    current={pid}
+    for _ in range(maxdistance):
+        current={variant[:i]+variant[i+1:] for variant in current for i in range(len(variant))}
+        deletions|=current
+    return deletions
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def build_recovery_index(datarecordpids, maxdistance=1):
+    """
+    Builds the index used by recover_pids, which maps every deletion (see pid_deletions) of every PID in the data record
+    back to those PIDs. This means the close matches for an entered PID can be looked up directly instead of comparing
+    it against every PID in the data record.
+
+    Arguments:
+        datarecordpids (iterable): The PIDs in the data record.
+        maxdistance (int): The most typos a close match can have. 1 covers a wrong, missing, extra or swapped character.
+
+    Returns:
+        dict: A dictionary with the 'maxdistance', the 'deletions' index and the set of 'pids' in the data record.
+    """
+    deletions={}
+    pids={pid for pid in datarecordpids if isinstance(pid, str) and pid!='NAN'}
+    for pid in pids:
+        for variant in pid_deletions(pid, maxdistance):
+            deletions.setdefault(variant, []).append(pid)
+    return {'maxdistance': maxdistance, 'deletions': deletions, 'pids': pids}
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def pid_distance(pid, candidate):
+    """
+    Counts the typos between two PIDs: each wrong, missing or extra character or pair of swapped characters counts as
+    one, except for swapping two characters in CONFUSABLE_CHARACTERS (e.g. O and 0), which counts as a half.
+
+    Arguments:
+        pid (str): The PID as it was entered (tidied up with normalise_pid).
+        candidate (str): A PID from the data record.
+
+    Returns:
+        float: The number of typos.
+    """
+    confusable={pair for a, b in CONFUSABLE_CHARACTERS for pair in [(a, b), (b, a)]}
+    previous2=None
+    previous=[float(j) for j in range(len(candidate)+1)]
+    for i in range(1, len(pid)+1):
+        current=[float(i)]+[0.0]*len(candidate)
+        for j in range(1, len(candidate)+1):
+            if pid[i-1]==candidate[j-1]:
+                substitution=0.0
+            elif (pid[i-1], candidate[j-1]) in confusable:
+                substitution=0.5
+            else:
+                substitution=1.0
+            current[j]=min(previous[j]+1, current[j-1]+1, previous[j-1]+substitution)
+            #two characters the wrong way round
+            if i>1 and j>1 and pid[i-1]==candidate[j-2] and pid[i-2]==candidate[j-1]:
+                current[j]=min(current[j], previous2[j-2]+1)
+        previous2, previous=previous, current
+    return previous[-1]
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def recover_pids(pids, recoveryindex):
+    """
+    Suggests which PID in the data record was meant for each PID which couldn't be matched. Every candidate within the
+    index's maxdistance typos is scored, and the best ones are suggested with a confidence between 0 and 1 (1 for a PID
+    which only had spaces or lowercase letters, lower for more typos). If more than one PID in the data record is
+    equally close the suggestion is marked as ambiguous and it is never merged automatically.
+
+    Arguments:
+        pids (iterable): The PIDs which couldn't be matched.
+        recoveryindex (dict): The index from build_recovery_index.
+
+    Returns:
+        pd.DataFrame: One row per suggestion with the 'ParticipantID' as entered, the 'Candidate' from the data record,
+        the 'Distance' (number of typos), the 'Confidence' and whether it is 'Ambiguous'. PIDs with no candidate within
+        maxdistance aren't included.
+    """
+    maxdistance=recoveryindex['maxdistance']
+    proposals=[]
+    for pid in dict.fromkeys(pids):
+        if not isinstance(pid, str) or pid=='NAN':
+            continue
+        normalised=normalise_pid(pid)
+        candidates=set()
+        for variant in pid_deletions(normalised, maxdistance):
+            candidates.update(recoveryindex['deletions'].get(variant, ()))
+        scored=[(pid_distance(normalised, candidate), candidate) for candidate in candidates]
+        scored=[(distance, candidate) for distance, candidate in scored if distance<=maxdistance]
+        if not scored:
+            continue
+        best=min(distance for distance, candidate in scored)
+        bestcandidates=sorted(candidate for distance, candidate in scored if distance==best)
+        confidence=(1-best/(maxdistance+1))/len(bestcandidates)
+        for candidate in bestcandidates:
+            proposals.append({'ParticipantID': pid, 'Candidate': candidate, 'Distance': best,
+                              'Confidence': confidence, 'Ambiguous': len(bestcandidates)>1})
+    return pd.DataFrame(proposals, columns=['ParticipantID', 'Candidate', 'Distance', 'Confidence', 'Ambiguous'])
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def recover_pid_frame(qualtricsdataframe, pidindex, recoveryindex, automerge=None):
+    """
+    Looks for close matches (see recover_pids) for the PIDs in the questionnaire data which aren't in the data record.
+    If automerge is given, suggestions which aren't ambiguous and have at least that confidence are merged by changing
+    the PID to the one in the data record, so the entry gets matched.
+
+    Arguments:
+        qualtricsdataframe (pd.DataFrame): The questionnaire data.
+        pidindex (dict): A dictionary mapping each PID to the index of its row in the data record.
+        recoveryindex (dict): The index from build_recovery_index.
+        automerge (float): The confidence needed to merge a suggestion, or None to only suggest.
+
+    Returns:
+        tuple: A tuple containing two elements:
+            - qualtricsdataframe (pd.DataFrame): The questionnaire data, with the merged PIDs changed.
+            - proposals (pd.DataFrame): The suggestions from recover_pids, with the number of 'Entries' with that PID
+              and whether it was 'Merged'.
+    """
+    pids=qualtricsdataframe['ParticipantID']
+    unmatched=pids[~pids.isin(pidindex.keys())]
+    proposals=recover_pids(unmatched, recoveryindex)
+    proposals.insert(1, 'Entries', proposals['ParticipantID'].map(unmatched.value_counts()).astype('int64'))
+    proposals['Merged']=False
+    if automerge is not None:
+        proposals['Merged']=~proposals['Ambiguous'] & (proposals['Confidence']>=automerge)
+        merges=dict(zip(proposals.loc[proposals['Merged'], 'ParticipantID'], proposals.loc[proposals['Merged'], 'Candidate']))
+        if merges:
+            qualtricsdataframe=qualtricsdataframe.copy()
+            qualtricsdataframe['ParticipantID']=pids.map(merges).fillna(pids)
+    return qualtricsdataframe, proposals
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def participant_id_numbers(data_correct, data_incorrect):
+    """
+    Calculate participant ID statistics.
+    
+    This function takes two dictionaries, `data_correct` and `data_incorrect`, representing filtered questionnaire data
+    with correct and incorrect participant IDs, respectively. It calculates the number of incorrect participant IDs,
+    the number of correct participant IDs, and the percentage of incorrect participant IDs relative to the correct ones.
+    
+    Arguments:
+        data_correct (dict, pd.DataFrame or int): The filtered questionnaire data with correct participant IDs, or the number of them.
+        data_incorrect (dict, pd.DataFrame or int): The filtered questionnaire data with incorrect participant IDs, or the number of them.
+    
+    Returns:
+        tuple: A tuple containing three elements:
+            - incorrect (int): The number of incorrect participant IDs.
+            - correct (int): The number of correct participant IDs.
+            - percent (float): The percentage of incorrect participant IDs relative to the correct ones.
+    """
+    #the columnar mode passes the counts straight from count_pid_classes
+    incorrect=data_incorrect if isinstance(data_incorrect, int) else len(data_incorrect)
+    correct=data_correct if isinstance(data_correct, int) else len(data_correct)
+    #an empty export (e.g. before anyone has done the survey) has no percentage
+    percent=(incorrect/correct)*100 if correct else float('nan')
+    return incorrect, correct, percent
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def participant_id_format_info(CNdata_correct, CNdata_incorrect,POSTdata_correct, POSTdata_incorrect):
+    """
+   Generate participant ID format information summary.
+
+   This function takes four sets of dictionaries, `CNdata_correct`, `CNdata_incorrect`, `POSTdata_correct`,
+   and `POSTdata_incorrect`, representing filtered questionnaire data with correct and incorrect participant IDs,
+   both during and after the session. It calculates the number of correct and incorrect participant IDs, as well as
+   the percentage of incorrect participant IDs relative to the correct ones, for both the CN (Citizen Neuroscience)
+   and POST (Post Citizen Neuroscience) datasets.
+
+   Arguments:
+       CNdata_correct (dict): A dictionary of dictionaries representing the filtered CN questionnaire data with correct participant IDs during the session.
+       CNdata_incorrect (dict): A dictionary of dictionaries representing the filtered CN questionnaire data with incorrect participant IDs during the session.
+       POSTdata_correct (dict): A dictionary of dictionaries representing the filtered POST questionnaire data with correct participant IDs after the session.
+       POSTdata_incorrect (dict): A dictionary of dictionaries representing the filtered POST questionnaire data with incorrect participant IDs after the session.
+
+   Returns:
+       pd.DataFrame: A DataFrame summarizing the participant ID format information as follows:
+                     - Rows: 'During session', 'After session'
+                     - Columns: 'Number of Correctly Entered PIDs', 'Number of Incorrectly Entered PIDs', '%'
+   """
+    #Before and after
+    return pid_format_table({"During session": (CNdata_correct, CNdata_incorrect), "After session": (POSTdata_correct, POSTdata_incorrect)})
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def pid_format_table(surveycounts):
+    """
+    Makes the PID format table for any number of surveys, with a row for each.
+
+    Arguments:
+        surveycounts (dict): A dictionary mapping the row label of each survey (e.g. 'During session') to a tuple of its
+            correct and incorrect PIDs (dictionaries, dataframes or just the numbers, see participant_id_numbers).
+
+    Returns:
+        pd.DataFrame: The same columns as participant_id_format_info, with a row for each survey.
+    """
+    numbers=[participant_id_numbers(correct, incorrect) for correct, incorrect in surveycounts.values()]
+    #creating a dictionary of this data
+    summarydata={'Number of Correctly Entered PIDs': [correct for incorrect, correct, percent in numbers],
+                 'Number of Incorrectly Entered PIDs': [incorrect for incorrect, correct, percent in numbers],
+                 '%': [percent for incorrect, correct, percent in numbers]}
+    return pd.DataFrame(data=summarydata, index=list(surveycounts))
+
+#--------------------------------------------------------------------------------------------------------------------------------------------
+def compact_frame(dataframe, categoryratio=COMPACT_CATEGORY_RATIO):
+    """
+    Makes a dataframe take up a lot less memory by not storing each value as its own Python string:
+        - PIDs are stored as categories, so each PID is kept once and every row just has an integer code
+        - the progress and duration columns become nullable integers (Int8/Int32) and Finished becomes boolean
+        - task columns (COMPLETION_TASKS) which only have 'Y' or blank become True or blank
+        - any other text column with few different values (e.g. Likert answers and hair type codes) becomes categorical
+    Free text answers, which are mostly different, are left as they are.
+
+    Arguments:
+        dataframe (pd.DataFrame): The data record or questionnaire data.
+        categoryratio (float): A text column becomes categorical if it has at most this many different values per row.
+
+    Returns:
+        pd.DataFrame: The compact dataframe (a copy).
+    """
+    dataframe=dataframe.copy()
+    for position, column in enumerate(dataframe.columns):
+        values=dataframe.iloc[:, position]
+        name=str(column)
+        if name in ('Participant ID', 'ParticipantID'):
+            values=values.astype('category')
+        elif name.endswith('Progress'):
+            values=pd.to_numeric(values, errors='coerce').astype('Int8')
+        elif name.endswith('Duration (in seconds)'):
+            values=pd.to_numeric(values, errors='coerce').astype('Int32')
+        elif name.endswith('Finished') and values.dropna().isin([True, False]).all():
+            values=values.astype('boolean')
+        elif name in COMPLETION_TASKS.values() and values.dropna().eq('Y').all():
+            values=values.notna().astype('boolean').where(values.notna())
+        elif values.dtype==object and values.nunique()<=categoryratio*max(values.count(), 1):
+            values=values.astype('category')
+        else:
+            continue
+        dataframe.isetitem(position, values)
+    return dataframe
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def load_value_mappings(filename=VALUE_MAPPINGS_FILE):
+    """
+    Reads the value mappings, which say which answers get changed to what in which questions. Each survey version adds
+    new image codes, so they are kept in a .json file rather than here:
+
+        {"version": 1,
+         "mappings": {"hair types": {"survey": "CN", "columns": ["Q21", "Q22"], "values": {"IM_7NzSARqhuHLQW1M": "21_A"}}}}
+
+    The columns are the question numbers in that survey's export. Change the version whenever the mappings change.
+
+    Arguments:
+        filename (str): The .json file, defaults to VALUE_MAPPINGS_FILE (the one that comes with the package).
+
+    Returns:
+        dict: The mappings, with their 'version'.
+    """
+    with open(filename, encoding='utf-8') as file:
+        valuemappings=json.load(file)
+    if 'version' not in valuemappings or not isinstance(valuemappings.get('mappings'), dict):
+        raise ValueError("The value mappings " + filename + " need a 'version' and 'mappings'")
+    for name, mapping in valuemappings['mappings'].items():
+        missing=[key for key in VALUE_MAPPING_KEYS if key not in mapping]
+        if missing:
+            raise ValueError("The value mapping " + repr(name) + " in " + filename + " is missing " + ", ".join(missing))
+        if not isinstance(mapping['survey'], str):
+            raise ValueError("The value mapping " + repr(name) + " in " + filename + " has to name one survey (e.g. 'CN' or 'POST')")
+    return valuemappings
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def compile_value_mappings(valuemappings, CNnames, POSTnames, surveynames=None):
+    """
+    Turns the value mappings into one lookup table per column of the final data record, so they only need working out
+    once. The question numbers are renamed the same way as merge_surveys_frame does (each survey's names are used on
+    the whole data record after the ones before it). Mappings for surveys which aren't being merged are skipped.
+
+    Arguments:
+        valuemappings (dict): The mappings from load_value_mappings.
+        CNnames (dict): A dictionary mapping the question numbers from CN to desired names.
+        POSTnames (dict): A dictionary mapping the question numbers from POST to desired names.
+        surveynames (dict): The names of every survey (CN and POST too) in the order they are merged, if there are more
+            than the CN and POST ones.
+
+    Returns:
+        dict: A dictionary mapping each column name to a tuple of the old values (pd.Index) and the new values
+        (np.ndarray) in the same order.
+    """
+    if surveynames is None:
+        surveynames={'CN': CNnames, 'POST': POSTnames}
+    renames={survey: list(surveynames.values())[position:] for position, survey in enumerate(surveynames)}
+    columnvalues={}
+    for mapping in valuemappings['mappings'].values():
+        if mapping['survey'] not in renames:
+            continue
+        for column in mapping['columns']:
+            for names in renames[mapping['survey']]:
+                column=names.get(column, column)
+            columnvalues.setdefault(column, {}).update(mapping['values'])
+    return {column: (pd.Index(list(values)), np.array(list(values.values()), dtype=object))
+            for column, values in columnvalues.items()}
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def apply_value_mappings(dataframe, compiledmappings):
+    """
+    Changes the answers in the mapped columns using the tables from compile_value_mappings. Only those columns are
+    looked at, so it doesn't matter how many other columns (like free text answers) there are. Categorical columns (see
+    compact_frame) only have their categories changed.
+
+    Arguments:
+        dataframe (pd.DataFrame): The final data record, which is changed.
+        compiledmappings (dict): The tables from compile_value_mappings.
+
+    Returns:
+        pd.DataFrame: The same dataframe.
+    """
+    for column, (oldvalues, newvalues) in compiledmappings.items():
+        for position in np.flatnonzero(dataframe.columns==column):
+            values=dataframe.iloc[:, position]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                lookup=oldvalues.get_indexer(values.cat.categories)
+                categories=np.where(lookup>=0, newvalues[lookup], values.cat.categories.to_numpy(dtype=object))
+                #two old values turning into the same new one can't be done by renaming
+                if pd.Index(categories).is_unique:
+                    values=values.cat.rename_categories(categories)
+                else:
+                    values=pd.Series(categories[values.cat.codes.to_numpy()], index=values.index).where(values.notna()).astype('category')
+            else:
+                lookup=oldvalues.get_indexer(values)
+                found=lookup>=0
+                if not found.any():
+                    continue
+                changed=values.to_numpy(dtype=object, copy=True)
+                changed[found]=newvalues[lookup[found]]
+                values=pd.Series(changed, index=values.index, name=values.name)
+            dataframe.isetitem(position, values)
+    return dataframe
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def completion_categories(names, plural, neither):
+    """
+    Works out the rows or columns of the completion table for a list of tasks or surveys. Each category is stored as a
+    number where bit i is set if the i-th task/survey was completed, so for two tasks 1 is the first one only, 2 is the
+    second one only, 3 is both and 0 is neither.
+
+    Arguments:
+        names (list): The names of the tasks or surveys, e.g. ['RS', 'Audio'].
+        plural (str): The word used in the label for doing all of them, e.g. 'tasks' gives 'Both tasks'/'All tasks'.
+        neither (str): The label for doing none of them, e.g. 'Neither Tasks'.
+
+    Returns:
+        list: A list of (label, bits) tuples in the order they appear in the table.
+    """
+    categories=[]
+    for size in range(1, len(names)+1):
+        for combo in combinations(range(len(names)), size):
+            bits=sum(1 << i for i in combo)
+            if size==1:
+                label=names[combo[0]] + ' only'
+            elif size==len(names):
+                label=('Both ' if size==2 else 'All ') + plural
+            else:
+                label=' and '.join(names[i] for i in combo)
+            categories.append((label, bits))
+    categories.append((neither, 0))
+    return categories
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def encode_completion(FINALdatarecordframe, tasks=None, surveys=None, threshold=100):
+    """
+    Gives every row of the data record a single number saying which tasks and which surveys it has completed, so that
+    the completion table can be made by counting these numbers instead of filtering the data record for every cell.
+    A task counts as done if its column is 'Y' (or True) and not done if it is blank. A survey counts as done if its progress is
+    at least the threshold and not done if it is blank. Rows with anything else (e.g. a survey which was only half
+    finished) aren't counted anywhere, the same as in the original table.
+
+    Arguments:
+        FINALdatarecordframe (pd.DataFrame): The DataFrame containing completion data and progress for different tasks.
+        tasks (dict): A dictionary mapping the name of each task to its column. Defaults to COMPLETION_TASKS.
+        surveys (dict): A dictionary mapping the name of each survey to its progress column. Defaults to COMPLETION_SURVEYS.
+        threshold (int): The progress needed for a survey to count as completed.
+
+    Returns:
+        np.ndarray: A number for every row, with the task bits above the survey bits, or -1 if the row isn't counted.
+    """
+    if tasks is None:
+        tasks=COMPLETION_TASKS
+    if surveys is None:
+        surveys=COMPLETION_SURVEYS
+    rows=len(FINALdatarecordframe)
+    taskbits=np.zeros(rows, dtype=np.int64)
+    surveybits=np.zeros(rows, dtype=np.int64)
+    counted=np.ones(rows, dtype=bool)
+    #a column which isn't there yet (e.g. nobody has matched a survey) counts as blank for everyone
+    blank=pd.Series(np.nan, index=FINALdatarecordframe.index, dtype=object)
+    for i, column in enumerate(tasks.values()):
+        values=FINALdatarecordframe.get(column, blank)
+        #compact_frame turns the 'Y's into True
+        if pd.api.types.is_bool_dtype(values):
+            done=values.fillna(False).to_numpy(dtype=bool)
+        else:
+            done=(values=='Y').to_numpy(dtype=bool)
+        taskbits|=done.astype(np.int64) << i
+        counted&=done | values.isna().to_numpy()
+    for i, column in enumerate(surveys.values()):
+        values=FINALdatarecordframe.get(column, blank)
+        #the nullable integers from compact_frame give <NA> rather than False for blanks
+        done=(pd.to_numeric(values, errors='coerce')>=threshold).fillna(False).to_numpy(dtype=bool)
+        surveybits|=done.astype(np.int64) << i
+        counted&=done | values.isna().to_numpy()
+    codes=(taskbits << len(surveys)) | surveybits
+    codes[~counted]=-1
+    return codes
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def completion_table(codes, tasks=None, surveys=None, weights=None):
+    """
+    Counts the numbers from encode_completion and puts them into the completion table. The numbers only need working out
+    once, so a table for part of the data record (e.g. one school) can be made with completion_table(codes[mask]).
+
+    Arguments:
+        codes (np.ndarray): The numbers returned by encode_completion.
+        tasks (dict): The same tasks that were given to encode_completion. Defaults to COMPLETION_TASKS.
+        surveys (dict): The same surveys that were given to encode_completion. Defaults to COMPLETION_SURVEYS.
+        weights (np.ndarray): If given, how many rows each number stands for (e.g. when they have already been counted).
+
+    Returns:
+        pd.DataFrame: A DataFrame with a row for each combination of tasks and a column for each combination of surveys.
+    """
+    if tasks is None:
+        tasks=COMPLETION_TASKS
+    if surveys is None:
+        surveys=COMPLETION_SURVEYS
+    codes=np.asarray(codes)
+    counted=codes>=0
+    counts=np.bincount(codes[counted], None if weights is None else np.asarray(weights)[counted],
+                       minlength=2**(len(tasks)+len(surveys))).reshape(2**len(tasks), 2**len(surveys))
+    taskcategories=completion_categories(list(tasks), 'tasks', 'Neither Tasks')
+    surveycategories=completion_categories(list(surveys), 'surveys', 'Neither survey')
+    table=[[int(counts[taskbits, surveybits]) for label, surveybits in surveycategories] for label, taskbits in taskcategories]
+    #doing neither task and neither survey isn't counted
+    table[-1][-1]='N/A'
+    return pd.DataFrame(data=table, index=[label for label, bits in taskcategories], columns=[label for label, bits in surveycategories])
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def completion_data_summary(FINALdatarecordframe, tasks=None, surveys=None, threshold=100):
+    
+    """
+    Generates a summary table of completion data based on the provided data record frame.
+    
+    Arguments:
+        FINALdatarecordframe (pd.DataFrame): The DataFrame containing completion data and progress for different tasks.
+        tasks (dict): A dictionary mapping the name of each task to its column. Defaults to COMPLETION_TASKS.
+        surveys (dict): A dictionary mapping the name of each survey to its progress column. Defaults to COMPLETION_SURVEYS.
+        threshold (int): The progress needed for a survey to count as completed.
+    
+    Returns:
+        pd.DataFrame: A DataFrame summarizing the completion data as follows:
+                     - Rows: 'RS only', 'Audio only', 'Both tasks', 'Neither Tasks'
+                     - Columns: 'CN only', 'Post CN only', 'Both surveys', 'Neither survey'
+    """
+    codes=encode_completion(FINALdatarecordframe, tasks, surveys, threshold)
+    completiondata_summary=completion_table(codes, tasks, surveys)
+    return completiondata_summary
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def new_prefix_sums(width):
+    """
+    Makes an empty running total of some counts (e.g. one for each completion category) by day. Row i of 'sums' is the
+    total of every day before start+i, so the total between any two days is one subtraction however many days there
+    are. The array has room for more days than are used so adding the next day doesn't copy it every time.
+
+    Arguments:
+        width (int): The number of different things counted.
+
+    Returns:
+        dict: The running totals, with the first day ('start'), the number of 'days', the 'sums' and the counts for
+        anything without a date ('undated').
+    """
+    return {'start': None, 'days': 0, 'sums': np.zeros((1, width), dtype=np.int64), 'undated': np.zeros(width, dtype=np.int64)}
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def add_prefix_counts(prefixsums, dates, columns, weights=None):
+    """
+    Adds some things to the running totals by the day they happened. Only the days from the earliest one added onwards
+    change, so adding a new day on the end just adds one row.
+
+    Arguments:
+        prefixsums (dict): The running totals from new_prefix_sums, changed in place.
+        dates (array-like): The date of each thing, anything which isn't a date is counted in 'undated'.
+        columns (np.ndarray): What each thing counts towards (the column of 'sums'), -1 for not counted.
+        weights (np.ndarray): How much each thing counts, e.g. -1 to take something back out. Defaults to 1.
+
+    Returns:
+        dict: The same running totals.
+    """
+    width=prefixsums['sums'].shape[1]
+    days=pd.to_datetime(pd.Series(dates, dtype=object), errors='coerce').dt.normalize().to_numpy(dtype='datetime64[D]')
+    columns=np.asarray(columns, dtype=np.int64)
+    weights=np.ones(len(columns), dtype=np.int64) if weights is None else np.asarray(weights, dtype=np.int64)
+    counted=columns>=0
+    undated=np.isnat(days)
+    prefixsums['undated']+=np.bincount(columns[counted & undated], weights[counted & undated], minlength=width).astype(np.int64)
+    dated=counted & ~undated
+    if not dated.any():
+        return prefixsums
+    days, columns, weights=days[dated], columns[dated], weights[dated]
+    first=days.min()
+    if prefixsums['start'] is None:
+        prefixsums['start']=first
+    elif first<prefixsums['start']:
+        #nothing happened before the old start, so the days before it all have a total of nothing
+        shift=int((prefixsums['start']-first)/np.timedelta64(1, 'D'))
+        prefixsums['sums']=np.concatenate([np.zeros((shift, width), dtype=np.int64), prefixsums['sums']])
+        prefixsums['start'], prefixsums['days']=first, prefixsums['days']+shift
+    offsets=((days-prefixsums['start'])/np.timedelta64(1, 'D')).astype(np.int64)
+    needed=int(offsets.max())+1
+    if needed>prefixsums['days']:
+        if needed+1>len(prefixsums['sums']):
+            #doubling the room each time it runs out, so adding a day at a time only copies the array now and then
+            sums=np.zeros((max(needed+1, 2*len(prefixsums['sums'])), width), dtype=np.int64)
+            sums[:prefixsums['days']+1]=prefixsums['sums'][:prefixsums['days']+1]
+            prefixsums['sums']=sums
+        prefixsums['sums'][prefixsums['days']+1:needed+1]=prefixsums['sums'][prefixsums['days']]
+        prefixsums['days']=needed
+    lowest=int(offsets.min())
+    span=prefixsums['days']-lowest
+    daily=np.bincount((offsets-lowest)*width+columns, weights, minlength=span*width).astype(np.int64).reshape(span, width)
+    prefixsums['sums'][lowest+1:prefixsums['days']+1]+=np.cumsum(daily, axis=0)
+    return prefixsums
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def prefix_counts_between(prefixsums, start=None, end=None):
+    """
+    Gets the counts between two days (including both) from the running totals, which takes the same time however long
+    the range is.
+
+    Arguments:
+        prefixsums (dict): The running totals from add_prefix_counts.
+        start (str or pd.Timestamp): The first day, defaults to the first one there is.
+        end (str or pd.Timestamp): The last day, defaults to the last one there is.
+
+    Returns:
+        np.ndarray: The count for each column, not including anything without a date.
+    """
+    sums, days=prefixsums['sums'], prefixsums['days']
+    if prefixsums['start'] is None:
+        return np.zeros(sums.shape[1], dtype=np.int64)
+    def offset(date, default):
+        if date is None:
+            return default
+        return int((np.datetime64(pd.Timestamp(date).normalize(), 'D')-prefixsums['start'])/np.timedelta64(1, 'D'))
+    first=min(max(offset(start, 0), 0), days)
+    last=min(max(offset(end, days-1)+1, first), days)
+    return sums[last]-sums[first]
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def trend_row_dates(FINALdatarecordframe, trenddates, matcheddates=None):
+    """
+    Gets the date each row of the data record is counted on in the completion trends.
+
+    Arguments:
+        FINALdatarecordframe (pd.DataFrame): The final data record.
+        trenddates (str): 'recorded' for the first time the participant responded to any of the surveys, or 'session'
+            for the date in the data record's SESSION_DATE_COLUMN.
+        matcheddates (list): For 'recorded', the recorded dates of each survey's picked entries, indexed by data record
+            row (see read_and_match_surveys).
+
+    Returns:
+        pd.Series: The date for each row, NaT if it doesn't have one (e.g. nobody matched it).
+    """
+    if trenddates not in TREND_DATES:
+        raise ValueError("The trend dates have to be one of " + ", ".join(TREND_DATES) + ", not " + repr(trenddates))
+    if trenddates=='session':
+        if SESSION_DATE_COLUMN not in FINALdatarecordframe.columns:
+            raise ValueError("The data record needs a " + repr(SESSION_DATE_COLUMN) + " column for trends by session date")
+        return pd.to_datetime(FINALdatarecordframe[SESSION_DATE_COLUMN].astype(object), errors='coerce', dayfirst=True)
+    dates=[pd.to_datetime(surveydates.astype(object), errors='coerce').reindex(FINALdatarecordframe.index) for surveydates in matcheddates or []]
+    if not dates:
+        return pd.Series(pd.NaT, index=FINALdatarecordframe.index)
+    return pd.concat(dates, axis=1).min(axis=1)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def build_trends(trenddates, codes, rowdates, responses, tasks=None, surveys=None):
+    """
+    Makes the completion trends, which keep running totals by day of the completion categories (the numbers from
+    encode_completion) and of the correctly and incorrectly entered PIDs for each survey. The tables for any range of
+    days can then be made straight away with trend_summary, and more days added with update_trends.
+
+    Arguments:
+        trenddates (str): What the rows are dated by, one of TREND_DATES (just kept to say what the trends are).
+        codes (np.ndarray): The completion number of every row of the data record.
+        rowdates (pd.Series): The date of every row, from trend_row_dates.
+        responses (dict): For each survey's row in the PID format table (e.g. 'During session'), a tuple of the date
+            every response was recorded and whether its PID is valid.
+        tasks (dict): The tasks given to encode_completion. Defaults to COMPLETION_TASKS.
+        surveys (dict): The surveys given to encode_completion. Defaults to COMPLETION_SURVEYS.
+
+    Returns:
+        dict: The trends, with the 'completion' and 'pidformat' running totals (see new_prefix_sums), the number and
+        date each data record row is counted with ('rows') and how many of each survey's responses are counted.
+    """
+    tasks=COMPLETION_TASKS if tasks is None else tasks
+    surveys=COMPLETION_SURVEYS if surveys is None else surveys
+    trends={'dates': trenddates, 'tasks': tasks, 'surveys': surveys, 'labels': list(responses),
+            'completion': new_prefix_sums(2**(len(tasks)+len(surveys))), 'pidformat': new_prefix_sums(2*len(responses)),
+            'rows': pd.DataFrame({'code': pd.Series(dtype=np.int64), 'date': pd.Series(dtype='datetime64[ns]')}),
+            'responses': dict.fromkeys(responses, 0)}
+    return update_trends(trends, codes, rowdates, responses)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def update_trends(trends, codes=None, rowdates=None, responses=None, oldcodes=None, oldrowdates=None):
+    """
+    Adds to the completion trends, e.g. a new day of responses, which only adds a row on the end of each running total.
+    Rows of the data record whose completion has changed are moved by taking their old number back out.
+
+    Arguments:
+        trends (dict): The trends from build_trends, changed in place.
+        codes (np.ndarray): The completion numbers of the new or changed rows.
+        rowdates (pd.Series): Their dates.
+        responses (dict): The new responses to each survey, the same as for build_trends.
+        oldcodes (np.ndarray): The numbers the changed rows had before.
+        oldrowdates (pd.Series): The dates the changed rows had before.
+
+    Returns:
+        dict: The same trends.
+    """
+    if codes is not None:
+        add_prefix_counts(trends['completion'], rowdates, codes)
+    if oldcodes is not None:
+        add_prefix_counts(trends['completion'], oldrowdates, oldcodes, -np.ones(len(oldcodes), dtype=np.int64))
+    if codes is not None and 'rows' in trends:
+        #keeping what each row is counted as, so extend_trends can tell which rows have changed next time
+        rows=pd.DataFrame({'code': np.asarray(codes, dtype=np.int64),
+                           'date': pd.to_datetime(pd.Series(rowdates, dtype=object), errors='coerce').to_numpy(dtype='datetime64[ns]')},
+                          index=pd.Series(rowdates).index)
+        trends['rows']=pd.concat([trends['rows'].drop(rows.index, errors='ignore'), rows]).sort_index()
+    for number, (label, (dates, valid)) in enumerate((responses or {}).items()):
+        #each survey has a column for its correct PIDs and one for its incorrect ones
+        add_prefix_counts(trends['pidformat'], dates, 2*number+1-np.asarray(valid, dtype=np.int64))
+        if 'responses' in trends:
+            trends['responses'][label]=trends['responses'].get(label, 0)+len(valid)
+    return trends
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def extend_trends(trends, trenddates, codes, rowdates, responses, tasks=None, surveys=None):
+    """
+    Brings trends saved by an earlier run up to date through update_trends, so the running totals don't have to be
+    made again. Qualtrics adds new responses to the bottom of an export (see read_appended_rows), so only the
+    responses after the ones already counted are added, whatever their date (the recorded dates in an export aren't
+    always in order). Only the data record rows which are new or whose number or date has changed are moved. If the
+    trends were made with different settings, or an export or the data record has fewer rows than before, they are
+    made again from scratch with build_trends.
+
+    Arguments:
+        trends (dict): The trends from the earlier run (see build_trends), changed in place.
+        trenddates, codes, rowdates, responses, tasks, surveys: Everything for this run, the same as for build_trends.
+
+    Returns:
+        dict: The trends, the same as build_trends would make from this run's data.
+    """
+    tasks=COMPLETION_TASKS if tasks is None else tasks
+    surveys=COMPLETION_SURVEYS if surveys is None else surveys
+    settings=(trenddates, tasks, surveys, list(responses))
+    if (trends.get('dates'), trends.get('tasks'), trends.get('surveys'), trends.get('labels'))!=settings or 'responses' not in trends \
+       or not trends['rows'].index.isin(rowdates.index).all() or any(len(valid)<trends['responses'][label] for label, (dates, valid) in responses.items()):
+        return build_trends(trenddates, codes, rowdates, responses, tasks, surveys)
+    dates=pd.Series(pd.to_datetime(rowdates.astype(object), errors='coerce').to_numpy(dtype='datetime64[ns]'), index=rowdates.index)
+    old=trends['rows'].reindex(rowdates.index)
+    samedate=(old['date']==dates) | (old['date'].isna() & dates.isna())
+    changed=(old['code'].isna() | (old['code']!=codes) | ~samedate).to_numpy()
+    moved=changed & old['code'].notna().to_numpy()
+    newresponses={label: (np.asarray(dates, dtype=object)[trends['responses'][label]:], np.asarray(valid)[trends['responses'][label]:])
+                  for label, (dates, valid) in responses.items()}
+    return update_trends(trends, np.asarray(codes)[changed], rowdates[changed], newresponses,
+                         old['code'][moved].to_numpy(dtype=np.int64), old['date'][moved])
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def trend_summary(trends, start=None, end=None):
+    """
+    Makes the PID format and completion tables for a range of days from the trends, without going through the data
+    record again.
+
+    Arguments:
+        trends (dict): The trends from build_trends.
+        start (str or pd.Timestamp): The first day, defaults to the first one there is.
+        end (str or pd.Timestamp): The last day (included), defaults to the last one there is.
+
+    Returns:
+        tuple: A tuple containing two elements:
+            - pidformat_summaryinfo (pd.DataFrame): The PID format table for the responses recorded in the range.
+            - completiondata_summaryinfo (pd.DataFrame): The completion table for the rows dated in the range.
+    """
+    pidcounts=prefix_counts_between(trends['pidformat'], start, end)
+    pidformat_summaryinfo=pid_format_table({label: (int(pidcounts[2*number]), int(pidcounts[2*number+1])) for number, label in enumerate(trends['labels'])})
+    completioncounts=prefix_counts_between(trends['completion'], start, end)
+    completiondata_summaryinfo=completion_table(np.arange(len(completioncounts)), trends['tasks'], trends['surveys'], completioncounts)
+    return pidformat_summaryinfo, completiondata_summaryinfo
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def completion_trend(trends, frequency='W'):
+    """
+    Makes a table of how the completion and PID format numbers changed over time, one row per week (or month etc.),
+    from the running totals so each row only takes a couple of subtractions.
+
+    Arguments:
+        trends (dict): The trends from build_trends.
+        frequency (str): How long each row covers, as a pandas period ('D', 'W', 'M', ...).
+
+    Returns:
+        pd.DataFrame: For each period, the number of 'Participants' dated in it, how many of them completed each survey
+        and what % that is, and the % of incorrectly entered PIDs in each survey's responses.
+    """
+    starts=[prefixsums['start'] for prefixsums in (trends['completion'], trends['pidformat']) if prefixsums['start'] is not None]
+    if not starts:
+        return pd.DataFrame()
+    ends=[prefixsums['start']+prefixsums['days']-1 for prefixsums in (trends['completion'], trends['pidformat']) if prefixsums['start'] is not None]
+    periods=pd.period_range(pd.Timestamp(min(starts)), pd.Timestamp(max(ends)), freq=frequency)
+    codes=np.arange(trends['completion']['sums'].shape[1])
+    rows=[]
+    for period in periods:
+        completioncounts=prefix_counts_between(trends['completion'], period.start_time, period.end_time)
+        pidcounts=prefix_counts_between(trends['pidformat'], period.start_time, period.end_time)
+        participants=int(completioncounts.sum())
+        row={'Participants': participants}
+        for number, survey in enumerate(trends['surveys']):
+            completed=int(completioncounts[((codes >> number) & 1)==1].sum())
+            row[survey + ' completed']=completed
+            row[survey + ' %']=completed/participants*100 if participants else np.nan
+        for number, label in enumerate(trends['labels']):
+            responses=int(pidcounts[2*number]+pidcounts[2*number+1])
+            row[label + ' incorrect PIDs %']=pidcounts[2*number+1]/responses*100 if responses else np.nan
+        rows.append(row)
+    return pd.DataFrame(rows, index=periods.astype(str))
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def new_profile(tracememory=True):
+    """
+    Makes an empty profile to pass to get_completion_data, which then records how long each stage takes, how much CPU
+    time and memory it uses and how many rows go in and come out (see start_stage). Save it with save_profile or
+    save_trace once the run has finished.
+
+    Arguments:
+        tracememory (bool): If True the peak memory of each stage is measured with tracemalloc. This makes everything
+            run slower, so turn it off if only the times are wanted.
+
+    Returns:
+        dict: The profile.
+    """
+    startedtracing=tracememory and not tracemalloc.is_tracing()
+    if startedtracing:
+        tracemalloc.start()
+    return {'stages': [], 'active': [], 'lock': threading.Lock(), 'start': time.perf_counter(),
+            'tracememory': tracememory, 'startedtracing': startedtracing}
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def max_rss_bytes():
+    """
+    Gets the most memory the process has used so far according to the operating system, which (unlike tracemalloc)
+    includes memory used by numpy, pandas and pyarrow outside of Python.
+
+    Returns:
+        int: The number of bytes, or None on Windows where the resource module isn't available.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    #Linux gives this in kilobytes and macOS gives it in bytes
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*(1 if sys.platform=='darwin' else 1024)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def start_stage(profile, name, rowsin=None, detail=None):
+    """
+    Starts timing a stage of the pipeline. Stages can overlap (e.g. files being read in different threads) and be inside
+    other stages, the peak memory of each one is the most memory used at any point while it was running.
+
+    Arguments:
+        profile (dict): The profile from new_profile, or None to not record anything.
+        name (str): The name of the stage, e.g. 'read_qualtrics_data'.
+        rowsin (int): The number of rows going into the stage, if it has any.
+        detail (str): Anything else worth knowing, e.g. which questionnaire it was.
+
+    Returns:
+        dict: The record for the stage, to give to end_stage.
+    """
+    record={'stage': name, 'detail': detail, 'thread': threading.current_thread().name, 'rows_in': rowsin, 'rows_out': None}
+    if profile is None:
+        return record
+    with profile['lock']:
+        if profile['tracememory']:
+            #the peak so far belongs to the stages which are already running, then it starts again for this one
+            current, peak=tracemalloc.get_traced_memory()
+            for active in profile['active']:
+                active['_peak']=max(active['_peak'], peak)
+            tracemalloc.reset_peak()
+            record['memory_start_bytes']=current
+            record['_peak']=current
+        profile['active'].append(record)
+    record['_threadid']=threading.get_ident()
+    record['_wall']=time.perf_counter()
+    record['_cpu']=time.process_time()
+    record['_threadcpu']=time.thread_time()
+    return record
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def end_stage(profile, record, rowsout=None):
+    """
+    Finishes timing a stage started with start_stage and adds it to the profile.
+
+    Arguments:
+        profile (dict): The profile from new_profile, or None to not record anything.
+        record (dict): The record from start_stage.
+        rowsout (int): The number of rows coming out of the stage.
+
+    Returns:
+        dict: The finished record, with the 'wall_seconds' (from a clock that can't go backwards), 'cpu_seconds' (for
+        the whole process), 'thread_cpu_seconds' (just the thread it ran in), 'peak_memory_bytes' and 'max_rss_bytes'.
+    """
+    if rowsout is not None:
+        record['rows_out']=rowsout
+    if profile is None:
+        return record
+    wall=time.perf_counter()
+    record['start_seconds']=record['_wall']-profile['start']
+    record['wall_seconds']=wall-record['_wall']
+    record['cpu_seconds']=time.process_time()-record['_cpu']
+    #the thread time only means something if the stage finished in the thread it started in
+    record['thread_cpu_seconds']=time.thread_time()-record['_threadcpu'] if threading.get_ident()==record['_threadid'] else None
+    with profile['lock']:
+        if profile['tracememory']:
+            peak=tracemalloc.get_traced_memory()[1]
+            for active in profile['active']:
+                active['_peak']=max(active['_peak'], peak)
+            tracemalloc.reset_peak()
+            record['peak_memory_bytes']=record['_peak']
+        profile['active'].remove(record)
+        record['max_rss_bytes']=max_rss_bytes()
+        profile['stages'].append(record)
+    return record
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+@contextmanager
+def profile_stage(profile, name, rowsin=None, detail=None):
+    """
+    Times the code inside a with block as a stage (see start_stage). Set record['rows_out'] inside the block to record
+    the number of rows that came out.
+
+    Arguments:
+        profile (dict): The profile from new_profile, or None to not record anything.
+        name (str): The name of the stage.
+        rowsin (int): The number of rows going into the stage.
+        detail (str): Anything else worth knowing.
+
+    Yields:
+        dict: The record for the stage.
+    """
+    record=start_stage(profile, name, rowsin, detail)
+    try:
+        yield record
+    finally:
+        end_stage(profile, record)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def count_rows(result):
+    """
+    Works out how many rows a stage gave back, whether it's a dataframe, a dictionary of entries or a tuple starting
+    with one of those.
+
+    Arguments:
+        result: Whatever the stage returned.
+
+    Returns:
+        int: The number of rows, or None if it can't be worked out.
+    """
+    if isinstance(result, tuple) and result:
+        result=result[0]
+    if isinstance(result, (pd.DataFrame, pd.Series, dict, list)):
+        return len(result)
+    return None
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def profiled(profile, name, detail, function, *args):
+    """
+    Runs function(*args) as a stage (see start_stage), counting the rows it gives back with count_rows.
+
+    Arguments:
+        profile (dict): The profile from new_profile, or None to not record anything.
+        name (str): The name of the stage.
+        detail (str): Anything else worth knowing.
+        function (callable): The function to run.
+        *args: The arguments for function.
+
+    Returns:
+        Whatever function returns.
+    """
+    with profile_stage(profile, name, detail=detail) as record:
+        result=function(*args)
+        record['rows_out']=count_rows(result)
+    return result
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def submit_stage(pool, profile, name, detail, function, *args):
+    """
+    Submits function(*args) to a pool as a stage. In a thread pool the stage is timed in the thread that runs it, but
+    the profile can't be sent to another process, so in a process pool it is timed from being submitted until its
+    result gets back (and the CPU time and memory are only for this process).
+
+    Arguments:
+        pool (concurrent.futures.Executor): The pool from input_pool.
+        profile (dict): The profile from new_profile, or None to not record anything.
+        name (str) / detail (str): The name of the stage and anything else worth knowing.
+        function (callable): The function to run.
+        *args: The arguments for function.
+
+    Returns:
+        concurrent.futures.Future: The future for the result.
+    """
+    if profile is None:
+        return pool.submit(function, *args)
+    if isinstance(pool, ProcessPoolExecutor):
+        record=start_stage(profile, name, detail=detail)
+        future=pool.submit(function, *args)
+        future.add_done_callback(lambda done: end_stage(profile, record, None if done.cancelled() or done.exception() else count_rows(done.result())))
+        return future
+    return pool.submit(profiled, profile, name, detail, function, *args)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def profile_frame(profile):
+    """
+    Puts the finished stages of a profile into a table, in the order they started.
+
+    Arguments:
+        profile (dict): The profile from new_profile.
+
+    Returns:
+        pd.DataFrame: A row for each stage.
+    """
+    columns=['stage', 'detail', 'thread', 'start_seconds', 'wall_seconds', 'cpu_seconds', 'thread_cpu_seconds',
+             'rows_in', 'rows_out', 'memory_start_bytes', 'peak_memory_bytes', 'max_rss_bytes']
+    with profile['lock']:
+        stages=sorted(profile['stages'], key=lambda record: record['start_seconds'])
+    table=pd.DataFrame([{column: record.get(column) for column in columns} for record in stages], columns=columns)
+    #stages without rows would turn the counts into floats otherwise
+    table[['rows_in', 'rows_out']]=table[['rows_in', 'rows_out']].astype('Int64')
+    return table
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def finish_profile(profile):
+    """
+    Stops tracemalloc if new_profile started it. Call this once nothing else is going to be recorded.
+
+    Arguments:
+        profile (dict): The profile from new_profile.
+    """
+    if profile['startedtracing'] and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    profile['startedtracing']=False
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def save_profile(profile, filename):
+    """
+    Saves the stages of a profile as a .json file (a list with an object for each stage) or a .csv file (a row for each
+    stage), depending on the file extension.
+
+    Arguments:
+        profile (dict): The profile from new_profile.
+        filename (str): The file path, ending in .json or .csv.
+    """
+    table=profile_frame(profile)
+    if filename.lower().endswith('.json'):
+        #going through pandas' json so numpy numbers and NaN are written properly
+        with open(filename, 'w') as file:
+            file.write(table.to_json(orient='records', indent=1))
+    elif filename.lower().endswith('.csv'):
+        table.to_csv(filename, index=False)
+    else:
+        raise ValueError("The profile can only be saved as .json or .csv, not " + filename)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def save_trace(profile, filename):
+    """
+    Saves the stages of a profile as a trace file (the Chrome trace event format), which can be opened in
+    chrome://tracing or https://ui.perfetto.dev to see when each stage ran in each thread.
+
+    Arguments:
+        profile (dict): The profile from new_profile.
+        filename (str): The file path, usually ending in .json.
+    """
+    table=profile_frame(profile)
+    threadids={thread: i for i, thread in enumerate(dict.fromkeys(table['thread']))}
+    events=[{'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': i, 'args': {'name': thread}} for thread, i in threadids.items()]
+    for record in json.loads(table.to_json(orient='records')):
+        events.append({'name': record['stage'] if record['detail'] is None else record['stage'] + ' ' + record['detail'],
+                       'cat': 'pipeline', 'ph': 'X', 'pid': os.getpid(), 'tid': threadids[record['thread']],
+                       'ts': record['start_seconds']*1e6, 'dur': record['wall_seconds']*1e6,
+                       'args': {key: value for key, value in record.items() if key not in ('stage', 'detail', 'thread', 'start_seconds', 'wall_seconds')}})
+    with open(filename, 'w') as file:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def input_pool(workers=1, processes=False):
+    """
+    Makes the pool used to read the input files at the same time.
+
+    Arguments:
+        workers (int): The number of files which can be read at once. 1 reads them one after another like before.
+        processes (bool): If True each file is read in its own process instead of a thread, which gets round Python
+            only running one thread at a time but means the data has to be copied back to the main process.
+
+    Returns:
+        concurrent.futures.Executor: The pool, to be used in a with statement.
+    """
+    if processes:
+        return ProcessPoolExecutor(max_workers=workers)
+    return ThreadPoolExecutor(max_workers=workers)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def read_survey_frame(filenameQualtrics, cachedir=None, names=None, survey=None, keep=()):
+    """
+    Reads, cleans and checks the PIDs of one questionnaire export, so all of it can be done in a worker of input_pool.
+
+    Arguments:
+        filenameQualtrics (str): The file path for either the CN or the Post CN questionnaire.
+        cachedir (str): If given, the cleaned data is cached here (see read_cached).
+        names (dict): The names the columns will be given, so the cache is redone if they change.
+        survey (dict): The survey's entry in the registry or its name, see qualtrics_columns.
+        keep (list): Any of the POINTLESS_COLUMNS which should be read anyway, see read_qualtrics_frame.
+
+    Returns:
+        tuple: The same three elements as filter_qualtrics_frame.
+    """
+    options={**({'survey': survey} if survey else {}), **({'keep': list(keep)} if keep else {})}
+    return filter_qualtrics_frame(read_cached(read_qualtrics_frame, filenameQualtrics, cachedir, names, options=options))
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def read_and_match_surveys(filenameDatarecord, surveys, overwrite=True, cachedir=None, workers=1, processes=False, maxdistance=None, automerge=None, profile=None, compact=False,
+                           duplicatepolicy=None, recordeddates=False):
+    """
+    Reads the data record and the questionnaire exports in input_pool and matches each questionnaire's PIDs as soon as
+    both it and the data record have been read, without waiting for the other questionnaires. The results are always
+    given back in the same order as surveys, whichever file finishes first.
+
+    Arguments:
+        filenameDatarecord (str): The file path for the data record.
+        surveys (dict): A dictionary mapping the name of each questionnaire (e.g. 'CN') to its (file path, names) or
+            (file path, names, entry in the survey registry). Without an entry the name has to be in SURVEY_REGISTRY.
+        overwrite (bool): If True a later entry with the same PID overwrites an earlier one, otherwise the first is kept.
+        cachedir (str): If given, the cleaned .csv files are cached here (see read_cached).
+        workers (int): The number of files which can be read at once.
+        processes (bool): If True the files are read in processes instead of threads.
+        maxdistance (int): If given, close matches within this many typos are looked for for the PIDs which aren't in
+            the data record (see recover_pid_frame).
+        automerge (float): The confidence needed for a close match to be merged, or None to only suggest them.
+        profile (dict): If given, each read and match is timed as a stage (see start_stage).
+        compact (bool): If True the data record and questionnaires are made compact (see compact_frame) as soon as
+            they have been read, so the PIDs are matched by their category codes.
+        duplicatepolicy (str): If given, how a participant's entries are picked between (see resolve_duplicates).
+        recordeddates (bool): If True the date each response was recorded is read too, for the completion trends.
+
+    Returns:
+        tuple: A tuple containing three elements:
+            - datarecordframe (pd.DataFrame): The data record.
+            - duplicate_pids (list): The PIDs which appear more than once in the data record.
+            - results (dict): For each questionnaire, a dictionary with its 'matches', 'pidcounts', number of 'rows',
+              'joinreport' (with the 'conflicts' if there is a duplicatepolicy) and close match 'proposals' (None if
+              maxdistance isn't given). With recordeddates, also the 'recorded' date and whether the PID is 'valid'
+              for every response and the 'matcheddates' of the picked entries, by data record row.
+
+    Raises:
+        Any error from reading a file, after the files which haven't started being read yet are cancelled.
+    """
+    results={}
+    policykeep=DUPLICATE_POLICIES[duplicatepolicy] if duplicatepolicy is not None else []
+    keep=list(dict.fromkeys(policykeep+(['RecordedDate'] if recordeddates else [])))
+    with input_pool(workers, processes) as pool:
+        try:
+            surveyfutures={submit_stage(pool, profile, 'read_survey_frame', name, read_survey_frame, filename, cachedir, names,
+                                        survey[0] if survey else name, keep): name
+                           for name, (filename, names, *survey) in surveys.items()}
+            datarecordframe=submit_stage(pool, profile, 'read_data_record_frame', None, read_cached, read_data_record_frame, filenameDatarecord, cachedir).result()
+            if compact:
+                datarecordframe=profiled(profile, 'compact_frame', 'data record', compact_frame, datarecordframe)
+            with profile_stage(profile, 'build_pid_index', len(datarecordframe)) as record:
+                pidindex, duplicate_pids = build_pid_index(datarecordframe['Participant ID'])
+                record['rows_out']=len(pidindex)
+            recoveryindex=build_recovery_index(pidindex, maxdistance) if maxdistance is not None else None
+            for future in as_completed(surveyfutures):
+                qualtricsdataframe, pidclasses, pidcounts=future.result()
+                if compact:
+                    qualtricsdataframe=profiled(profile, 'compact_frame', surveyfutures[future], compact_frame, qualtricsdataframe)
+                proposals=None
+                if recoveryindex is not None:
+                    with profile_stage(profile, 'recover_pid_frame', len(qualtricsdataframe), surveyfutures[future]) as record:
+                        qualtricsdataframe, proposals=recover_pid_frame(qualtricsdataframe, pidindex, recoveryindex, automerge)
+                        record['rows_out']=len(proposals)
+                with profile_stage(profile, 'match_qualtrics_frame', len(qualtricsdataframe), surveyfutures[future]) as record:
+                    matches, joinreport=match_qualtrics_frame(pidindex, qualtricsdataframe, overwrite, duplicatepolicy)
+                    result={'pidcounts': pidcounts, 'rows': len(qualtricsdataframe), 'joinreport': joinreport, 'proposals': proposals}
+                    if recordeddates:
+                        result['recorded']=qualtricsdataframe['RecordedDate'].to_numpy()
+                        result['valid']=(pidclasses=='valid').to_numpy()
+                        result['matcheddates']=matches['RecordedDate']
+                    #the columns only read to pick between duplicates or for the trends don't go in the data record
+                    result['matches']=matches.drop(columns=keep)
+                    record['rows_out']=len(matches)
+                results[surveyfutures[future]]=result
+        except BaseException:
+            pool.shutdown(cancel_futures=True)
+            raise
+    return datarecordframe, duplicate_pids, {name: results[name] for name in surveys}
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def file_signature(filename):
+    """
+    Gets the size and last modified time of a file, which change whenever the file is saved again.
+
+    Arguments:
+        filename (str): The file path.
+
+    Returns:
+        tuple: The size in bytes and the last modified time in nanoseconds.
+    """
+    stat=os.stat(filename)
+    return stat.st_size, stat.st_mtime_ns
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def scan_survey(filenameQualtrics, pidindex, overwrite=True, chunksize=50000, survey=None):
+    """
+    Reads the whole of a questionnaire export and works out everything that is kept about it between incremental runs.
+
+    Arguments:
+        filenameQualtrics (str): The file path for either the CN or the Post CN questionnaire.
+        pidindex (dict): A dictionary mapping each PID to the index of its row in the data record.
+        overwrite (bool): If True a later entry with the same PID overwrites an earlier one, otherwise the first is kept.
+        chunksize (int): The number of rows to read at a time.
+        survey (dict): The survey's entry in the registry or its name, see qualtrics_columns.
+
+    Returns:
+        dict: The state of the survey with the 'header' row, the 'offset' and 'tail' of the file (how far it has been read
+        and the bytes just before that), the 'responses' read so far (ResponseId to RecordedDate) and the latest one
+        ('watermark'), the 'matches', the 'pidcounts', the number of 'rows', the 'joinreport', and the 'recorded',
+        'valid' and 'matcheddates' for the trends (see stream_qualtrics).
+    """
+    with open(filenameQualtrics, 'rb') as file:
+        header=file.readline()
+        offset=file.seek(0, os.SEEK_END)
+        file.seek(max(0, offset-1024))
+        tail=file.read()
+    responses={}
+    dates={}
+    matches, pidcounts, rows, joinreport=stream_qualtrics(filenameQualtrics, pidindex, overwrite, chunksize, responses=responses, survey=survey,
+                                                          dates=dates)
+    return {'header': header, 'offset': offset, 'tail': tail, 'responses': responses,
+            'watermark': max(responses.values(), default=None), 'matches': matches,
+            'pidcounts': pidcounts, 'rows': rows, 'joinreport': joinreport, **dates}
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def read_appended_rows(filenameQualtrics, surveystate):
+    """
+    Gets the bytes which have been added to the end of a questionnaire export since it was last read. Qualtrics puts
+    new responses at the bottom, so if the start of the file is the same as last time only the end needs reading.
+
+    Arguments:
+        filenameQualtrics (str): The file path for either the CN or the Post CN questionnaire.
+        surveystate (dict): The state of the survey from the last run.
+
+    Returns:
+        tuple: The new bytes and the size of the file, or None if the file has been changed in some other way (so it has
+        to be read again from the start).
+    """
+    tail=surveystate['tail']
+    #the last run has to have finished on a complete row
+    if not tail.endswith(b'\n'):
+        return None
+    with open(filenameQualtrics, 'rb') as file:
+        if file.readline()!=surveystate['header']:
+            return None
+        size=file.seek(0, os.SEEK_END)
+        if size<surveystate['offset']:
+            return None
+        file.seek(surveystate['offset']-len(tail))
+        if file.read(len(tail))!=tail:
+            return None
+        newbytes=file.read()
+    return newbytes, size
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def update_survey_state(filenameQualtrics, surveystate, pidindex, overwrite=True, chunksize=50000, survey=None):
+    """
+    Brings the state of a survey up to date by only reading the responses added since the last run. If there is no
+    state yet, or the export has been changed other than by adding responses to the end, the whole file is read again.
+
+    Arguments:
+        filenameQualtrics (str): The file path for either the CN or the Post CN questionnaire.
+        surveystate (dict): The state of the survey from the last run, or None.
+        pidindex (dict): A dictionary mapping each PID to the index of its row in the data record.
+        overwrite (bool): If True a later entry with the same PID overwrites an earlier one, otherwise the first is kept.
+        chunksize (int): The number of rows to read at a time.
+        survey (dict): The survey's entry in the registry or its name, see qualtrics_columns.
+
+    Returns:
+        tuple: A tuple containing two elements:
+            - surveystate (dict): The updated state of the survey.
+            - changed (list): The data record rows whose entry has changed, or None if the whole file was read again.
+    """
+    appended=None if surveystate is None else read_appended_rows(filenameQualtrics, surveystate)
+    if appended is None:
+        return scan_survey(filenameQualtrics, pidindex, overwrite, chunksize, survey), None
+    newbytes, size=appended
+    if not newbytes.strip():
+        return surveystate, []
+    responses={}
+    dates={}
+    #reading the new rows as if they were a file of their own, with the same column names
+    newmatches, pidcounts, rows, joinreport=stream_qualtrics(filenameQualtrics, pidindex, overwrite, chunksize,
+                                                             source=io.BytesIO(surveystate['header']+newbytes), responses=responses, survey=survey,
+                                                             dates=dates)
+    #a response which has been seen before must have been changed, so the whole file is read again
+    if any(responseid in surveystate['responses'] for responseid in responses):
+        return scan_survey(filenameQualtrics, pidindex, overwrite, chunksize, survey), None
+    oldmatches=surveystate['matches']
+    matches, repeated=combine_matches(oldmatches, newmatches, overwrite)
+    if overwrite or oldmatches.empty:
+        changed=newmatches.index.tolist()
+    else:
+        changed=newmatches.index[~newmatches.index.isin(oldmatches.index)].tolist()
+    oldreport=surveystate['joinreport']
+    #working everything out before changing the state, so it is either all updated or not at all
+    update={'offset': size, 'tail': (surveystate['tail']+newbytes)[-1024:],
+            'watermark': max(([] if surveystate['watermark'] is None else [surveystate['watermark']])+list(responses.values()), default=None),
+            'matches': matches,
+            'pidcounts': {pidclass: surveystate['pidcounts'][pidclass]+pidcounts[pidclass] for pidclass in PID_CLASSES},
+            'rows': surveystate['rows']+rows,
+            'joinreport': {'matched': len(matches),
+                           'unmatched': oldreport['unmatched']+joinreport['unmatched'],
+                           'duplicate': list(dict.fromkeys(oldreport['duplicate']+joinreport['duplicate']+repeated))},
+            'recorded': np.concatenate([surveystate['recorded'], dates['recorded']]),
+            'valid': np.concatenate([surveystate['valid'], dates['valid']]),
+            #the picked entry's date goes with it, the same way as combine_matches picks the entry
+            'matcheddates': (dates['matcheddates'].combine_first(surveystate['matcheddates']) if overwrite
+                             else surveystate['matcheddates'].combine_first(dates['matcheddates']))}
+    surveystate['responses'].update(responses)
+    surveystate.update(update)
+    return surveystate, changed
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def refresh_completion_state(state, filenameDatarecord, filenameCN, CNnames, filenamePOST, POSTnames, overwrite=True, chunksize=50000,
+                             valuemappings=None):
+    """
+    Brings the state from an earlier run up to date with the responses which are new since then. Only the rows of the
+    final data record and the completion numbers which the new responses change are worked out again. Everything is
+    started again from scratch if there is no state yet or the data record, the names, the value mappings or
+    STATE_VERSION have changed. This is what update_completion_state and the watch service (see
+    pid_completion.service) use, the first keeping the state in a file and the second in memory.
+
+    Arguments:
+        state (dict): The state from the last call, or None.
+        filenameDatarecord (str): The file path for the data record.
+        filenameCN (str): The file path for the CN questionnaire.
+        CNnames (dict): A dictionary mapping the question numbers from CN to desired names.
+        filenamePOST (str): The file path for the POST questionnaire.
+        POSTnames (dict): A dictionary mapping the question numbers from POST to desired names.
+        overwrite (bool): If True a later entry with the same PID overwrites an earlier one, otherwise the first is kept.
+        chunksize (int): The number of rows to read at a time.
+        valuemappings (dict): The value mappings (see load_value_mappings), defaults to the ones in VALUE_MAPPINGS_FILE.
+
+    Returns:
+        tuple: A tuple containing two elements:
+            - state (dict): The state, with the 'FINALdatarecordframe' (hair types already changed), the
+              'completioncodes' from encode_completion, the 'duplicate_pids' in the data record, the state of each
+              of the 'surveys' and whether it is 'updating' (only ever left True if something went wrong part way
+              through, when the state given has been changed and shouldn't be used again).
+            - changed (bool): True if anything was read, so the state needs saving.
+    """
+    valuemappings=valuemappings or load_value_mappings()
+    compiledmappings=compile_value_mappings(valuemappings, CNnames, POSTnames)
+    settings={'version': (STATE_VERSION, CLEANING_VERSION), 'datarecord': file_signature(filenameDatarecord), 'overwrite': overwrite,
+              'CNnames': CNnames, 'POSTnames': POSTnames, 'valuemappings': valuemappings}
+    if state is None or state['settings']!=settings:
+        datarecordframe=read_data_record_frame(filenameDatarecord)
+        pidindex, duplicate_pids = build_pid_index(datarecordframe['Participant ID'])
+        state={'settings': settings, 'datarecordframe': datarecordframe, 'pidindex': pidindex, 'duplicate_pids': duplicate_pids,
+               'surveys': {}, 'FINALdatarecordframe': None, 'completioncodes': None, 'updating': False}
+    rebuild=state['FINALdatarecordframe'] is None
+    saved=rebuild
+    changedrows=set()
+    for name, filename in [('CN', filenameCN), ('POST', filenamePOST)]:
+        oldstate=state['surveys'].get(name)
+        oldoffset=None if oldstate is None else oldstate['offset']
+        surveystate, changed=update_survey_state(filename, oldstate, state['pidindex'], overwrite, chunksize, name)
+        if surveystate is not oldstate or surveystate['offset']!=oldoffset:
+            #the final data record doesn't match the surveys again until the end, so anything going wrong from here on
+            #leaves the state half updated (see pid_completion.service.refresh_service)
+            state['updating']=True
+        state['surveys'][name]=surveystate
+        saved=saved or surveystate['offset']!=oldoffset
+        if changed is None:
+            rebuild=True
+        else:
+            changedrows.update(changed)
+    datarecordframe=state['datarecordframe']
+    CNmatches, POSTmatches=state['surveys']['CN']['matches'], state['surveys']['POST']['matches']
+    if not rebuild and changedrows:
+        rows=sorted(changedrows)
+        #working out just the changed rows of the final data record and swapping them in
+        patch=apply_value_mappings(build_final_frame(datarecordframe.loc[rows], CNmatches, CNnames, POSTmatches, POSTnames), compiledmappings)
+        FINALdatarecordframe=state['FINALdatarecordframe']
+        #the first matches for a survey add new columns, so everything has to be built again
+        if list(patch.columns)!=list(FINALdatarecordframe.columns):
+            rebuild=True
+        else:
+            completioncodes=state['completioncodes'].copy()
+            completioncodes[FINALdatarecordframe.index.get_indexer(rows)]=encode_completion(patch)
+            state['FINALdatarecordframe']=pd.concat([FINALdatarecordframe.drop(index=rows), patch]).reindex(FINALdatarecordframe.index)
+            state['completioncodes']=completioncodes
+    if rebuild:
+        FINALdatarecordframe=apply_value_mappings(build_final_frame(datarecordframe, CNmatches, CNnames, POSTmatches, POSTnames), compiledmappings)
+        state['FINALdatarecordframe']=FINALdatarecordframe
+        state['completioncodes']=encode_completion(FINALdatarecordframe)
+    state['updating']=False
+    return state, saved or rebuild
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def update_completion_state(statefile, filenameDatarecord, filenameCN, CNnames, filenamePOST, POSTnames, overwrite=True, chunksize=50000,
+                            valuemappings=None):
+    """
+    Loads everything worked out on the last run from statefile, adds the responses which are new since then (see
+    refresh_completion_state) and saves it again.
+
+    Arguments:
+        statefile (str): The file path where the state is saved between runs.
+        filenameDatarecord, filenameCN, CNnames, filenamePOST, POSTnames, overwrite, chunksize, valuemappings: The same
+            as for refresh_completion_state.
+
+    Returns:
+        dict: The state, see refresh_completion_state.
+    """
+    state=pd.read_pickle(statefile) if os.path.exists(statefile) else None
+    state, changed=refresh_completion_state(state, filenameDatarecord, filenameCN, CNnames, filenamePOST, POSTnames, overwrite, chunksize, valuemappings)
+    if changed:
+        #writing to a temporary file first so a crash can't leave a half written state behind
+        pd.to_pickle(state, statefile+'.tmp')
+        os.replace(statefile+'.tmp', statefile)
+    return state
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+
+def arrow_schema(dataframe):
+    """
+    Works out the Arrow type of each column (and the index) of a dataframe so every batch written by arrow_batches has
+    the same types. Columns which mix types (e.g. numbers and text) can't be stored by Arrow, so they are saved as text.
+
+    Arguments:
+        dataframe (pd.DataFrame): The dataframe.
+
+    Returns:
+        tuple: A tuple containing two elements:
+            - schema (pyarrow.Schema): The types, with the index as the first column.
+            - textcolumns (set): The positions of the columns (counting the index as 0) which are saved as text.
+    """
+    import pyarrow as pa
+    fields=[]
+    textcolumns=set()
+    for position, (name, values) in enumerate(frame_columns(dataframe)):
+        try:
+            arrowtype=pa.array(values, from_pandas=True).type
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            arrowtype=pa.string()
+            textcolumns.add(position)
+        fields.append(pa.field(str(name), arrowtype))
+    return pa.schema(fields), textcolumns
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def frame_columns(dataframe):
+    """
+    Lists the index and columns of a dataframe as (name, values) pairs, so columns with the same name are kept apart.
+
+    Arguments:
+        dataframe (pd.DataFrame): The dataframe.
+
+    Returns:
+        list: The index (named 'index' if it has no name) followed by each column.
+    """
+    return [(dataframe.index.name or 'index', dataframe.index.to_series())]+[(column, dataframe.iloc[:, i]) for i, column in enumerate(dataframe.columns)]
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def arrow_batches(dataframe, schema, textcolumns, batchsize=100000):
+    """
+    Turns a dataframe into Arrow record batches of batchsize rows, one at a time, so only one batch is copied at once.
+
+    Arguments:
+        dataframe (pd.DataFrame): The dataframe.
+        schema (pyarrow.Schema) / textcolumns (set): The types from arrow_schema.
+        batchsize (int): The number of rows in each batch.
+
+    Yields:
+        pyarrow.RecordBatch: The next batch of rows.
+    """
+    import pyarrow as pa
+    for startrow in range(0, len(dataframe), batchsize):
+        arrays=[]
+        for position, (name, values) in enumerate(frame_columns(dataframe.iloc[startrow:startrow+batchsize])):
+            if position in textcolumns:
+                values=values.where(values.isna(), values.astype(str))
+            arrays.append(pa.array(values, type=schema.field(position).type, from_pandas=True))
+        yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def write_parquet(dataframe, filename, batchsize=100000):
+    """
+    Saves a dataframe as a Parquet file, batchsize rows at a time (each batch is a row group).
+
+    Arguments:
+        dataframe (pd.DataFrame): The dataframe to save.
+        filename (str): The file path.
+        batchsize (int): The number of rows written at once.
+    """
+    import pyarrow.parquet as pq
+    schema, textcolumns=arrow_schema(dataframe)
+    with pq.ParquetWriter(filename, schema) as writer:
+        for batch in arrow_batches(dataframe, schema, textcolumns, batchsize):
+            writer.write_batch(batch)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def write_arrow(dataframe, filename, batchsize=100000):
+    """
+    Saves a dataframe as an Arrow IPC (Feather version 2) file, batchsize rows at a time. This can be memory mapped by
+    whatever reads it, so it is the quickest format to load.
+
+    Arguments:
+        dataframe (pd.DataFrame): The dataframe to save.
+        filename (str): The file path.
+        batchsize (int): The number of rows written at once.
+    """
+    import pyarrow as pa
+    schema, textcolumns=arrow_schema(dataframe)
+    with pa.OSFile(filename, 'wb') as sink, pa.ipc.new_file(sink, schema) as writer:
+        for batch in arrow_batches(dataframe, schema, textcolumns, batchsize):
+            writer.write_batch(batch)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def write_csv_parts(dataframe, dirname, batchsize=100000):
+    """
+    Saves a dataframe as a folder of .csv files with batchsize rows in each (part-00000.csv, part-00001.csv, ...), each
+    with the header, so they can be read one at a time or all at once. Parts left over from an earlier run are deleted.
+
+    Arguments:
+        dataframe (pd.DataFrame): The dataframe to save.
+        dirname (str): The folder the parts are saved in.
+        batchsize (int): The number of rows in each part.
+    """
+    clear_csv_parts(dirname)
+    #an empty data record still gets a part with the header in it
+    for part, startrow in enumerate(range(0, max(len(dataframe), 1), batchsize)):
+        dataframe.iloc[startrow:startrow+batchsize].to_csv(os.path.join(dirname, 'part-%05d.csv' % part))
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def clear_csv_parts(dirname):
+    """
+    Makes the folder for write_csv_parts, deleting any parts left over from an earlier run.
+
+    Arguments:
+        dirname (str): The folder the parts are saved in.
+    """
+    os.makedirs(dirname, exist_ok=True)
+    for entry in os.scandir(dirname):
+        if entry.name.startswith('part-') and entry.name.endswith('.csv'):
+            os.remove(entry.path)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def write_sheet_rows(worksheet, dataframe, index=True, batchsize=100000, startrow=0):
+    """
+    Writes a dataframe to an xlsxwriter worksheet in order from the top row down, which is what the constant memory
+    mode needs (each row is flushed to disk once the next one starts). Blanks are left empty like pandas does.
+
+    Arguments:
+        worksheet (xlsxwriter.worksheet.Worksheet): The worksheet.
+        dataframe (pd.DataFrame): The dataframe to write.
+        index (bool): If True the index is written as the first column.
+        batchsize (int): The number of rows taken from the dataframe at once.
+        startrow (int): The sheet row to start at, so a dataframe can be written a piece at a time. The header is only
+            written when starting at the top.
+
+    Returns:
+        int: The sheet row after the last one written.
+    """
+    if startrow==0:
+        if len(dataframe)+1>EXCEL_MAX_ROWS:
+            raise ValueError("The data has " + str(len(dataframe)) + " rows, which is more than an Excel sheet can hold, use one of the binary output formats instead")
+        worksheet.write_row(0, 0, ([''] if index else [])+[str(column) for column in dataframe.columns])
+        startrow=1
+    elif startrow+len(dataframe)>EXCEL_MAX_ROWS:
+        raise ValueError("The data has more rows than an Excel sheet can hold, use one of the binary output formats instead")
+    row=startrow
+    for batchstart in range(0, len(dataframe), batchsize):
+        for values in dataframe.iloc[batchstart:batchstart+batchsize].itertuples(index=index, name=None):
+            for column, value in enumerate(values):
+                if not isinstance(value, str) and pd.isna(value):
+                    continue
+                worksheet.write(row, column, value.item() if isinstance(value, np.generic) else value)
+            row+=1
+    return row
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def append_sheet_rows(worksheet, dataframe, index=True, header=True):
+    """
+    Writes a dataframe to the end of an openpyxl write only worksheet, the same cells as write_sheet_rows writes with
+    xlsxwriter. openpyxl is what pandas writes Excel files with, so this needs nothing that isn't installed anyway.
+
+    Arguments:
+        worksheet (openpyxl.worksheet._write_only.WriteOnlyWorksheet): The worksheet.
+        dataframe (pd.DataFrame): The dataframe to write.
+        index (bool): If True the index is written as the first column.
+        header (bool): If True the column names are written first, so a dataframe can be written a piece at a time.
+    """
+    if header:
+        worksheet.append(([''] if index else [])+[str(column) for column in dataframe.columns])
+    for values in dataframe.itertuples(index=index, name=None):
+        worksheet.append([None if not isinstance(value, str) and pd.isna(value) else value.item() if isinstance(value, np.generic) else value
+                          for value in values])
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def write_xlsx_stream(dataframe, filename, batchsize=100000, sheets=None):
+    """
+    Saves the data record and the summary sheets in an Excel file using xlsxwriter's constant memory mode, so the
+    workbook is never held in memory all at once.
+
+    Arguments:
+        dataframe (pd.DataFrame): The data record, saved in the 'Data Record' sheet.
+        filename (str): The file path.
+        batchsize (int): The number of rows taken from the data record at once.
+        sheets (dict): Any other sheets, mapping the sheet name to a (dataframe, index) tuple.
+    """
+    import xlsxwriter
+    with xlsxwriter.Workbook(filename, {'constant_memory': True}) as workbook:
+        write_sheet_rows(workbook.add_worksheet('Data Record'), dataframe, True, batchsize)
+        for sheetname, (sheet, index) in (sheets or {}).items():
+            write_sheet_rows(workbook.add_worksheet(sheetname), sheet, index, batchsize)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+#The formats the data record can be saved in apart from Excel, mapped to the function that writes them and the file
+#extension (the csv format is a folder of parts)
+OUTPUT_WRITERS={'parquet': (write_parquet, '.parquet'), 'arrow': (write_arrow, '.arrow'), 'csv': (write_csv_parts, ' CSV')}
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def write_outputs(FINALdatarecordframe, sheets, outputfile=OUTPUT_FILE, outputformat='excel', batchsize=100000):
+    """
+    Saves the data record and the summary sheets.
+
+    With outputformat 'excel' everything goes in one Excel file like before. 'xlsx-stream' makes the same Excel file
+    without holding it all in memory (see write_xlsx_stream). For the formats in OUTPUT_WRITERS ('parquet', 'arrow' and
+    'csv') the data record is saved in that format next to outputfile (with the extension changed) for the dashboards to
+    read, and outputfile only gets the summary sheets, which are what people actually open.
+
+    Arguments:
+        FINALdatarecordframe (pd.DataFrame): The final data record.
+        sheets (dict): The summary sheets, mapping the sheet name to a (dataframe, index) tuple.
+        outputfile (str): The Excel file path.
+        outputformat (str): 'excel', 'xlsx-stream', 'parquet', 'arrow' or 'csv'.
+        batchsize (int): The number of rows of the data record written at once.
+
+    Returns:
+        list: The paths that were written.
+    """
+    if outputformat=='xlsx-stream':
+        write_xlsx_stream(FINALdatarecordframe, outputfile, batchsize, sheets)
+        return [outputfile]
+    if outputformat=='excel':
+        sheets={'Data Record': (FINALdatarecordframe, True), **sheets}
+        written=[]
+    elif outputformat in OUTPUT_WRITERS:
+        writer, extension=OUTPUT_WRITERS[outputformat]
+        datapath=os.path.splitext(outputfile)[0]+extension
+        writer(FINALdatarecordframe, datapath, batchsize)
+        written=[datapath]
+    else:
+        raise ValueError("Unknown output format " + repr(outputformat) + ", use 'excel', 'xlsx-stream' or one of " + ", ".join(map(repr, OUTPUT_WRITERS)))
+    with pd.ExcelWriter(outputfile) as writer:
+        for sheetname, (sheet, index) in sheets.items():
+            sheet.to_excel(writer, sheet_name=sheetname, index=index)
+    return written+[outputfile]
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def publish_outputs(FINALdatarecordframe, sheets, publishdir, keep=2):
+    """
+    Publishes the data record and the summary tables as uncompressed Arrow IPC files, which other programs (the
+    dashboards, the reminder mailer, notebooks) can memory map with open_published instead of reading and parsing the
+    Excel file. Each publish goes in a new version folder, and the CURRENT file is swapped to point at it once all of it
+    is written, so a reader never sees half of one run and half of another:
+
+        publishdir/CURRENT                                   (the name of the newest version)
+        publishdir/v1700000000000000000/Data Record.arrow
+        publishdir/v1700000000000000000/Completion Numbers.arrow ...
+
+    The last few versions are kept so a program that still has an older one open isn't cut off.
+
+    Arguments:
+        FINALdatarecordframe (pd.DataFrame): The final data record.
+        sheets (dict): The summary sheets, mapping the sheet name to a (dataframe, index) tuple. Arrow columns can only
+            have one type, so they are stored with nullable types (the 'N/A' in the completion table is null).
+        publishdir (str): The folder to publish in.
+        keep (int): The number of versions to keep.
+
+    Returns:
+        str: The version folder that was published.
+    """
+    os.makedirs(publishdir, exist_ok=True)
+    version='v' + str(time.time_ns())
+    #writing everything into a hidden folder first and renaming it once it is all there
+    tempdir=os.path.join(publishdir, '.' + version)
+    os.makedirs(tempdir)
+    write_arrow(FINALdatarecordframe, os.path.join(tempdir, 'Data Record.arrow'))
+    for sheetname, (sheet, index) in sheets.items():
+        write_arrow(sheet.replace('N/A', None).convert_dtypes(), os.path.join(tempdir, sheetname + '.arrow'))
+    os.rename(tempdir, os.path.join(publishdir, version))
+    with open(os.path.join(publishdir, 'CURRENT.tmp'), 'w', encoding='utf-8') as file:
+        file.write(version)
+    os.replace(os.path.join(publishdir, 'CURRENT.tmp'), os.path.join(publishdir, 'CURRENT'))
+    versions=sorted(entry.name for entry in os.scandir(publishdir) if entry.is_dir() and entry.name.startswith('v'))
+    for oldversion in versions[:-keep]:
+        #on Windows a version a reader still has mapped can't be deleted yet, it goes next time
+        shutil.rmtree(os.path.join(publishdir, oldversion), ignore_errors=True)
+    return os.path.join(publishdir, version)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def sqlite_name(position):
+    """
+    Gives the name a column is stored under in the database. The columns are numbered rather than using their real
+    names, since SQLite ignores case in column names and the questionnaires can have names that only differ by case.
+
+    Arguments:
+        position (int): The position of the column.
+
+    Returns:
+        str: The column name in the database, e.g. 'c3'.
+    """
+    return 'c' + str(position)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def combine_dtypes(dtype, otherdtype):
+    """
+    Works out what type a column would have been given if the whole file had been read at once instead of in chunks
+    (e.g. whole numbers in one chunk and blanks in another make a float column).
+
+    Arguments:
+        dtype (np.dtype): The type of the column in the chunks so far.
+        otherdtype (np.dtype): The type of the column in the next chunk.
+
+    Returns:
+        np.dtype: The type for the whole column.
+    """
+    if dtype==otherdtype:
+        return dtype
+    numeric=[pd.api.types.is_numeric_dtype(value) and not pd.api.types.is_bool_dtype(value) for value in (dtype, otherdtype)]
+    return np.result_type(dtype, otherdtype) if all(numeric) else np.dtype(object)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def append_sqlite_chunk(connection, table, chunk, startrow, dtypes):
+    """
+    Adds a chunk of a file to a table in the database, making the table first if this is the first chunk. The rows are
+    numbered from startrow in the 'row' column so they can be put back in order. The columns are given no type so that
+    SQLite keeps every value exactly as it is (a typed column would turn text like '5' into a number).
+
+    Arguments:
+        connection (sqlite3.Connection): The database.
+        table (str): The name of the table.
+        chunk (pd.DataFrame): The rows to add.
+        startrow (int): The number of the first row in the chunk.
+        dtypes (dict): The type of each column so far (see combine_dtypes), which is updated with this chunk.
+
+    Returns:
+        int: The number of the row after the chunk.
+    """
+    columns=['row']+[sqlite_name(position) for position in range(len(chunk.columns))]
+    if not dtypes:
+        connection.execute('CREATE TABLE ' + table + ' (row INTEGER PRIMARY KEY, ' + ', '.join(columns[1:]) + ')')
+    #iterating over a series gives Python values, which is what sqlite3 needs (NaN is saved as NULL)
+    rows=zip(range(startrow, startrow+len(chunk)), *(chunk.iloc[:, position] for position in range(len(chunk.columns))))
+    connection.executemany('INSERT INTO ' + table + ' VALUES (' + ', '.join('?'*len(columns)) + ')', rows)
+    for column, dtype in chunk.dtypes.items():
+        dtypes[column]=combine_dtypes(dtypes[column], dtype) if column in dtypes else dtype
+    return startrow+len(chunk)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def load_data_record_sqlite(connection, filenameDatarecord, chunksize=50000):
+    """
+    Reads the data record into the 'datarecord' table a chunk at a time, tidied up the same way as read_data_record_frame,
+    and indexes the PIDs. The 'pidrows' table then has the first row for each PID, the same as build_pid_index.
+
+    Arguments:
+        connection (sqlite3.Connection): The database.
+        filenameDatarecord (str): The file path for the data record.
+        chunksize (int): The number of rows to read at a time.
+
+    Returns:
+        tuple: A tuple containing three elements:
+            - dtypes (dict): The type of each column of the data record.
+            - rows (int): The number of rows in the data record.
+            - duplicate_pids (list): The PIDs which appear more than once in the data record.
+    """
+    dtypes={}
+    rows=0
+    with pd.read_csv(filenameDatarecord, chunksize=chunksize) as reader:
+        for chunk in reader:
+            rows=append_sqlite_chunk(connection, 'datarecord', tidy_data_record_frame(chunk), rows, dtypes)
+    pid=sqlite_name(list(dtypes).index('Participant ID'))
+    connection.execute('CREATE INDEX datarecord_pid ON datarecord (' + pid + ')')
+    connection.execute('CREATE TABLE pidrows (pid PRIMARY KEY, datarow INTEGER) WITHOUT ROWID')
+    connection.execute('INSERT INTO pidrows SELECT ' + pid + ', MIN(row) FROM datarecord GROUP BY ' + pid)
+    #in the order their second row comes, the same as build_pid_index
+    duplicate_pids=[pid for pid, in connection.execute('SELECT pid FROM (SELECT ' + pid + ' AS pid, row, ROW_NUMBER() OVER (PARTITION BY ' + pid +
+                                                       ' ORDER BY row) AS copy FROM datarecord) WHERE copy=2 ORDER BY row')]
+    return dtypes, rows, duplicate_pids
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def load_survey_sqlite(connection, table, filenameQualtrics, overwrite=True, chunksize=50000, survey=None):
+    """
+    Reads a questionnaire export into a table a chunk at a time (tidied up the same way as read_qualtrics_chunks),
+    counting the PID classes as it goes, and then matches it to the data record with an indexed query. The '<table>_matches'
+    table has the entry picked for each matched data record row, the same one match_qualtrics_frame picks.
+
+    Arguments:
+        connection (sqlite3.Connection): The database, with the data record already loaded (see load_data_record_sqlite).
+        table (str): The name of the table, e.g. 'cn'.
+        filenameQualtrics (str): The file path for either the CN or the Post CN questionnaire.
+        overwrite (bool): If True a later entry with the same PID overwrites an earlier one, otherwise the first is kept.
+        chunksize (int): The number of rows to read at a time.
+        survey (dict): The survey's entry in the registry or its name, see qualtrics_columns.
+
+    Returns:
+        tuple: A tuple containing four elements:
+            - dtypes (dict): The type of each column of the questionnaire data.
+            - pidcounts (dict): The number of PIDs in each of the PID_CLASSES.
+            - rows (int): The number of rows in the questionnaire data.
+            - joinreport (dict): The same report as match_qualtrics_frame.
+    """
+    dtypes={}
+    pidcounts=dict.fromkeys(PID_CLASSES, 0)
+    rows=0
+    for chunk in read_qualtrics_chunks(filenameQualtrics, chunksize, survey=survey):
+        for pidclass, count in count_pid_classes(classify_pids(chunk['ParticipantID']), len(chunk)).items():
+            pidcounts[pidclass]+=count
+        rows=append_sqlite_chunk(connection, table, chunk, rows, dtypes)
+    pid=sqlite_name(list(dtypes).index('ParticipantID'))
+    connection.execute('CREATE INDEX ' + table + '_pid ON ' + table + ' (' + pid + ')')
+    connection.execute('CREATE TABLE ' + table + '_matches (datarow INTEGER PRIMARY KEY, entry INTEGER)')
+    connection.execute('INSERT INTO ' + table + '_matches SELECT pidrows.datarow, ' + ('MAX' if overwrite else 'MIN') + '(' + table + '.row) FROM '
+                       + table + ' JOIN pidrows ON pidrows.pid=' + table + '.' + pid + ' GROUP BY pidrows.datarow')
+    unmatched=[pid for pid, in connection.execute('SELECT ' + pid + ' FROM ' + table + ' WHERE NOT EXISTS (SELECT 1 FROM pidrows WHERE pidrows.pid='
+                                                  + table + '.' + pid + ') ORDER BY row')]
+    duplicate=[pid for pid, in connection.execute('SELECT pid FROM (SELECT ' + pid + ' AS pid, row, ROW_NUMBER() OVER (PARTITION BY ' + pid + ' ORDER BY row) AS copy FROM '
+                                                  + table + ' WHERE ' + pid + ' IN (SELECT pid FROM pidrows)) WHERE copy=2 ORDER BY row')]
+    matched,=connection.execute('SELECT COUNT(*) FROM ' + table + '_matches').fetchone()
+    if sum(pidcounts.values())!=rows:
+        raise ValueError("The PID classes add up to " + str(sum(pidcounts.values())) + " rows but the questionnaire has " + str(rows))
+    return dtypes, pidcounts, rows, {'matched': matched, 'unmatched': unmatched, 'duplicate': duplicate}
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def sqlite_final_columns(datarecorddtypes, CNdtypes, CNnames, POSTdtypes, POSTnames):
+    """
+    Works out where each column of the final data record comes from, by running build_final_frame on a tiny made up
+    data record with one row for each way a participant can be matched (both surveys, CN only, POST only, neither). Each
+    value is the name of the table and column it came from, so whatever build_final_frame does (overwriting columns,
+    renaming, merging columns with the same name) the database does the same.
+
+    Arguments:
+        datarecorddtypes (dict): The type of each column of the data record.
+        CNdtypes (dict): The type of each column of the CN data, or None if nobody matched it (so it adds no columns).
+        CNnames (dict): A dictionary mapping the question numbers from CN to desired names.
+        POSTdtypes (dict): The type of each column of the POST data, or None if nobody matched it.
+        POSTnames (dict): A dictionary mapping the question numbers from POST to desired names.
+
+    Returns:
+        tuple: A tuple containing two elements:
+            - sources (pd.DataFrame): The final data record's columns, with the 'datarecord.c0' style source (or NaN
+              for blank) in each of the four rows.
+            - template (pd.DataFrame): The same shape with made up values of the right types, so the final types are
+              known (e.g. for arrow_schema).
+    """
+    frames={}
+    for markers in [True, False]:
+        probes=[]
+        for table, dtypes, rows in [('datarecord', datarecorddtypes, [0, 1, 2, 3]), ('cn', CNdtypes, [0, 1]), ('post', POSTdtypes, [0, 2])]:
+            if dtypes is None:
+                probes.append(pd.DataFrame())
+                continue
+            if markers:
+                values={column: table + '.' + sqlite_name(position) for position, column in enumerate(dtypes)}
+                probes.append(pd.DataFrame(values, index=rows, columns=list(dtypes)))
+            else:
+                #a made up value of the right type for each column
+                values={column: pd.Series([False if pd.api.types.is_bool_dtype(dtype) else 0 if pd.api.types.is_numeric_dtype(dtype) else 'x']*len(rows),
+                                          index=rows, dtype=dtype) for column, dtype in dtypes.items()}
+                probes.append(pd.DataFrame(values, index=rows, columns=list(dtypes)))
+        frames[markers]=build_final_frame(probes[0], probes[1], CNnames, probes[2], POSTnames)
+    return frames[True], frames[False]
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def sqlite_expression(sources):
+    """
+    Makes the SQL which picks the value of one final column, from the four sources given by sqlite_final_columns.
+
+    Arguments:
+        sources (pd.Series): Where the column comes from for both surveys, CN only, POST only and neither.
+
+    Returns:
+        str: The SQL expression.
+    """
+    values=[source if isinstance(source, str) else 'NULL' for source in sources]
+    if len(set(values))==1:
+        return values[0]
+    conditions=['cn_matches.entry IS NOT NULL AND post_matches.entry IS NOT NULL', 'cn_matches.entry IS NOT NULL', 'post_matches.entry IS NOT NULL']
+    return 'CASE ' + ' '.join('WHEN ' + condition + ' THEN ' + value for condition, value in zip(conditions, values)) + ' ELSE ' + values[3] + ' END'
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+#Joins each data record row to the CN and POST entries picked for it (see load_survey_sqlite)
+SQLITE_FINAL_JOIN=('FROM datarecord LEFT JOIN cn_matches ON cn_matches.datarow=datarecord.row LEFT JOIN cn ON cn.row=cn_matches.entry '
+                   'LEFT JOIN post_matches ON post_matches.datarow=datarecord.row LEFT JOIN post ON post.row=post_matches.entry')
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def sqlite_completion_table(connection, sources, tasks=None, surveys=None, threshold=100):
+    """
+    Makes the completion table with one query over the joined database, working out the same number for each row as
+    encode_completion does and counting them in SQLite, so the data record never has to be loaded.
+
+    Arguments:
+        connection (sqlite3.Connection): The database, with the data record and both surveys loaded and matched.
+        sources (pd.DataFrame): Where each final column comes from, from sqlite_final_columns.
+        tasks (dict): A dictionary mapping the name of each task to its column. Defaults to COMPLETION_TASKS.
+        surveys (dict): A dictionary mapping the name of each survey to its progress column. Defaults to COMPLETION_SURVEYS.
+        threshold (int): The progress needed for a survey to count as completed.
+
+    Returns:
+        pd.DataFrame: The same table as completion_data_summary.
+    """
+    if tasks is None:
+        tasks=COMPLETION_TASKS
+    if surveys is None:
+        surveys=COMPLETION_SURVEYS
+    #a column which isn't there counts as blank for everyone, the same as encode_completion
+    expressions={column: sqlite_expression(sources.loc[:, sources.columns==column].iloc[:, 0]) if column in sources.columns else 'NULL'
+                 for column in list(tasks.values())+list(surveys.values())}
+    bits=[]
+    counted=[]
+    for i, column in enumerate(tasks.values()):
+        bits.append('(IFNULL((' + expressions[column] + ")='Y', 0) << " + str(i+len(surveys)) + ')')
+        counted.append('(' + expressions[column] + ") IS NULL OR (" + expressions[column] + ")='Y'")
+    for i, column in enumerate(surveys.values()):
+        done='CAST(' + expressions[column] + ' AS REAL)>=' + str(threshold)
+        bits.append('(IFNULL(' + done + ', 0) << ' + str(i) + ')')
+        counted.append('(' + expressions[column] + ') IS NULL OR ' + done)
+    #the bits are each in brackets since SQLite gives << and | the same precedence
+    code='CASE WHEN ' + ' AND '.join('(' + condition + ')' for condition in counted) + ' THEN ' + ' | '.join(bits) + ' ELSE -1 END'
+    counts=np.array(connection.execute('SELECT ' + code + ' AS code, COUNT(*) ' + SQLITE_FINAL_JOIN + ' GROUP BY code').fetchall(), dtype=np.int64).reshape(-1, 2)
+    return completion_table(counts[:, 0], tasks, surveys, counts[:, 1])
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def sqlite_final_batches(connection, sources, template, compiledmappings, batchsize=100000):
+    """
+    Reads the final data record out of the database batchsize rows at a time, with the same columns and types as
+    build_final_frame and the value mappings applied.
+
+    Arguments:
+        connection (sqlite3.Connection): The database, with the data record and both surveys loaded and matched.
+        sources (pd.DataFrame) / template (pd.DataFrame): Where each final column comes from and its type, from
+            sqlite_final_columns.
+        compiledmappings (dict): The value mappings, from compile_value_mappings.
+        batchsize (int): The number of rows in each batch.
+
+    Yields:
+        pd.DataFrame: The next batch of rows of the final data record, indexed by their row in the data record.
+    """
+    expressions=[sqlite_expression(sources.iloc[:, position]) for position in range(len(sources.columns))]
+    #SQLite keeps True and False as 1 and 0, so columns which only come from true/false columns are turned back
+    boolean=[pd.api.types.is_bool_dtype(template.iloc[:, position].dropna().infer_objects()) for position in range(len(template.columns))]
+    cursor=connection.execute('SELECT datarecord.row' + ''.join(', ' + expression for expression in expressions) + ' ' + SQLITE_FINAL_JOIN + ' ORDER BY datarecord.row')
+    while True:
+        rows=cursor.fetchmany(batchsize)
+        if not rows:
+            break
+        batch=pd.DataFrame(rows, columns=range(-1, len(expressions))).set_index(-1)
+        batch.index.name=None
+        for position, dtype in enumerate(template.dtypes):
+            column=batch[position]
+            if boolean[position]:
+                column=column.map({1: True, 0: False})
+            batch[position]=column.astype(dtype) if dtype!=object else column.astype(object).where(column.notna(), np.nan)
+        batch.columns=template.columns
+        yield apply_value_mappings(batch, compiledmappings)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def write_output_batches(batches, template, sheets, outputfile=OUTPUT_FILE, outputformat='excel', rows=0):
+    """
+    Saves the data record one batch at a time as it comes out of the database and then the summary sheets, so the whole
+    data record is never in memory. The files are the same as write_outputs makes. 'excel' is written with openpyxl's
+    write only mode (see append_sheet_rows) and 'xlsx-stream' with xlsxwriter's constant memory mode, so either way the
+    rows go straight to disk.
+
+    Arguments:
+        batches (iterable): The batches of the final data record, from sqlite_final_batches.
+        template (pd.DataFrame): The final columns with made up values of the right types, from sqlite_final_columns.
+        sheets (dict): The summary sheets, mapping the sheet name to a (dataframe, index) tuple.
+        outputfile (str): The Excel file path.
+        outputformat (str): 'excel', 'xlsx-stream', 'parquet', 'arrow' or 'csv'.
+        rows (int): The number of rows in the data record, to check it fits in Excel.
+
+    Returns:
+        list: The paths that were written.
+    """
+    if outputformat in ('excel', 'xlsx-stream') and rows+1>EXCEL_MAX_ROWS:
+        raise ValueError("The data has " + str(rows) + " rows, which is more than an Excel sheet can hold, use one of the binary output formats instead")
+    if outputformat=='excel':
+        from openpyxl import Workbook
+        workbook=Workbook(write_only=True)
+        worksheet=workbook.create_sheet('Data Record')
+        append_sheet_rows(worksheet, template.iloc[:0])
+        for batch in batches:
+            append_sheet_rows(worksheet, batch, header=False)
+        for sheetname, (sheet, index) in sheets.items():
+            append_sheet_rows(workbook.create_sheet(sheetname), sheet, index)
+        workbook.save(outputfile)
+        return [outputfile]
+    if outputformat=='xlsx-stream':
+        import xlsxwriter
+        with xlsxwriter.Workbook(outputfile, {'constant_memory': True}) as workbook:
+            worksheet=workbook.add_worksheet('Data Record')
+            row=write_sheet_rows(worksheet, template.iloc[:0])
+            for batch in batches:
+                row=write_sheet_rows(worksheet, batch, startrow=row)
+            for sheetname, (sheet, index) in sheets.items():
+                write_sheet_rows(workbook.add_worksheet(sheetname), sheet, index)
+        return [outputfile]
+    if outputformat not in OUTPUT_WRITERS:
+        raise ValueError("Unknown output format " + repr(outputformat) + ", use 'excel', 'xlsx-stream' or one of " + ", ".join(map(repr, OUTPUT_WRITERS)))
+    datapath=os.path.splitext(outputfile)[0]+OUTPUT_WRITERS[outputformat][1]
+    if outputformat=='csv':
+        clear_csv_parts(datapath)
+        part=-1
+        for part, batch in enumerate(batches):
+            batch.to_csv(os.path.join(datapath, 'part-%05d.csv' % part))
+        #an empty data record still gets a part with the header in it
+        if part<0:
+            template.iloc[:0].to_csv(os.path.join(datapath, 'part-00000.csv'))
+    else:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        schema, textcolumns=arrow_schema(template)
+        with ExitStack() as stack:
+            if outputformat=='parquet':
+                writer=stack.enter_context(pq.ParquetWriter(datapath, schema))
+            else:
+                writer=stack.enter_context(pa.ipc.new_file(stack.enter_context(pa.OSFile(datapath, 'wb')), schema))
+            for batch in batches:
+                for recordbatch in arrow_batches(batch, schema, textcolumns, len(batch)):
+                    writer.write_batch(recordbatch)
+    with pd.ExcelWriter(outputfile) as writer:
+        for sheetname, (sheet, index) in sheets.items():
+            sheet.to_excel(writer, sheet_name=sheetname, index=index)
+    return [datapath, outputfile]
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def sqlite_completion_data(database, filenameDatarecord, filenameCN, CNnames, filenamePOST, POSTnames, overwrite=True, chunksize=50000,
+                           outputfile=OUTPUT_FILE, outputformat='excel', batchsize=100000, profile=None, valuemappings=None):
+    """
+    Does the same as get_completion_data out of memory, for data records too big to fit in it. The data record and both
+    questionnaires are read a chunk at a time into an SQLite database with the PIDs indexed, the joins and the completion
+    table are done as queries, and the final data record is read back out and saved batchsize rows at a time. The
+    memory used depends on chunksize and batchsize, not on the size of the files.
+
+    Arguments:
+        database (str): The SQLite file to use, which is made again from scratch. It is left afterwards so it can be
+            looked at.
+        filenameDatarecord, filenameCN, CNnames, filenamePOST, POSTnames, overwrite, outputfile, outputformat,
+        batchsize, profile: The same as for get_completion_data.
+        chunksize (int): The number of rows of each file read at a time.
+        valuemappings (dict): The value mappings (see load_value_mappings), defaults to the ones in VALUE_MAPPINGS_FILE.
+
+    Returns:
+        tuple: A tuple containing two elements:
+            - pidformat_summaryinfo (pd.DataFrame): A DataFrame summarizing participant ID format information.
+            - completiondata_summaryinfo (pd.DataFrame): A DataFrame summarizing key parts of the data record.
+    """
+    valuemappings=valuemappings or load_value_mappings()
+    for filename in [database, database+'-journal']:
+        if os.path.exists(filename):
+            os.remove(filename)
+    connection=sqlite3.connect(database)
+    try:
+        #the database is only scratch space that is made again every run, so it doesn't need to survive a crash
+        connection.execute('PRAGMA journal_mode=OFF')
+        connection.execute('PRAGMA synchronous=OFF')
+        with profile_stage(profile, 'load_data_record_sqlite') as record:
+            datarecorddtypes, rows, duplicate_pids=load_data_record_sqlite(connection, filenameDatarecord, chunksize)
+            record['rows_out']=rows
+        surveys={}
+        for name, table, filename in [('CN', 'cn', filenameCN), ('POST', 'post', filenamePOST)]:
+            with profile_stage(profile, 'load_survey_sqlite', detail=name) as record:
+                surveys[name]=load_survey_sqlite(connection, table, filename, overwrite, chunksize, name)
+                record['rows_in'], record['rows_out']=surveys[name][2], surveys[name][3]['matched']
+            print_join_report(name, surveys[name][3], duplicate_pids)
+        connection.commit()
+        #a survey that nobody matched adds no columns, the same as add_matches_frame
+        sources, template=sqlite_final_columns(datarecorddtypes, surveys['CN'][0] if surveys['CN'][3]['matched'] else None, CNnames,
+                                               surveys['POST'][0] if surveys['POST'][3]['matched'] else None, POSTnames)
+        completiondata_summaryinfo=profiled(profile, 'sqlite_completion_table', None, sqlite_completion_table, connection, sources)
+        pidformat_summaryinfo=participant_id_format_info(surveys['CN'][1]['valid'], surveys['CN'][2]-surveys['CN'][1]['valid'],
+                                                         surveys['POST'][1]['valid'], surveys['POST'][2]-surveys['POST'][1]['valid'])
+        sheets={'PID format data': (pidformat_summaryinfo, True), 'Completion Numbers': (completiondata_summaryinfo, True)}
+        with profile_stage(profile, 'write_output_batches', rows, outputformat) as record:
+            batches=sqlite_final_batches(connection, sources, template, compile_value_mappings(valuemappings, CNnames, POSTnames), batchsize)
+            write_output_batches(batches, template, sheets, outputfile, outputformat, rows)
+            record['rows_out']=rows
+    finally:
+        connection.close()
+    return pidformat_summaryinfo, completiondata_summaryinfo
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def get_completion_data(filenameDatarecord, filenameCN, CNnames, filenamePOST, POSTnames, overwrite=True, columnar=False, chunksize=None, statefile=None, cachedir=None, workers=1, processes=False,
+                        recoverpids=False, maxdistance=1, automerge=None, outputfile=OUTPUT_FILE,
+                        outputformat='excel', batchsize=100000, profile=None, compact=False, valuemappings=VALUE_MAPPINGS_FILE,
+                        database=None, publishdir=None, surveys=None, duplicatepolicy=None, trenddates=None, trendfrequency='W', trendsfile=None):
+    """
+    Generate completion data and summary information and save to an MS Excel file.
+
+    This function takes filenames (PLEASE CHECK THESE ARE CORRECT) and corresponding data from CitizenNeuroscience (CN) and PostCitizenNeuroscience (POST)
+    questionnaires, as well as their corresponding participant ID names. It then processes the data, finds matching PIDs
+    in the data record, and creates a final data record. Additionally, it renames columns, handles hair type values (PLEASE CHECK THESE ARE CORRECT), and
+    calculates summary information about participant ID formats and key parts of the data record. It then creates an Excel 
+    file containing all the data that has been found.
+
+    Arguments:
+        filenameDatarecord (str): The file path for the data record.
+        filenameCN (str): The file path for the CN questionnaire.
+        CNnames (dict): A dictionary mapping the participant ID names from CN to desired names.
+        filenamePOST (str): The file path for the POST questionnaire.
+        POSTnames (dict): A dictionary mapping the participant ID names from POST to desired names.
+        overwrite (bool): If True (default) a later questionnaire entry with the same PID overwrites an earlier one,
+            if False the first entry is kept.
+        columnar (bool): If True the data is kept as dataframes the whole way through instead of being turned into
+            dictionaries, which uses a lot less memory for big files. The output is the same.
+        chunksize (int): If given, the questionnaires are read this many rows at a time (in columnar mode) so that the
+            memory used doesn't grow with the size of the exports. The output is the same.
+        statefile (str): If given, the file where everything worked out is saved between runs. The next run only reads
+            the responses added to the exports since then (see update_completion_state). The output is the same.
+        cachedir (str): If given, the cleaned .csv files are cached in this directory so running again with the same
+            files skips reading the .csv files (see read_cached). Not used with chunksize or statefile.
+        workers (int): The number of input files which are read at the same time (see input_pool). Not used with
+            chunksize or statefile. The output is the same.
+        processes (bool): If True the input files are read in separate processes instead of threads.
+        recoverpids (bool): If True (uses the columnar mode), PIDs which aren't in the data record are checked for close
+            matches (typos) and the suggestions are saved in a 'PID recovery' sheet (see recover_pid_frame).
+            Can't be used with chunksize, statefile or database.
+        maxdistance (int): The most typos a close match can have.
+        automerge (float): If given, close matches which aren't ambiguous and have at least this confidence are
+            merged, so they count in the completion numbers. Ambiguous matches are never merged.
+        outputfile (str): Where the Excel file is saved. Defaults to OUTPUT_FILE.
+        outputformat (str): How the data record is saved (see write_outputs). 'excel' (default) puts everything in one
+            Excel file, 'parquet', 'arrow' or 'csv' save the data record in that format and only the summary sheets in
+            the Excel file, and 'xlsx-stream' makes the full Excel file without holding it all in memory.
+        batchsize (int): The number of rows of the data record written at once (not used for 'excel').
+        profile (dict): If given (from new_profile), the time, CPU time, memory and rows of each stage are recorded in
+            it, save it afterwards with save_profile or save_trace.
+        compact (bool): If True the data is stored compactly (see compact_frame), which takes several times less
+            memory. In columnar mode this is done straight after reading so the matching uses it too. The numbers are the
+            same, but the data record has True instead of 'Y' for the tasks.
+        valuemappings (str): The .json file saying which answers (e.g. the hair type image codes) are changed in which
+            columns, see load_value_mappings. Defaults to VALUE_MAPPINGS_FILE.
+        database (str): If given, the joins are done out of memory in this SQLite file (True puts it next to outputfile),
+            for data records too big to fit in memory (see sqlite_completion_data). Only chunksize is used out of the
+            options for the other modes, and compact, statefile, cachedir, workers, processes, recoverpids, surveys,
+            duplicatepolicy, trenddates and publishdir raise a ValueError. The files saved are the same, but the data
+            record isn't returned.
+        publishdir (str): If given, the data record and summary tables are also published in this folder as memory
+            mapped Arrow files for other programs to read (see publish_outputs and open_published). Can't be used
+            with database.
+        surveys (str or dict): Any more surveys to merge onto the data record after the CN and POST ones, in order, as
+            the .json file or what load_survey_registry read from it. Each gets its own row in the PID format table and column in the completion table,
+            and a 'Survey matches' sheet says how many of each survey's responses matched. Uses the columnar mode (or
+            the chunked one with chunksize) and can't be used with statefile or database. The dictionary mode (the
+            default without columnar) still joins just the CN and then the POST data, one after the other, as it
+            always has, so it never sees the registry; the other modes merge every survey in one go with
+            merge_surveys_frame, which gives the same data record for the CN and POST surveys.
+        duplicatepolicy (str): If given, which response is used for participants who responded to a survey more than
+            once, one of DUPLICATE_POLICIES (see resolve_duplicates), and every response of theirs is listed in a
+            'Duplicate PIDs' sheet. Uses the columnar mode (or the chunked one with chunksize) and can't be used with
+            statefile or database.
+        trenddates (str): If given, the completion and PID format numbers are also counted by day, by the date the
+            responses were 'recorded' or the participant's 'session' date (see trend_row_dates), and a 'Completion
+            Trend' sheet has a row for each period. Uses the columnar mode unless chunksize or statefile is given
+            (the state keeps the dates of every response) and can't be used with database.
+        trendfrequency (str): How long each row of the 'Completion Trend' sheet covers, e.g. 'W' (default) or 'M'.
+        trendsfile (str): If given with trenddates, the trends are saved here (read it back with pd.read_pickle), so
+            the tables for any range of days can be made with trend_summary and new days added with update_trends. If
+            it is already there it is brought up to date with just the new responses (see extend_trends).
+
+    Returns:
+        file: Participant Completion Data.xlsx
+        tuple: A tuple containing three elements:
+            - FINALdatarecordframe (pd.DataFrame): The final data record DataFrame after processing and merging (None
+              with database).
+            - pidformat_summaryinfo (pd.DataFrame): A DataFrame summarizing participant ID format information.
+            - completiondata_summaryinfo (pd.DataFrame): A DataFrame summarizing key parts of the data record.
+    """
+    valuemappings=load_value_mappings(valuemappings or VALUE_MAPPINGS_FILE)
+    if recoverpids and (chunksize or statefile or database):
+        raise ValueError("recoverpids can't be used with chunksize, statefile or database, which never have all the unmatched PIDs at once")
+    if isinstance(surveys, str):
+        surveys=load_survey_registry(surveys)
+    if surveys and (statefile or database):
+        raise ValueError("surveys can't be used with statefile or database, which only know about the CN and POST surveys")
+    if duplicatepolicy is not None and duplicatepolicy not in DUPLICATE_POLICIES:
+        raise ValueError("duplicatepolicy has to be one of " + ", ".join(DUPLICATE_POLICIES) + ", not " + repr(duplicatepolicy))
+    if duplicatepolicy and (statefile or database):
+        raise ValueError("duplicatepolicy can't be used with statefile or database, which always keep the last (or first) response")
+    if trenddates is not None and trenddates not in TREND_DATES:
+        raise ValueError("trenddates has to be one of " + ", ".join(TREND_DATES) + ", not " + repr(trenddates))
+    if trenddates and database:
+        raise ValueError("trenddates can't be used with database, which never has the whole data record in memory to date its rows")
+    #the CN and POST surveys followed by any others, in the order they are merged
+    registry={'CN': {**SURVEY_REGISTRY['CN'], 'file': filenameCN, 'names': CNnames},
+              'POST': {**SURVEY_REGISTRY['POST'], 'file': filenamePOST, 'names': POSTnames}, **(surveys or {})}
+    #what each file is read with, the CN and POST ones by their name in SURVEY_REGISTRY (see qualtrics_columns)
+    surveyspecs={name: (surveys or {}).get(name, name) for name in registry}
+    #the PID counts and matches for each survey, which the dictionary mode doesn't have
+    results=None
+    if database and publishdir:
+        raise ValueError("publishdir can't be used with database, as the data record is never all in memory to publish")
+    if database and (compact or statefile or cachedir or workers!=1 or processes):
+        raise ValueError("compact, statefile, cachedir, workers and processes can't be used with database, which reads the files a chunk at a time into SQLite")
+    #checking before the database is loaded, which can take a long time, rather than when the output is written
+    if database and outputformat in OUTPUT_MODULES and importlib.util.find_spec(OUTPUT_MODULES[outputformat]) is None:
+        raise ValueError("outputformat " + repr(outputformat) + " needs " + OUTPUT_MODULES[outputformat] + ", which isn't installed")
+    if database:
+        #the data record is only ever in the database and the output files, a batch at a time
+        if database is True:
+            database=os.path.splitext(outputfile)[0]+'.sqlite'
+        pidformat_summaryinfo, completiondata_summaryinfo=sqlite_completion_data(database, filenameDatarecord, filenameCN, CNnames, filenamePOST, POSTnames,
+                                                                                 overwrite, chunksize or 50000, outputfile, outputformat, batchsize,
+                                                                                 profile, valuemappings)
+        return None, pidformat_summaryinfo, completiondata_summaryinfo
+    if statefile:
+        #only reading the responses which are new since the last run
+        with profile_stage(profile, 'update_completion_state') as record:
+            state=update_completion_state(statefile, filenameDatarecord, filenameCN, CNnames, filenamePOST, POSTnames, overwrite, chunksize or 50000,
+                                          valuemappings)
+            record['rows_out']=len(state['FINALdatarecordframe'])
+        FINALdatarecordframe, completioncodes=state['FINALdatarecordframe'], state['completioncodes']
+        results=state['surveys']
+        for name in ['CN', 'POST']:
+            print_join_report(name, results[name]['joinreport'], state['duplicate_pids'])
+    elif chunksize:
+        #reading the questionnaires a chunk at a time and only keeping the entries that match the data record
+        datarecordframe=profiled(profile, 'read_data_record_frame', None, read_data_record_frame, filenameDatarecord)
+        pidindex, duplicate_pids = build_pid_index(datarecordframe['Participant ID'])
+        results={}
+        for name, survey in registry.items():
+            with profile_stage(profile, 'stream_qualtrics', detail=name) as record:
+                dates={} if trenddates else None
+                matches, pidcounts, rows, joinreport=stream_qualtrics(survey['file'], pidindex, overwrite, chunksize, survey=surveyspecs[name],
+                                                                      duplicatepolicy=duplicatepolicy, dates=dates)
+                record['rows_in'], record['rows_out']=rows, len(matches)
+            results[name]={'matches': matches, 'pidcounts': pidcounts, 'rows': rows, 'joinreport': joinreport, **(dates or {})}
+        for name in registry:
+            print_join_report(name, results[name]['joinreport'], duplicate_pids)
+        FINALdatarecordframe=profiled(profile, 'merge_surveys_frame', None, merge_surveys_frame, datarecordframe,
+                                      [(results[name]['matches'], survey['names']) for name, survey in registry.items()])
+    elif columnar or recoverpids or surveys or duplicatepolicy or trenddates:
+        #keeping everything as dataframes the whole way through so the data isn't copied into dictionaries
+        datarecordframe, duplicate_pids, results=read_and_match_surveys(filenameDatarecord, {name: (survey['file'], survey['names'], surveyspecs[name])
+                                                                                              for name, survey in registry.items()},
+                                                                        overwrite, cachedir, workers, processes,
+                                                                        maxdistance if recoverpids else None, automerge, profile, compact, duplicatepolicy,
+                                                                        bool(trenddates))
+        if recoverpids:
+            recoveryproposals=pd.concat([results[name]['proposals'].assign(Survey=name) for name in results], ignore_index=True)
+            print("PID recovery: " + str(recoveryproposals['ParticipantID'].nunique()) + " unmatched PIDs have a close match in the data record, "
+                  + str(recoveryproposals.loc[recoveryproposals['Merged'], 'ParticipantID'].nunique()) + " merged")
+        for name in registry:
+            print_join_report(name, results[name]['joinreport'], duplicate_pids)
+        #the dictionary round trip below merges columns which get the same name, merge_surveys_frame does the same
+        FINALdatarecordframe=profiled(profile, 'merge_surveys_frame', None, merge_surveys_frame, datarecordframe,
+                                      [(results[name]['matches'], survey['names']) for name, survey in registry.items()])
+    else:
+        #the original dictionary mode only knows about the CN and POST surveys and joins them one after the other, any
+        #more surveys always go through merge_surveys_frame above
+        #reading the three files in the pool, the CN join starts as soon as the CN data and the data record are ready
+        #the profile can't be sent to other processes, so there the whole read is one stage (see submit_stage)
+        readprofile=None if processes else profile
+        with input_pool(workers, processes) as pool:
+            CNfuture=submit_stage(pool, profile, 'read_qualtrics_data', 'CN', read_qualtrics_data, filenameCN, cachedir, CNnames, readprofile,
+                                  None, surveyspecs['CN'])
+            POSTfuture=submit_stage(pool, profile, 'read_qualtrics_data', 'POST', read_qualtrics_data, filenamePOST, cachedir, POSTnames, readprofile,
+                                    None, surveyspecs['POST'])
+            datarecordfuture=submit_stage(pool, profile, 'read_data_record', None, read_data_record, filenameDatarecord, cachedir)
+            #getting the CitizenNeuroscience Data which has been formatted and stuff 
+            CNdata, CNdata_correct, CNdata_incorrect=CNfuture.result()
+            #getting the data record so we can find matches
+            datarecord, datarecordpids = datarecordfuture.result()
+        
+            #building the PID lookup once so that both questionnaires can use it
+            pidindex, duplicate_pids = build_pid_index(datarecordpids)
+            #finding the matching PIDs in the first questionnaire data and combining the data record and questionnaire data
+            #doing CN first but it doesn't actually matter
+            with profile_stage(profile, 'join_qualtrics', len(CNdata), 'CN') as record:
+                CNdatarecord, CNjoinreport=join_qualtrics(datarecord, pidindex, CNdata, overwrite)
+                record['rows_out']=CNjoinreport['matched']
+            print_join_report('CN', CNjoinreport, duplicate_pids)
+        
+            with profile_stage(profile, 'rename', len(CNdatarecord), 'CN') as record:
+                #THIS IS A REALLY STUPID AND LONG WAY OF RENAMING THE COLUMNS 
+                #BECAUSE NESTED DICTIONARIES ARE ????
+                #Turning data dictionary into a frame
+                CNdatarecordframe=pd.DataFrame(CNdatarecord)
+                #Renaming stuff based on a dictionary names 
+                CNdatarecordframe.rename(index=CNnames, inplace=True)
+                #turning it back into a dictionary cause im stupid 
+                CNdatarecord=CNdatarecordframe.to_dict()
+                record['rows_out']=len(CNdatarecord)
+        
+            #getting the PostCitizenNeuroscience Data also 
+            POSTdata,POSTdata_correct, POSTdata_incorrect=POSTfuture.result()
+        #finding the matching PIDs in the second questionnaire data and combining the data record and questionnaire data
+        #!!!!! This time, putting the data record created above so that all the data is combined !!!!!
+        with profile_stage(profile, 'join_qualtrics', len(POSTdata), 'POST') as record:
+            FINALdatarecord, POSTjoinreport=join_qualtrics(CNdatarecord, pidindex, POSTdata, overwrite)
+            record['rows_out']=POSTjoinreport['matched']
+        print_join_report('POST', POSTjoinreport, duplicate_pids)
+    
+        with profile_stage(profile, 'rename', detail='POST') as record:
+            #Turning data dictionary into a frame for exporting 
+            FINALdatarecordframe=pd.DataFrame(FINALdatarecord)
+            #Renaming stuff based on a dictionary names 
+            FINALdatarecordframe.rename(index=POSTnames, inplace=True)
+            FINALdatarecordframe=FINALdatarecordframe.T
+            record['rows_out']=len(FINALdatarecordframe)
+    if compact:
+        FINALdatarecordframe=profiled(profile, 'compact_frame', None, compact_frame, FINALdatarecordframe)
+    #the surveys the completion numbers are worked out for, None for just CN and Post CN (see encode_completion)
+    completionsurveys={survey['completion']: survey['prefix'] + 'Progress' for survey in registry.values()} if surveys else None
+    if statefile:
+        #the saved data record already has the hair type values changed and the completion numbers worked out
+        completiondata_summaryinfo=profiled(profile, 'completion_table', None, completion_table, completioncodes)
+    else:
+        with profile_stage(profile, 'hair_types', len(FINALdatarecordframe)) as record:
+            #Changing hair type values, only in the columns they are in
+            apply_value_mappings(FINALdatarecordframe, compile_value_mappings(valuemappings, CNnames, POSTnames,
+                                                                              {name: survey['names'] for name, survey in registry.items()}))
+            record['rows_out']=len(FINALdatarecordframe)
+        #Calling completion_data_summary to get table summarising key parts of the data record
+        with profile_stage(profile, 'completion_data_summary', len(FINALdatarecordframe)) as record:
+            #the same as completion_data_summary, but keeping the numbers for the trends
+            completioncodes=encode_completion(FINALdatarecordframe, surveys=completionsurveys)
+            completiondata_summaryinfo=completion_table(completioncodes, surveys=completionsurveys)
+            record['rows_out']=len(completiondata_summaryinfo)
+    if results is None:
+        #Calling participant_id_format_info to get table summarising how many students struggled with correctly entering their pid
+        pidformat_summaryinfo=participant_id_format_info(CNdata_correct, CNdata_incorrect,POSTdata_correct, POSTdata_incorrect)
+    else:
+        #everything that isn't valid (including blanks) counts as incorrectly entered, the same as filter_qualtrics
+        pidformat_summaryinfo=pid_format_table({survey['label']: (results[name]['pidcounts']['valid'], results[name]['rows']-results[name]['pidcounts']['valid'])
+                                                for name, survey in registry.items()})
+    #Writing that data record and the summary tables out
+    sheets={'PID format data': (pidformat_summaryinfo, True), 'Completion Numbers': (completiondata_summaryinfo, True)}
+    if surveys:
+        sheets['Survey matches']=(survey_match_report(registry, results), True)
+    if duplicatepolicy:
+        conflicts=pd.concat([results[name]['joinreport']['conflicts'].assign(Survey=name) for name in registry], ignore_index=True)
+        print("Duplicate PIDs: " + str(len(conflicts[['Survey', 'ParticipantID']].drop_duplicates())) + " participants responded to a survey more than once, "
+              + "kept the response picked by '" + duplicatepolicy + "'")
+        sheets['Duplicate PIDs']=(conflicts, False)
+    if trenddates:
+        with profile_stage(profile, 'build_trends', len(FINALdatarecordframe), trenddates) as record:
+            rowdates=trend_row_dates(FINALdatarecordframe, trenddates, [results[name]['matcheddates'] for name in registry])
+            responses={survey['label']: (results[name]['recorded'], results[name]['valid']) for name, survey in registry.items()}
+            if trendsfile and os.path.exists(trendsfile):
+                #only adding what has changed since the trends were saved
+                trends=extend_trends(pd.read_pickle(trendsfile), trenddates, completioncodes, rowdates, responses, surveys=completionsurveys)
+            else:
+                trends=build_trends(trenddates, completioncodes, rowdates, responses, surveys=completionsurveys)
+            sheets['Completion Trend']=(completion_trend(trends, trendfrequency), True)
+            record['rows_out']=len(sheets['Completion Trend'][0])
+        if trendsfile:
+            pd.to_pickle(trends, trendsfile)
+    if recoverpids:
+        sheets['PID recovery']=(recoveryproposals, False)
+    with profile_stage(profile, 'write_outputs', len(FINALdatarecordframe), outputformat) as record:
+        write_outputs(FINALdatarecordframe, sheets, outputfile, outputformat, batchsize)
+        record['rows_out']=len(FINALdatarecordframe)
+    if publishdir:
+        profiled(profile, 'publish_outputs', None, publish_outputs, FINALdatarecordframe, sheets, publishdir)
+    return FINALdatarecordframe, pidformat_summaryinfo, completiondata_summaryinfo
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def published_version(publishdir):
+    """
+    Finds the newest version published by publish_outputs.
+
+    Arguments:
+        publishdir (str): The folder that was published in.
+
+    Returns:
+        str: The version folder.
+    """
+    with open(os.path.join(publishdir, 'CURRENT'), encoding='utf-8') as file:
+        return os.path.join(publishdir, file.read().strip())
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def open_published(publishdir):
+    """
+    Memory maps every table in the newest published version (see publish_outputs). Nothing is copied or parsed, the
+    tables point straight at the files, so any number of programs can open them at once for next to no memory. All the
+    tables come from the same version even if a new one is published in the middle.
+
+        tables=open_published(publishdir)
+        nopost=tables['Data Record'].filter(pyarrow.compute.is_null(tables['Data Record']['PostProgress']))
+
+    Arguments:
+        publishdir (str): The folder that was published in.
+
+    Returns:
+        dict: A dictionary mapping each table name (e.g. 'Data Record', 'Completion Numbers') to a pyarrow.Table, with
+        the index as the first column.
+    """
+    import pyarrow as pa
+    versiondir=published_version(publishdir)
+    tables={}
+    for entry in sorted(os.scandir(versiondir), key=lambda entry: entry.name):
+        if entry.name.endswith('.arrow'):
+            tables[entry.name[:-len('.arrow')]]=pa.ipc.open_file(pa.memory_map(entry.path)).read_all()
+    return tables
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def read_published(publishdir, name='Data Record', columns=None):
+    """
+    Reads one published table as a dataframe, the same as the one get_completion_data returned (the index is put back,
+    and the summary tables have nullable types with <NA> for 'N/A'). Only the columns asked for are copied out of the
+    memory mapped file.
+
+    Arguments:
+        publishdir (str): The folder that was published in.
+        name (str): The table, 'Data Record' or one of the summary sheet names.
+        columns (list): If given, only these columns are read.
+
+    Returns:
+        pd.DataFrame: The table.
+    """
+    import pyarrow as pa
+    table=open_published(publishdir)[name]
+    if columns is not None:
+        table=table.select([0]+[table.schema.get_field_index(str(column)) for column in columns])
+    #the summary tables were saved with nullable types (see publish_outputs), so whole numbers stay whole numbers
+    nullable={pa.int64(): pd.Int64Dtype(), pa.float64(): pd.Float64Dtype(), pa.string(): pd.StringDtype()}
+    dataframe=table.to_pandas(types_mapper=None if name=='Data Record' else nullable.get)
+    dataframe=dataframe.set_index(dataframe.columns[0])
+    #frame_columns calls an index without a name 'index'
+    if dataframe.index.name=='index':
+        dataframe.index.name=None
+    return dataframe
+
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def read_manifest(filenameManifest, outputdir=None):
+    """
+    Reads the manifest for batch mode, a .csv file with a row for each cohort and the columns 'Cohort', 'Data Record',
+    'CN' and 'POST' (the file paths) and optionally 'Output' (where the Excel file for that cohort is saved). Relative
+    paths are taken from the folder the manifest is in.
+
+    Arguments:
+        filenameManifest (str): The file path for the manifest.
+        outputdir (str): The folder the Excel files are saved in if the manifest has no 'Output' for a cohort, each one
+            goes in <outputdir>/<Cohort>/Participant Completion Data.xlsx. Defaults to the manifest's folder.
+
+    Returns:
+        pd.DataFrame: The manifest, indexed by cohort, with full paths in the 'Data Record', 'CN', 'POST' and 'Output' columns.
+    """
+    manifest=pd.read_csv(filenameManifest, dtype=str, skipinitialspace=True)
+    missing=[column for column in ['Cohort', 'Data Record', 'CN', 'POST'] if column not in manifest.columns]
+    if missing:
+        raise ValueError(filenameManifest + " is missing the column(s) " + ", ".join(missing))
+    manifest['Cohort']=manifest['Cohort'].str.strip()
+    repeated=manifest['Cohort'][manifest['Cohort'].duplicated()].unique()
+    if len(repeated):
+        raise ValueError(filenameManifest + " has more than one row for the cohort(s) " + ", ".join(repeated))
+    folder=os.path.dirname(os.path.abspath(filenameManifest))
+    if outputdir is None:
+        outputdir=folder
+    if 'Output' not in manifest.columns:
+        manifest['Output']=np.nan
+    manifest['Output']=manifest['Output'].fillna(manifest['Cohort'].map(lambda cohort: os.path.join(outputdir, cohort, 'Participant Completion Data.xlsx')))
+    for column in ['Data Record', 'CN', 'POST', 'Output']:
+        manifest[column]=[os.path.join(folder, path.strip()) for path in manifest[column]]
+    return manifest.set_index('Cohort')
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def run_cohort(cohort, filenameDatarecord, filenameCN, filenamePOST, outputfile, options):
+    """
+    Runs get_completion_data for one cohort. This is what each process in get_batch_completion_data runs, so only the
+    (small) summary tables are sent back rather than the whole data record.
+
+    Arguments:
+        cohort (str): The name of the cohort, only used in messages.
+        filenameDatarecord (str): The file path for the data record.
+        filenameCN (str): The file path for the CN questionnaire.
+        filenamePOST (str): The file path for the POST questionnaire.
+        outputfile (str): Where the Excel file for this cohort is saved.
+        options (dict): Any other arguments for get_completion_data.
+
+    Returns:
+        tuple: A tuple containing two elements:
+            - pidformat_summaryinfo (pd.DataFrame): The PID format table for this cohort.
+            - completiondata_summaryinfo (pd.DataFrame): The completion table for this cohort.
+    """
+    print("Cohort " + cohort + ":")
+    os.makedirs(os.path.dirname(outputfile) or '.', exist_ok=True)
+    FINALdatarecordframe, pidformat_summaryinfo, completiondata_summaryinfo=get_completion_data(filenameDatarecord, filenameCN, CNnames, filenamePOST, POSTnames,
+                                                                                                outputfile=outputfile, **options)
+    return pidformat_summaryinfo, completiondata_summaryinfo
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def combine_pid_format_info(summaries):
+    """
+    Adds up the PID format tables (see participant_id_format_info) of several cohorts, working the percentage out again
+    from the totals instead of adding the percentages.
+
+    Arguments:
+        summaries (list): The PID format tables.
+
+    Returns:
+        pd.DataFrame: One PID format table for all of them.
+    """
+    counts=['Number of Correctly Entered PIDs', 'Number of Incorrectly Entered PIDs']
+    if not summaries:
+        return participant_id_format_info(0, 0, 0, 0)
+    summaryinfo=sum(summary[counts] for summary in summaries)
+    correct=summaryinfo[counts[0]]
+    summaryinfo['%']=(summaryinfo[counts[1]]/correct.where(correct>0))*100
+    return summaryinfo
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def combine_completion_tables(tables):
+    """
+    Adds up the completion tables (see completion_table) of several cohorts, keeping the 'N/A' for doing neither task
+    and neither survey.
+
+    Arguments:
+        tables (list): The completion tables, all for the same tasks and surveys.
+
+    Returns:
+        pd.DataFrame: One completion table for all of them.
+    """
+    if not tables:
+        return completion_table(np.array([], dtype=int))
+    total=sum(table.replace('N/A', 0).astype('int64') for table in tables).astype(object)
+    total.iloc[-1, -1]='N/A'
+    return total
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def get_batch_completion_data(filenameManifest, outputdir=None, workers=None, **options):
+    """
+    Runs get_completion_data for every cohort in a manifest (see read_manifest), with the cohorts split between
+    processes so all of the cores get used instead of running them one after another. Each cohort gets its own Excel
+    file, and the PID format and completion tables for all the cohorts added together are saved in
+    Batch Completion Data.xlsx next to them along with a table of how each cohort went. A cohort that fails (e.g. a
+    missing file) is reported and doesn't stop the others.
+
+    Arguments:
+        filenameManifest (str): The file path for the manifest.
+        outputdir (str): The folder the Excel files are saved in (see read_manifest). Defaults to the manifest's folder.
+        workers (int): The number of cohorts run at the same time. Defaults to the number of cores.
+        **options: Any other arguments for get_completion_data (e.g. columnar=True), used for every cohort.
+
+    Returns:
+        tuple: A tuple containing three elements:
+            - pidformat_summaryinfo (pd.DataFrame): The PID format table for all the cohorts.
+            - completiondata_summaryinfo (pd.DataFrame): The completion table for all the cohorts.
+            - cohortsummary (pd.DataFrame): A row for each cohort with its PID counts, where it was saved and any error.
+    """
+    manifest=read_manifest(filenameManifest, outputdir)
+    if outputdir is None:
+        outputdir=os.path.dirname(os.path.abspath(filenameManifest))
+    results={}
+    errors={}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures={pool.submit(run_cohort, cohort, row['Data Record'], row['CN'], row['POST'], row['Output'], options): cohort
+                 for cohort, row in manifest.iterrows()}
+        for future in as_completed(futures):
+            cohort=futures[future]
+            try:
+                results[cohort]=future.result()
+            except Exception as error:
+                errors[cohort]=type(error).__name__ + ": " + str(error)
+                print("Cohort " + cohort + " failed: " + errors[cohort])
+    #keeping the cohorts in the same order as the manifest whatever order they finished in
+    done=[cohort for cohort in manifest.index if cohort in results]
+    pidformat_summaryinfo=combine_pid_format_info([results[cohort][0] for cohort in done])
+    completiondata_summaryinfo=combine_completion_tables([results[cohort][1] for cohort in done])
+    #a column for the correct and incorrect PIDs of each row of the PID format table, so any surveys added with the
+    #surveys option get theirs too (e.g. 'CN Correct PIDs', or the survey's label)
+    surveynames={survey['label']: name for name, survey in SURVEY_REGISTRY.items()}
+    counts=[('Correct PIDs', 'Number of Correctly Entered PIDs'), ('Incorrect PIDs', 'Number of Incorrectly Entered PIDs')]
+    cohortsummary=pd.DataFrame([{surveynames.get(label, label) + ' ' + column: row[count] for label, row in results[cohort][0].iterrows()
+                                 for column, count in counts} for cohort in done], index=done)
+    cohortsummary=cohortsummary.reindex(manifest.index).astype('Int64')
+    cohortsummary['Output']=manifest['Output'].where(manifest.index.isin(done))
+    cohortsummary['Error']=[errors.get(cohort, '') for cohort in manifest.index]
+    print(str(len(done)) + " of " + str(len(manifest)) + " cohorts done")
+    os.makedirs(outputdir, exist_ok=True)
+    with pd.ExcelWriter(os.path.join(outputdir, 'Batch Completion Data.xlsx')) as writer:
+        cohortsummary.to_excel(writer, sheet_name='Cohorts')
+        pidformat_summaryinfo.to_excel(writer, sheet_name='PID format data')
+        completiondata_summaryinfo.to_excel(writer, sheet_name='Completion Numbers')
+    return pidformat_summaryinfo, completiondata_summaryinfo, cohortsummary
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+Keeps the pipeline running on a folder of input files and serves the current tables over HTTP, so a new CN or Post CN
+export dropped into the folder is picked up in well under a second instead of a whole run of the script.
+
+    pid-completion watch "S:/Participant Completion" --port 8765
+
+The data record, its PID index, the final data record and the completion numbers stay in memory between updates (see
+refresh_completion_state), so a changed questionnaire only has its new responses read and only the rows of the data
+record they change worked out again. The tables are turned into JSON once per update, and each request just sends
+those bytes:
+
+    GET /completion     the completion table (completion_data_summary)
+    GET /pid-format     the PID format table (participant_id_format_info)
+    GET /status         when it last updated, the number of rows and the last error (if any)
+
+Everything only uses local files and a server on 127.0.0.1, so it can be tried out by copying files into a folder and
+opening http://127.0.0.1:8765/completion.
+
+Functions [Order]:
+- input_files(inputdir, names): Gets the file path of each input file in the folder.
+
+- new_service(inputdir, names, overwrite, chunksize, valuemappings, publishdir): Makes the service with nothing read yet.
+
+- service_tables(state): Works out the summary tables from the state.
+
+- table_json(table) / status_json(service): Turn the tables and the status into the JSON that is sent.
+
+- refresh_service(service): Reads any changes to the input files and updates the tables.
+
+- ServiceHandler: Answers the HTTP requests from the tables the service has ready.
+
+- serve(service, host, port): Starts the HTTP server in the background.
+
+- watch_folder(inputdir, host, port, interval, ...): Keeps refreshing the service until it is stopped.
+"""
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from . import pipeline
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+#The names the input files have in the folder
+INPUT_FILES={'datarecord': 'Data Record Sorted Out.csv', 'CN': 'CN Questionnaire Results.csv', 'POST': 'Post CN Questionnaire Results.csv'}
+#The tables that can be asked for and the key each one has in service['responses']
+SERVICE_PATHS={'/completion': 'completion', '/pid-format': 'pidformat', '/status': 'status'}
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def input_files(inputdir, names=None):
+    """
+    Gets the file path of each input file in the folder.
+
+    Arguments:
+        inputdir (str): The folder the exports are dropped into.
+        names (dict): The name of each input file, defaults to INPUT_FILES.
+
+    Returns:
+        dict: The file path of the 'datarecord', 'CN' and 'POST' files.
+    """
+    names=names or INPUT_FILES
+    return {key: os.path.join(inputdir, names[key]) for key in INPUT_FILES}
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def new_service(inputdir, names=None, overwrite=True, chunksize=50000, valuemappings=None, publishdir=None):
+    """
+    Makes the service for a folder with nothing read yet. Call refresh_service to read the files.
+
+    Arguments:
+        inputdir (str): The folder the exports are dropped into.
+        names (dict): The name of each input file, defaults to INPUT_FILES.
+        overwrite (bool): If True a later entry with the same PID overwrites an earlier one, otherwise the first is kept.
+        chunksize (int): The number of rows of the questionnaires to read at a time.
+        valuemappings (str): The .json file of value mappings, defaults to VALUE_MAPPINGS_FILE.
+        publishdir (str): If given, the tables are also published here after each update (see publish_outputs).
+
+    Returns:
+        dict: The service, with the 'files' it watches, the 'signatures' it last read them at, the 'failed' ones it
+        couldn't read them at, the pipeline 'state', the JSON 'responses' for each path and a 'lock' held while the
+        responses are swapped.
+    """
+    return {'files': input_files(inputdir, names), 'overwrite': overwrite, 'chunksize': chunksize,
+            'valuemappings': pipeline.load_value_mappings(valuemappings or pipeline.VALUE_MAPPINGS_FILE), 'publishdir': publishdir,
+            'signatures': None, 'failed': None, 'pending': None, 'state': None, 'updated': None, 'error': None, 'updates': 0,
+            'responses': {'completion': None, 'pidformat': None, 'status': None}, 'lock': threading.Lock()}
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def service_tables(state):
+    """
+    Works out the summary tables from the state. The completion table is counted from the completion numbers kept in the
+    state and the PID format table from the PID counts, so neither needs the data record going through again.
+
+    Arguments:
+        state (dict): The state from refresh_completion_state.
+
+    Returns:
+        tuple: A tuple containing two elements:
+            - pidformat_summaryinfo (pd.DataFrame): The PID format table.
+            - completiondata_summaryinfo (pd.DataFrame): The completion table.
+    """
+    counts=[]
+    for name in ['CN', 'POST']:
+        surveystate=state['surveys'][name]
+        #everything that isn't valid (including blanks) counts as incorrectly entered, the same as filter_qualtrics
+        counts+=[surveystate['pidcounts']['valid'], surveystate['rows']-surveystate['pidcounts']['valid']]
+    return pipeline.participant_id_format_info(*counts), pipeline.completion_table(state['completioncodes'])
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def table_json(table):
+    """
+    Turns a summary table into the JSON sent for it.
+
+    Arguments:
+        table (pd.DataFrame): The table.
+
+    Returns:
+        bytes: The table as {"index": [...], "columns": [...], "data": [[...], ...]}.
+    """
+    return table.to_json(orient='split').encode('utf-8')
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def status_json(service):
+    """
+    Turns how the service is doing into the JSON sent for /status.
+
+    Arguments:
+        service (dict): The service.
+
+    Returns:
+        bytes: The status as JSON.
+    """
+    state=service['state']
+    status={'updated': service['updated'], 'updates': service['updates'], 'error': service['error'],
+            'rows': None if state is None else len(state['FINALdatarecordframe']),
+            'responses': None if state is None else {name: state['surveys'][name]['rows'] for name in state['surveys']}}
+    return json.dumps(status).encode('utf-8')
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def refresh_service(service):
+    """
+    Reads any changes to the input files and updates the tables. A file is only read once it has looked the same on
+    two refreshes in a row, so an export which is still being copied into the folder isn't read half written. If
+    anything fails (e.g. the data record is missing or an export can't be parsed) the error is kept for /status, the
+    old tables are still served and the files aren't read again until they change. The state is kept for the next
+    update too, unless it was already part updated when the error happened, in which case it is built again from
+    scratch.
+
+    Arguments:
+        service (dict): The service from new_service.
+
+    Returns:
+        bool: True if the tables were updated.
+    """
+    files=service['files']
+    signatures={key: pipeline.file_signature(filename) if os.path.exists(filename) else None for key, filename in files.items()}
+    if signatures==service['signatures'] and service['failed'] is not None:
+        #the files have been put back the way they were for the tables being served, so those are right again
+        with service['lock']:
+            service['failed'], service['error']=None, None
+            service['responses']['status']=status_json(service)
+    if signatures==service['signatures'] or signatures==service['failed']:
+        service['pending']=None
+        return False
+    #waiting for the files to settle before reading them
+    if signatures!=service['pending']:
+        service['pending']=signatures
+        return False
+    try:
+        state, changed=pipeline.refresh_completion_state(service['state'], files['datarecord'], files['CN'], pipeline.CNnames, files['POST'],
+                                                         pipeline.POSTnames, service['overwrite'], service['chunksize'], service['valuemappings'])
+        pidformat_summaryinfo, completiondata_summaryinfo=service_tables(state)
+        if service['publishdir']:
+            sheets={'PID format data': (pidformat_summaryinfo, True), 'Completion Numbers': (completiondata_summaryinfo, True)}
+            pipeline.publish_outputs(state['FINALdatarecordframe'], sheets, service['publishdir'])
+    #anything at all going wrong (a bad export can raise almost anything from pandas) mustn't stop the service, the
+    #last good tables keep being served and the error is shown in /status
+    except Exception as error:
+        with service['lock']:
+            service['error']=type(error).__name__ + ': ' + str(error)
+            #the same files would only fail again, so they are left alone until one of them changes
+            service['failed'], service['pending']=signatures, None
+            #a state the new responses were part added to doesn't match its final data record any more, so it is
+            #built again from scratch (and even the files it was last read at have to be read again)
+            if service['state'] is not None and service['state']['updating']:
+                service['state'], service['signatures']=None, None
+            service['responses']['status']=status_json(service)
+        return False
+    #making all the responses before swapping them in, so a request never gets tables from two different updates
+    responses={'completion': table_json(completiondata_summaryinfo), 'pidformat': table_json(pidformat_summaryinfo)}
+    with service['lock']:
+        service['state'], service['signatures'], service['failed'], service['pending']=state, signatures, None, None
+        service['updated'], service['updates'], service['error']=time.time(), service['updates']+1, None
+        responses['status']=status_json(service)
+        service['responses']=responses
+    return True
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+class ServiceHandler(BaseHTTPRequestHandler):
+    """
+    Answers GET requests for the paths in SERVICE_PATHS with the JSON the service made on its last update. The service
+    is taken from the server (see serve).
+    """
+    def do_GET(self):
+        service=self.server.service
+        key=SERVICE_PATHS.get(self.path.split('?')[0].rstrip('/') or '/')
+        with service['lock']:
+            body=service['responses'][key] if key else None
+        if key=='status' and body is None:
+            body=status_json(service)
+        if body is None:
+            #503 for a table which isn't ready yet, so a client knows to try again rather than that the path is wrong
+            self.send_error(404 if key is None else 503)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        #not printing a line for every request
+        pass
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def serve(service, host='127.0.0.1', port=8765):
+    """
+    Starts the HTTP server for the service in a background thread.
+
+    Arguments:
+        service (dict): The service from new_service.
+        host (str): The address to listen on, only this computer by default.
+        port (int): The port to listen on, 0 picks a free one (see server.server_address).
+
+    Returns:
+        ThreadingHTTPServer: The server, stop it with server.shutdown().
+    """
+    server=ThreadingHTTPServer((host, port), ServiceHandler)
+    server.service=service
+    server.daemon_threads=True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def watch_folder(inputdir, host='127.0.0.1', port=8765, interval=1.0, names=None, overwrite=True, chunksize=50000, valuemappings=None,
+                 publishdir=None, stop=None):
+    """
+    Serves the tables for the files in a folder and keeps them up to date until stopped (Ctrl+C or setting stop).
+
+    Arguments:
+        inputdir (str): The folder the exports are dropped into.
+        host (str): The address to listen on.
+        port (int): The port to listen on.
+        interval (float): The number of seconds between looking at the files.
+        names, overwrite, chunksize, valuemappings, publishdir: The same as for new_service.
+        stop (threading.Event): If given, the service stops once this is set.
+
+    Returns:
+        dict: The service as it was when it stopped.
+    """
+    service=new_service(inputdir, names, overwrite, chunksize, valuemappings, publishdir)
+    server=serve(service, host, port)
+    print("Serving http://" + server.server_address[0] + ":" + str(server.server_address[1]) + " for " + inputdir)
+    stop=stop or threading.Event()
+    error=None
+    try:
+        while not stop.is_set():
+            start=time.perf_counter()
+            if refresh_service(service):
+                print("Updated in " + str(round(time.perf_counter()-start, 3)) + " seconds")
+            elif service['error']!=error and service['error']:
+                print(service['error'])
+            error=service['error']
+            stop.wait(interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        server.server_close()
+    return service
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Checks that the input files look right before the pipeline reads them properly. Only the header row of each file is
+read and nothing heavy (pandas, numpy) is imported, so checking the files takes milliseconds.
+
+Functions [Order]:
+- read_header(filename): Reads the column names from the first row of a .csv file.
+
+- check_inputs(filenameDatarecord, filenameCN, filenamePOST): Lists anything wrong with the input files.
+"""
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+import csv
+import os
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+#The columns the pipeline needs in each file (the questionnaires also need the PID question, see PID_QUESTIONS)
+DATA_RECORD_COLUMNS=['Participant ID']
+QUALTRICS_COLUMNS=['Progress', 'Finished', 'Duration (in seconds)']
+#The question which asks for the participant ID in each questionnaire, the same as its 'pidcolumn' in the pipeline's
+#SURVEY_REGISTRY (which isn't imported so that checking doesn't need pandas)
+PID_QUESTIONS={'CN': 'Q5', 'POST': 'Q1'}
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def read_header(filename):
+    """
+    Reads the column names from the first row of a .csv file.
+
+    Arguments:
+        filename (str): The file path.
+
+    Returns:
+        list: The column names, empty if the file is empty.
+    """
+    #utf-8-sig so the byte order mark Excel sometimes adds doesn't end up in the first column name
+    with open(filename, newline='', encoding='utf-8-sig', errors='replace') as file:
+        return next(csv.reader(file), [])
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def check_inputs(filenameDatarecord, filenameCN, filenamePOST):
+    """
+    Checks that each input file exists and has the columns the pipeline needs, and that the CN and Post CN exports
+    haven't been swapped round (which would use the wrong question as the PID). Which is which comes from the argument
+    each file is given as, not its name.
+
+    Arguments:
+        filenameDatarecord (str): The file path for the data record.
+        filenameCN (str): The file path for the CN questionnaire.
+        filenamePOST (str): The file path for the POST questionnaire.
+
+    Returns:
+        list: A message for each problem found, empty if everything looks fine.
+    """
+    problems=[]
+    files=[('data record', filenameDatarecord, DATA_RECORD_COLUMNS),
+           ('CN questionnaire', filenameCN, QUALTRICS_COLUMNS+[PID_QUESTIONS['CN']]),
+           ('POST questionnaire', filenamePOST, QUALTRICS_COLUMNS+[PID_QUESTIONS['POST']])]
+    headers={}
+    for name, filename, columns in files:
+        if not os.path.isfile(filename):
+            problems.append("The " + name + " " + filename + " doesn't exist")
+            continue
+        try:
+            header=read_header(filename)
+        except OSError as error:
+            problems.append("The " + name + " " + filename + " can't be read: " + str(error))
+            continue
+        headers[name]=header
+        missing=[column for column in columns if column not in header]
+        if missing:
+            problems.append("The " + name + " " + filename + " is missing the column(s) " + ", ".join(missing))
+    #only the Post CN export has a Q1, so a CN file with one is most likely the Post CN export given the wrong way round
+    if PID_QUESTIONS['POST'] in headers.get('CN questionnaire', []):
+        problems.append("The CN questionnaire " + filenameCN + " has a " + PID_QUESTIONS['POST'] + " column, so it looks like the Post CN questionnaire")
+    return problems
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Checks the duplicate policies (resolve_duplicates and the duplicatepolicy option of get_completion_data): which of a
+participant's responses each one picks, that the pick doesn't depend on the order or the chunks the responses come in,
+and the 'Duplicate PIDs' report and the 'flag' policy's count of responses.
+
+Functions [Order]:
+- responses(): A few made up responses from participants who responded more than once.
+
+- synthetic_files(tmp_path_factory): Makes the fake data record and exports once for all the tests.
+
+- expected_picks(entries, rows, duplicatepolicy): Picks the responses a simpler (and slower) way to check against.
+
+- run_policy(files, outputdir, duplicatepolicy, options): Runs get_completion_data with a duplicate policy.
+
+- test_policy_picks(...) / test_order_does_not_matter(...) / test_synthetic_picks(...) / test_chunks_match_columnar(...) /
+  test_conflict_report(...) / test_flag_counts_responses(...) / test_unknown_policy(): The checks.
+"""
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+import contextlib
+import io
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+from pid_completion import pipeline
+
+#benchmarks isn't a package, so synthetic_data is imported from its folder the same way run_benchmarks.py does
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+import synthetic_data
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+#The rows in the fake data record
+ROWS=1000
+#The fraction of responses from someone who already responded, a lot higher than the default so plenty of people have
+#three or more responses
+DUPLICATE_RATE=0.2
+#The response picked from responses() for each of its participants by each policy, with and without overwrite
+PICKS={('progress', True): {0: 'b', 1: 'e', 2: 'g'}, ('progress', False): {0: 'b', 1: 'd', 2: 'g'},
+       ('latest', True): {0: 'c', 1: 'd', 2: 'h'}, ('latest', False): {0: 'c', 1: 'd', 2: 'h'},
+       ('finished', True): {0: 'b', 1: 'e', 2: 'g'}, ('finished', False): {0: 'b', 1: 'd', 2: 'f'},
+       ('flag', True): {0: 'c', 1: 'e', 2: 'h'}, ('flag', False): {0: 'a', 1: 'd', 2: 'f'}}
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def responses():
+    """
+    A few made up responses from participants who responded more than once: row 0 got further the second time but gave
+    up on the third, row 1 responded twice the same but the first was recorded later, and row 2's first response has
+    no progress or date.
+
+    Returns:
+        tuple: The entries (with the 'Response' letter for each) and the data record row of each.
+    """
+    entries=pd.DataFrame({'ParticipantID': ['AAA111', 'AAA111', 'AAA111', 'BBB222', 'BBB222', 'CCC333', 'CCC333', 'CCC333'],
+                          'Response': list('abcdefgh'),
+                          'CNProgress': [50, 100, 20, 100, 100, np.nan, 100, 75],
+                          'CNFinished': [False, True, False, True, True, True, True, False],
+                          'RecordedDate': ['2023-07-03', '2023-07-04', '2023-07-05', '2023-07-09', '2023-07-08', None, '2023-07-01', '2023-07-02']})
+    return entries, np.array([0, 0, 0, 1, 1, 2, 2, 2])
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+@pytest.fixture(scope='module')
+def synthetic_files(tmp_path_factory):
+    """
+    Makes the fake data record and exports once for all the tests.
+
+    Arguments:
+        tmp_path_factory (pytest.TempPathFactory): Makes the folder they are saved in.
+
+    Returns:
+        dict: The file paths of the 'datarecord', 'CN' and 'POST' files.
+    """
+    return synthetic_data.generate(str(tmp_path_factory.mktemp('synthetic')), ROWS, seed=4, duplicaterate=DUPLICATE_RATE)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def expected_picks(entries, rows, duplicatepolicy):
+    """
+    Picks one response per data record row by sorting with pandas and keeping the last of each row, the way the
+    policies are described in resolve_duplicates (with later responses winning ties).
+
+    Arguments:
+        entries (pd.DataFrame): The matched responses.
+        rows (np.ndarray): The data record row of each.
+        duplicatepolicy (str): One of the DUPLICATE_POLICIES.
+
+    Returns:
+        pd.DataFrame: The picked responses, indexed by their data record row.
+    """
+    progresscolumn, finishedcolumn=pipeline.policy_columns(entries)
+    if duplicatepolicy=='progress':
+        key=pd.to_numeric(entries[progresscolumn], errors='coerce').fillna(-1)
+    elif duplicatepolicy=='latest':
+        key=pd.to_datetime(entries['RecordedDate'], errors='coerce').fillna(pd.Timestamp.min)
+    elif duplicatepolicy=='finished':
+        key=entries[finishedcolumn].fillna(False).astype(bool)
+    else:
+        key=pd.Series(0, index=entries.index)
+    order=pd.DataFrame({'row': rows, 'key': key.to_numpy(), 'position': np.arange(len(rows))}).sort_values(['row', 'key', 'position'])
+    picked=order.groupby('row').tail(1)
+    return entries.iloc[picked['position'].to_numpy()].set_index(picked['row'].to_numpy())
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def run_policy(files, outputdir, duplicatepolicy, options):
+    """
+    Runs get_completion_data with a duplicate policy, saving the data record as .csv files.
+
+    Arguments:
+        files (dict): The files from synthetic_files.
+        outputdir (str): Where the output is saved.
+        duplicatepolicy (str): One of the DUPLICATE_POLICIES.
+        options (dict): Any other keyword arguments, e.g. chunksize.
+
+    Returns:
+        tuple: The same as get_completion_data.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        return pipeline.get_completion_data(files['datarecord'], files['CN'], pipeline.CNnames, files['POST'], pipeline.POSTnames,
+                                            outputfile=os.path.join(outputdir, 'Participant Completion Data.xlsx'), outputformat='csv',
+                                            duplicatepolicy=duplicatepolicy, **options)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+@pytest.mark.parametrize('duplicatepolicy, overwrite', list(PICKS))
+def test_policy_picks(duplicatepolicy, overwrite):
+    entries, rows=responses()
+    keep=pipeline.resolve_duplicates(entries, rows, duplicatepolicy, overwrite)
+    assert dict(zip(rows[keep], entries.loc[keep, 'Response']))==PICKS[(duplicatepolicy, overwrite)]
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+@pytest.mark.parametrize('duplicatepolicy', ['progress', 'latest'])
+def test_order_does_not_matter(duplicatepolicy):
+    entries, rows=responses()
+    #without e there are no ties for these policies to fall back on the order for
+    entries=entries.drop(index=[4])
+    rows=np.delete(rows, 4)
+    picks=set(entries.loc[pipeline.resolve_duplicates(entries, rows, duplicatepolicy), 'Response'])
+    for seed in range(5):
+        order=np.random.default_rng(seed).permutation(len(rows))
+        shuffled=entries.iloc[order]
+        assert set(shuffled.loc[pipeline.resolve_duplicates(shuffled, rows[order], duplicatepolicy), 'Response'])==picks
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+@pytest.mark.parametrize('duplicatepolicy', list(pipeline.DUPLICATE_POLICIES))
+def test_synthetic_picks(synthetic_files, duplicatepolicy):
+    datarecordframe=pipeline.read_data_record_frame(synthetic_files['datarecord'])
+    pidindex, duplicate_pids=pipeline.build_pid_index(datarecordframe['Participant ID'])
+    frame=pipeline.read_qualtrics_frame(synthetic_files['CN'], survey='CN', keep=pipeline.DUPLICATE_POLICIES[duplicatepolicy])
+    matcheddata, joinreport=pipeline.match_qualtrics_frame(pidindex, frame, duplicatepolicy=duplicatepolicy)
+    rows=pipeline.lookup_rows(frame['ParticipantID'], pidindex)
+    found=rows.notna()
+    expected=expected_picks(frame[found], rows[found].astype('int64').to_numpy(), duplicatepolicy)
+    assert joinreport['duplicate']
+    pd.testing.assert_frame_equal(matcheddata.drop(columns='CNResponses', errors='ignore').sort_index(), expected.sort_index())
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+@pytest.mark.parametrize('duplicatepolicy', list(pipeline.DUPLICATE_POLICIES))
+def test_chunks_match_columnar(synthetic_files, tmp_path, duplicatepolicy):
+    #picking in chunks and then between the chunks' picks has to come out the same as picking from everything at once
+    columnar=run_policy(synthetic_files, str(tmp_path), duplicatepolicy, {'columnar': True})
+    chunked=run_policy(synthetic_files, str(tmp_path), duplicatepolicy, {'chunksize': 97})
+    for expected, result in zip(columnar, chunked):
+        pd.testing.assert_frame_equal(expected, result)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def test_conflict_report(synthetic_files, tmp_path):
+    run_policy(synthetic_files, str(tmp_path), 'progress', {'columnar': True})
+    report=pd.read_excel(os.path.join(str(tmp_path), 'Participant Completion Data.xlsx'), sheet_name='Duplicate PIDs')
+    groups=report.groupby(['Survey', 'ParticipantID'])
+    #every participant listed responded more than once, all of their responses are listed and exactly one was kept
+    assert (groups.size()>1).all()
+    assert (groups['Responses'].agg(['min', 'max', 'size']).apply(lambda counts: counts['min']==counts['max']==counts['size'], axis=1)).all()
+    assert (groups['Kept'].sum()==1).all()
+    #and the one kept got the furthest
+    kept=report[report['Kept']].set_index(['Survey', 'ParticipantID'])['Progress']
+    assert (kept>=groups['Progress'].max().reindex(kept.index)).all()
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def test_flag_counts_responses(synthetic_files, tmp_path):
+    flagged=run_policy(synthetic_files, str(tmp_path), 'flag', {'columnar': True})[0]
+    unflagged=run_policy(synthetic_files, str(tmp_path), None, {'columnar': True})[0]
+    datarecordframe=pipeline.read_data_record_frame(synthetic_files['datarecord'])
+    pidindex, duplicate_pids=pipeline.build_pid_index(datarecordframe['Participant ID'])
+    for name, survey in [('CN', 'CN'), ('Post', 'POST')]:
+        frame=pipeline.read_qualtrics_frame(synthetic_files[survey], survey=survey)
+        rows=pipeline.lookup_rows(frame['ParticipantID'], pidindex).dropna().astype('int64')
+        counts=rows.value_counts().reindex(flagged.index)
+        pd.testing.assert_series_equal(flagged[name+'Responses'], counts, check_dtype=False, check_names=False)
+    #apart from the counts, 'flag' keeps the same response as no policy
+    pd.testing.assert_frame_equal(flagged.drop(columns=['CNResponses', 'PostResponses']), unflagged)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def test_unknown_policy():
+    entries, rows=responses()
+    with pytest.raises(ValueError):
+        pipeline.resolve_duplicates(entries, rows, 'first')
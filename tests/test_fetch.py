@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Checks pid_completion.fetch against the stand-in for the Qualtrics export API in benchmarks/fake_qualtrics.py, with the
+fake exports from benchmarks/synthetic_data.py. The exports are parsed with the default parse_export as they arrive,
+so what comes back has to be the same as reading the files by hand, even with requests failing on purpose.
+
+Functions [Order]:
+- synthetic_files(tmp_path_factory): Makes the fake data record and exports once for all the tests.
+
+- config(tmp_path): Writes a fetch config like the one the fetch command is given.
+
+- start_server(synthetic_files, failurerate): Starts the stand-in serving the fake exports.
+
+- fetch_surveys(server, surveys, connections): Fetches the surveys from the stand-in.
+
+- test_fetch_retries(synthetic_files, config) / test_fetch_pooling(synthetic_files, config) /
+  test_parse_export_unknown_name(synthetic_files): The checks.
+"""
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+import contextlib
+import io
+import json
+import os
+import sys
+import pytest
+
+from pid_completion import fetch, pipeline
+
+#benchmarks isn't a package, so the stand-in is imported from its folder the same way run_benchmarks.py does
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+import fake_qualtrics
+import synthetic_data
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+#The rows in the fake data record, the exports only need to be big enough to be sent in several blocks
+ROWS=1000
+#The survey ID for each name in the config, by file name the way load_fetch_config shows and by name in SURVEY_REGISTRY
+SURVEYS={'CN Questionnaire Results.csv': 'SV_cn', 'Post CN Questionnaire Results.csv': 'SV_post', 'CN': 'SV_cn', 'POST': 'SV_post'}
+#Which survey each name is, to check the results against
+SURVEY_NAMES={'CN Questionnaire Results.csv': 'CN', 'Post CN Questionnaire Results.csv': 'POST', 'CN': 'CN', 'POST': 'POST'}
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+@pytest.fixture(scope='module')
+def synthetic_files(tmp_path_factory):
+    """
+    Makes the fake data record and exports once for all the tests.
+
+    Arguments:
+        tmp_path_factory (pytest.TempPathFactory): Makes the folder they are saved in.
+
+    Returns:
+        dict: The file paths of the 'datarecord', 'CN' and 'POST' files.
+    """
+    return synthetic_data.generate(str(tmp_path_factory.mktemp('synthetic')), ROWS, seed=2)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+@pytest.fixture
+def config(tmp_path):
+    """
+    Writes a fetch config with SURVEYS, read back with load_fetch_config as the fetch command does.
+
+    Arguments:
+        tmp_path (pathlib.Path): The folder it is saved in.
+
+    Returns:
+        dict: The config, whose 'baseurl' isn't used as the stand-in's port isn't known until it starts.
+    """
+    filename=str(tmp_path/'Surveys.json')
+    with open(filename, 'w', encoding='utf-8') as file:
+        json.dump({'baseurl': 'http://127.0.0.1', 'surveys': SURVEYS}, file)
+    return fetch.load_fetch_config(filename)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def start_server(synthetic_files, failurerate):
+    """
+    Starts the stand-in serving the fake exports. The exports are ready straight away, so fetching one takes exactly
+    three requests (start, check and download) unless some fail, and each is sent slowly enough to arrive in blocks.
+
+    Arguments:
+        synthetic_files (dict): The files from synthetic_files.
+        failurerate (float): The fraction of requests which fail on purpose.
+
+    Returns:
+        ThreadingHTTPServer: The stand-in, see start_fake_qualtrics.
+    """
+    return fake_qualtrics.start_fake_qualtrics({'SV_cn': synthetic_files['CN'], 'SV_post': synthetic_files['POST']}, exportdelay=0,
+                                               bytespersecond=50*1024*1024, failurerate=failurerate, seed=1)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def fetch_surveys(server, surveys, connections):
+    """
+    Fetches the surveys from the stand-in with the default parsing, without printing the join reports.
+
+    Arguments:
+        server (ThreadingHTTPServer): The stand-in.
+        surveys (dict): The survey ID for each name.
+        connections (int): The most connections open at once.
+
+    Returns:
+        dict: What parse_export returned for each name.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fetch.fetch_exports(surveys, server.baseurl, fake_qualtrics.FAKE_TOKEN, connections=connections, pollinterval=0.01, backoff=0.01)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def test_fetch_retries(synthetic_files, config):
+    server=start_server(synthetic_files, 0.3)
+    try:
+        results=fetch_surveys(server, config['surveys'], 8)
+    finally:
+        server.shutdown()
+    #only failed requests being tried again can make more than three per export
+    assert server.requests>3*len(SURVEYS)
+    with contextlib.redirect_stdout(io.StringIO()):
+        expected={survey: pipeline.read_qualtrics_data(synthetic_files[survey], survey=survey) for survey in ('CN', 'POST')}
+    assert list(results)==list(SURVEYS)
+    for name, result in results.items():
+        assert result==expected[SURVEY_NAMES[name]]
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def test_fetch_pooling(synthetic_files, config):
+    server=start_server(synthetic_files, 0)
+    try:
+        results=fetch_surveys(server, config['surveys'], 2)
+    finally:
+        server.shutdown()
+    #with nothing failing the connections are only ever opened up to the limit and then reused for every request
+    assert len(results)==len(SURVEYS)
+    assert server.requests==3*len(SURVEYS)
+    assert server.connections<=2
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def test_parse_export_unknown_name(synthetic_files):
+    with open(synthetic_files['CN'], 'rb') as source, pytest.raises(ValueError):
+        fetch.parse_export('Some Other Survey.csv', source)
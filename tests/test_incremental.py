@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+Checks the incremental state (refresh_completion_state and update_completion_state) on the fake exports from
+benchmarks/synthetic_data.py: responses added to the bottom of an export between runs are read on their own, anything
+else changed in an export means it is read again from the start, and either way the state ends up the same as one
+made from scratch from the files as they are now.
+
+Functions [Order]:
+- synthetic_files(tmp_path_factory): Makes the fake data record and exports once for all the tests.
+
+- export_lines(files, key): Reads the lines of one of the fake exports.
+
+- write_folder(files, folder, fractions): Copies the fake data record and the first part of each export into a folder.
+
+- refresh(state, folder): Brings a state up to date with the files in a folder.
+
+- assert_state_matches(state, folder): Checks a state is the same as one made from scratch.
+
+- test_appended_rows_read_on_their_own(...) / test_changed_response_read_again(...) / test_edited_last_row_read_again(...)
+  / test_nothing_changed(...) / test_data_record_changed(...) / test_statefile_between_runs(...): The checks.
+"""
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+import contextlib
+import io
+import os
+import shutil
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+from pid_completion import pipeline
+
+#benchmarks isn't a package, so synthetic_data is imported from its folder the same way run_benchmarks.py does
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+import synthetic_data
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+#The rows in the fake data record
+ROWS=1000
+#The number of rows read at a time, small so each export is read in several chunks
+CHUNKSIZE=97
+#The names the files are copied into a folder under
+FILES={'datarecord': synthetic_data.DATA_RECORD_FILE, 'CN': synthetic_data.CN_FILE, 'POST': synthetic_data.POST_FILE}
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+@pytest.fixture(scope='module')
+def synthetic_files(tmp_path_factory):
+    """
+    Makes the fake data record and exports once for all the tests.
+
+    Arguments:
+        tmp_path_factory (pytest.TempPathFactory): Makes the folder they are saved in.
+
+    Returns:
+        dict: The file paths of the 'datarecord', 'CN' and 'POST' files.
+    """
+    return synthetic_data.generate(str(tmp_path_factory.mktemp('synthetic')), ROWS, seed=6)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def export_lines(files, key):
+    """
+    Reads the lines of one of the fake exports, both header rows then a line for each response.
+
+    Arguments:
+        files (dict): The files from synthetic_files.
+        key (str): 'CN' or 'POST'.
+
+    Returns:
+        list: The lines, as bytes with their line endings.
+    """
+    with open(files[key], 'rb') as file:
+        return file.readlines()
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def write_folder(files, folder, fractions=None):
+    """
+    Copies the fake data record and the first part of each export into a folder, keeping both header rows.
+
+    Arguments:
+        files (dict): The files from synthetic_files.
+        folder (str): The folder to copy them into, under FILES.
+        fractions (dict): The fraction of each export's responses to copy, all of them for any not given.
+    """
+    #copy2 keeps the time the data record was changed, so copying it again doesn't look like a new one
+    shutil.copy2(files['datarecord'], os.path.join(folder, FILES['datarecord']))
+    for key in ['CN', 'POST']:
+        lines=export_lines(files, key)
+        with open(os.path.join(folder, FILES[key]), 'wb') as file:
+            file.writelines(lines[:2+int((len(lines)-2)*(fractions or {}).get(key, 1))])
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def refresh(state, folder):
+    """
+    Brings a state up to date with the files in a folder, without printing the join reports.
+
+    Arguments:
+        state (dict): The state from the last refresh, or None.
+        folder (str): The folder with the files in.
+
+    Returns:
+        tuple: The same as refresh_completion_state.
+    """
+    names={key: os.path.join(folder, name) for key, name in FILES.items()}
+    with contextlib.redirect_stdout(io.StringIO()):
+        return pipeline.refresh_completion_state(state, names['datarecord'], names['CN'], pipeline.CNnames, names['POST'], pipeline.POSTnames,
+                                                 chunksize=CHUNKSIZE)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def assert_state_matches(state, folder):
+    """
+    Checks a state is the same as one made from scratch from the files in a folder.
+
+    Arguments:
+        state (dict): The state.
+        folder (str): The folder with the files in.
+    """
+    expected, changed=refresh(None, folder)
+    pd.testing.assert_frame_equal(expected['FINALdatarecordframe'], state['FINALdatarecordframe'])
+    np.testing.assert_array_equal(expected['completioncodes'], state['completioncodes'])
+    for name in ['CN', 'POST']:
+        expectedsurvey, surveystate=expected['surveys'][name], state['surveys'][name]
+        for key in ['offset', 'rows', 'pidcounts', 'responses', 'watermark']:
+            assert expectedsurvey[key]==surveystate[key], key
+        pd.testing.assert_frame_equal(expectedsurvey['matches'].sort_index(), surveystate['matches'].sort_index())
+    assert not state['updating']
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def test_appended_rows_read_on_their_own(synthetic_files, tmp_path, monkeypatch):
+    write_folder(synthetic_files, str(tmp_path), {'CN': 0.5, 'POST': 0.7})
+    state, changed=refresh(None, str(tmp_path))
+    rows=len(state['FINALdatarecordframe'])
+    write_folder(synthetic_files, str(tmp_path))
+    #only the new responses should be read, so reading a whole export again fails the test
+    with monkeypatch.context() as patch:
+        patch.setattr(pipeline, 'scan_survey', lambda *arguments, **keywords: pytest.fail("An export was read again from the start"))
+        newstate, changed=refresh(state, str(tmp_path))
+    assert changed and newstate is state and len(newstate['FINALdatarecordframe'])==rows
+    assert_state_matches(newstate, str(tmp_path))
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def test_changed_response_read_again(synthetic_files, tmp_path, monkeypatch):
+    write_folder(synthetic_files, str(tmp_path))
+    state, changed=refresh(None, str(tmp_path))
+    #a response which is exported again at the bottom (e.g. after it was edited in Qualtrics) has been seen before
+    lines=export_lines(synthetic_files, 'CN')
+    with open(os.path.join(str(tmp_path), FILES['CN']), 'ab') as file:
+        file.write(lines[2].replace(b',100,', b',50,', 1))
+    scanned=[]
+    scan_survey=pipeline.scan_survey
+    def spy(filenameQualtrics, *arguments, **keywords):
+        scanned.append(os.path.basename(filenameQualtrics))
+        return scan_survey(filenameQualtrics, *arguments, **keywords)
+    monkeypatch.setattr(pipeline, 'scan_survey', spy)
+    state, changed=refresh(state, str(tmp_path))
+    assert changed and scanned==[FILES['CN']]
+    assert_state_matches(state, str(tmp_path))
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def test_edited_last_row_read_again(synthetic_files, tmp_path):
+    write_folder(synthetic_files, str(tmp_path), {'CN': 0.8})
+    state, changed=refresh(None, str(tmp_path))
+    #changing a response which was already read (rather than adding one) means the end of the file isn't the same
+    filename=os.path.join(str(tmp_path), FILES['CN'])
+    with open(filename, 'rb') as file:
+        lines=file.readlines()
+    edited=lines[-1].replace(b'Agree', b'Disagree')
+    assert edited!=lines[-1]
+    with open(filename, 'wb') as file:
+        file.writelines(lines[:-1]+[edited])
+    assert pipeline.read_appended_rows(filename, state['surveys']['CN']) is None
+    state, changed=refresh(state, str(tmp_path))
+    assert changed
+    assert_state_matches(state, str(tmp_path))
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def test_nothing_changed(synthetic_files, tmp_path):
+    write_folder(synthetic_files, str(tmp_path))
+    state, changed=refresh(None, str(tmp_path))
+    assert changed
+    frame=state['FINALdatarecordframe']
+    state, changed=refresh(state, str(tmp_path))
+    assert not changed and state['FINALdatarecordframe'] is frame
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def test_data_record_changed(synthetic_files, tmp_path):
+    write_folder(synthetic_files, str(tmp_path))
+    state, changed=refresh(None, str(tmp_path))
+    #a new participant in the data record changes which rows every response matches, so everything is made again
+    datarecord=pd.read_csv(synthetic_files['datarecord'])
+    datarecord=pd.concat([datarecord, datarecord.iloc[[0]].assign(**{'Participant ID': 'ZZZ999'})], ignore_index=True)
+    datarecord.to_csv(os.path.join(str(tmp_path), FILES['datarecord']), index=False)
+    newstate, changed=refresh(state, str(tmp_path))
+    assert changed and newstate is not state
+    assert len(newstate['FINALdatarecordframe'])==len(datarecord)
+    assert_state_matches(newstate, str(tmp_path))
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def test_statefile_between_runs(synthetic_files, tmp_path):
+    write_folder(synthetic_files, str(tmp_path), {'CN': 0.4, 'POST': 0.4})
+    statefile=str(tmp_path/'state.pkl')
+    names={key: os.path.join(str(tmp_path), name) for key, name in FILES.items()}
+    for fraction in [0.4, 0.7, 1]:
+        write_folder(synthetic_files, str(tmp_path), {'CN': fraction, 'POST': fraction})
+        with contextlib.redirect_stdout(io.StringIO()):
+            state=pipeline.update_completion_state(statefile, names['datarecord'], names['CN'], pipeline.CNnames, names['POST'], pipeline.POSTnames,
+                                                   chunksize=CHUNKSIZE)
+        assert_state_matches(pd.read_pickle(statefile), str(tmp_path))
+    assert_state_matches(state, str(tmp_path))
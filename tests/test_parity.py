@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Checks that every mode of get_completion_data gives the same answers as the original dictionary mode, on fake data from
+benchmarks/synthetic_data.py (with wrongly entered PIDs, people doing a questionnaire twice and repeated PIDs in the
+data record). The PID format and completion tables have to be exactly the same. The data records only have to have the
+same values, as the modes store them differently (e.g. CNProgress is object in the dictionary mode and float64 in the
+others, and the compact mode has True instead of 'Y' for the tasks and categories for the answers).
+
+Functions [Order]:
+- synthetic_files(tmp_path_factory): Makes the fake data record and exports once for all the tests.
+
+- run_mode(files, outputdir, options): Runs get_completion_data in one mode.
+
+- dictionary(synthetic_files, tmp_path_factory) / mode(synthetic_files, tmp_path_factory, request): The output of the
+  dictionary mode and of each of the MODES.
+
+- read_data_record(outputfile): Reads back the data record saved next to the output.
+
+- comparable_values(frame): Turns a data record into plain values so the modes can be compared.
+
+- test_tables_match(dictionary, mode) / test_data_record_matches(dictionary, mode): The checks.
+
+- test_database_excel_matches(synthetic_files, tmp_path): Checks the database mode's Excel output, which it writes itself
+  rather than through write_outputs.
+"""
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+import contextlib
+import glob
+import io
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+from pid_completion import pipeline
+
+#benchmarks isn't a package, so synthetic_data is imported from its folder the same way run_benchmarks.py does
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+import synthetic_data
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+#The rows in the fake data record, enough for every kind of PID problem to turn up plenty of times
+ROWS=2000
+#The options for each mode checked against the dictionary mode, the statefile and database go in the output folder.
+#The chunk size is small so the exports are read in several chunks
+MODES={'columnar': {'columnar': True},
+       'chunked': {'chunksize': 250},
+       'statefile': {'statefile': 'state.pkl', 'chunksize': 250},
+       'database': {'database': 'completion.sqlite', 'chunksize': 250},
+       'compact': {'columnar': True, 'compact': True}}
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+@pytest.fixture(scope='module')
+def synthetic_files(tmp_path_factory):
+    """
+    Makes the fake data record and exports once for all the tests.
+
+    Arguments:
+        tmp_path_factory (pytest.TempPathFactory): Makes the folder they are saved in.
+
+    Returns:
+        dict: The file paths of the 'datarecord', 'CN' and 'POST' files.
+    """
+    return synthetic_data.generate(str(tmp_path_factory.mktemp('synthetic')), ROWS, seed=1)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def run_mode(files, outputdir, options):
+    """
+    Runs get_completion_data in one mode, saving the data record as .csv files so it can be read back even from the
+    database mode (which doesn't return it).
+
+    Arguments:
+        files (dict): The files from synthetic_files.
+        outputdir (str): Where the output, and any statefile or database, are saved.
+        options (dict): The keyword arguments for the mode.
+
+    Returns:
+        dict: The 'frame' returned (None for the database mode), the 'pidformat' and 'completion' tables and the
+        'saved' data record read back from the output.
+    """
+    options={key: os.path.join(outputdir, value) if key in ('statefile', 'database') else value for key, value in options.items()}
+    outputfile=os.path.join(outputdir, 'Participant Completion Data.xlsx')
+    #the join reports are printed for every run, which would just clutter the test output
+    with contextlib.redirect_stdout(io.StringIO()):
+        frame, pidformat, completion=pipeline.get_completion_data(files['datarecord'], files['CN'], pipeline.CNnames, files['POST'], pipeline.POSTnames,
+                                                                  outputfile=outputfile, outputformat='csv', **options)
+    return {'frame': frame, 'pidformat': pidformat, 'completion': completion, 'saved': read_data_record(outputfile)}
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+@pytest.fixture(scope='module')
+def dictionary(synthetic_files, tmp_path_factory):
+    """
+    The output of the dictionary mode, which everything is checked against.
+
+    Arguments:
+        synthetic_files (dict): The files from synthetic_files.
+        tmp_path_factory (pytest.TempPathFactory): Makes the output folder.
+
+    Returns:
+        dict: The same as run_mode.
+    """
+    return run_mode(synthetic_files, str(tmp_path_factory.mktemp('dictionary')), {})
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+@pytest.fixture(scope='module', params=list(MODES))
+def mode(synthetic_files, tmp_path_factory, request):
+    """
+    The output of each of the MODES, run once for all the checks on it.
+
+    Arguments:
+        synthetic_files (dict): The files from synthetic_files.
+        tmp_path_factory (pytest.TempPathFactory): Makes the output folder.
+        request (pytest.FixtureRequest): Says which of the MODES.
+
+    Returns:
+        dict: The same as run_mode, with the 'name' of the mode.
+    """
+    return {'name': request.param, **run_mode(synthetic_files, str(tmp_path_factory.mktemp(request.param)), MODES[request.param])}
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def read_data_record(outputfile):
+    """
+    Reads back the data record which write_outputs saved as .csv parts next to the output.
+
+    Arguments:
+        outputfile (str): The Excel file given to get_completion_data.
+
+    Returns:
+        pd.DataFrame: The saved data record.
+    """
+    parts=sorted(glob.glob(os.path.join(os.path.splitext(outputfile)[0]+' CSV', 'part-*.csv')))
+    return pd.concat([pd.read_csv(part, index_col=0, low_memory=False) for part in parts])
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def comparable_values(frame):
+    """
+    Turns a data record into plain values, so data records which hold the same values in different types can be
+    compared. The compact mode's True for a task becomes 'Y' again and every blank becomes NaN.
+
+    Arguments:
+        frame (pd.DataFrame): The data record.
+
+    Returns:
+        pd.DataFrame: The data record with every column as object.
+    """
+    frame=frame.copy()
+    for column in pipeline.COMPLETION_TASKS.values():
+        if frame[column].dtype=='boolean':
+            frame[column]=frame[column].map({True: 'Y'}, na_action='ignore')
+    frame=frame.astype(object)
+    return frame.where(frame.notna(), np.nan)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def test_tables_match(dictionary, mode):
+    pd.testing.assert_frame_equal(dictionary['pidformat'], mode['pidformat'])
+    pd.testing.assert_frame_equal(dictionary['completion'], mode['completion'])
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def test_data_record_matches(dictionary, mode):
+    if mode['name']=='database':
+        #the database mode never has the whole data record in memory, so the one it saved is checked instead
+        pd.testing.assert_frame_equal(dictionary['saved'], mode['saved'])
+    else:
+        pd.testing.assert_frame_equal(comparable_values(dictionary['frame']), comparable_values(mode['frame']), check_dtype=False)
+        pd.testing.assert_index_equal(dictionary['frame'].columns, mode['frame'].columns)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def test_database_excel_matches(synthetic_files, tmp_path):
+    outputs={}
+    for name, options in (('dictionary', {}), ('database', {'database': str(tmp_path/'completion.sqlite'), 'chunksize': 250})):
+        outputfile=str(tmp_path/(name+'.xlsx'))
+        with contextlib.redirect_stdout(io.StringIO()):
+            pipeline.get_completion_data(synthetic_files['datarecord'], synthetic_files['CN'], pipeline.CNnames, synthetic_files['POST'], pipeline.POSTnames,
+                                         outputfile=outputfile, **options)
+        outputs[name]=pd.read_excel(outputfile, sheet_name=None)
+    assert list(outputs['dictionary'])==list(outputs['database'])
+    for sheet in outputs['dictionary']:
+        pd.testing.assert_frame_equal(outputs['dictionary'][sheet], outputs['database'][sheet])
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Checks the PID recovery (recover_pids and recover_pid_frame): typos between confusable characters only counting as
+half, close matches being suggested for the PIDs benchmarks/synthetic_data.py enters wrong, and automerge only ever
+merging a suggestion when there's just one PID in the data record it could be.
+
+Functions [Order]:
+- synthetic_files(tmp_path_factory): Makes the fake data record and exports once for all the tests.
+
+- synthetic_recovery(synthetic_files): Runs the recovery on the fake CN export.
+
+- test_pid_distance(pid, candidate, distance) / test_confusable_beats_typo() / test_automerge_skips_ambiguous() /
+  test_no_automerge_only_suggests(): The checks on PIDs made up for them.
+
+- test_synthetic_mistakes_recovered(synthetic_recovery) / test_synthetic_automerge(synthetic_recovery): The checks on
+  the fake CN export.
+"""
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+import os
+import sys
+import pandas as pd
+import pytest
+
+from pid_completion import pipeline
+
+#benchmarks isn't a package, so synthetic_data is imported from its folder the same way run_benchmarks.py does
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+import synthetic_data
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+#The rows in the fake data record, enough for every kind of wrongly entered PID to turn up plenty of times
+ROWS=2000
+#The confidence needed to merge in synthetic_recovery, which a single typo has (with the default maxdistance of 1)
+AUTOMERGE=0.5
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+@pytest.fixture(scope='module')
+def synthetic_files(tmp_path_factory):
+    """
+    Makes the fake data record and exports once for all the tests. The malformed rate is higher than the default so
+    there are plenty of typos.
+
+    Arguments:
+        tmp_path_factory (pytest.TempPathFactory): Makes the folder they are saved in.
+
+    Returns:
+        dict: The file paths of the 'datarecord', 'CN' and 'POST' files.
+    """
+    return synthetic_data.generate(str(tmp_path_factory.mktemp('synthetic')), ROWS, seed=3, malformedrate=0.3)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+@pytest.fixture(scope='module')
+def synthetic_recovery(synthetic_files):
+    """
+    Runs the recovery on the fake CN export, the same way read_and_match_surveys does.
+
+    Arguments:
+        synthetic_files (dict): The files from synthetic_files.
+
+    Returns:
+        dict: The 'pidindex' of the data record, the CN 'frame' as read, and the 'merged' frame and 'proposals' from
+        recover_pid_frame with AUTOMERGE.
+    """
+    datarecordframe=pipeline.read_data_record_frame(synthetic_files['datarecord'])
+    pidindex, duplicate_pids=pipeline.build_pid_index(datarecordframe['Participant ID'])
+    recoveryindex=pipeline.build_recovery_index(pidindex)
+    frame=pipeline.read_qualtrics_frame(synthetic_files['CN'], survey='CN')
+    merged, proposals=pipeline.recover_pid_frame(frame, pidindex, recoveryindex, AUTOMERGE)
+    return {'pidindex': pidindex, 'frame': frame, 'merged': merged, 'proposals': proposals}
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+@pytest.mark.parametrize('pid, candidate, distance', [('ABC123', 'ABC123', 0), ('AB0DEF', 'ABODEF', 0.5), ('ABODEF', 'AB0DEF', 0.5),
+                                                      ('S1ZBG0', '5I286O', 3), ('ABCDEF', 'ABCDEX', 1), ('ABCDEF', 'ABCDFE', 1),
+                                                      ('ABCDE', 'ABCDEF', 1), ('ABCDEFG', 'ABCDEF', 1), ('ABCDEF', 'UVWXYZ', 6)])
+def test_pid_distance(pid, candidate, distance):
+    assert pipeline.pid_distance(pid, candidate)==distance
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def test_confusable_beats_typo():
+    recoveryindex=pipeline.build_recovery_index(['ABCDE0', 'ABCDEX'])
+    proposals=pipeline.recover_pids(['ABCDEO'], recoveryindex)
+    #O for 0 is closer than O for X, so there's only the one best suggestion and it isn't ambiguous
+    assert proposals[['Candidate', 'Distance', 'Ambiguous']].values.tolist()==[['ABCDE0', 0.5, False]]
+    assert proposals['Confidence'].item()==0.75
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def test_automerge_skips_ambiguous():
+    pidindex={'ABC123': 0, 'ABC124': 1, 'XYZ789': 2}
+    recoveryindex=pipeline.build_recovery_index(pidindex)
+    frame=pd.DataFrame({'ParticipantID': ['ABC12X', 'XYZ78', 'XYZ78', 'ABC123', 'NAN'], 'Answer': [1, 2, 3, 4, 5]})
+    merged, proposals=pipeline.recover_pid_frame(frame, pidindex, recoveryindex, automerge=0)
+    proposals=proposals.set_index(['ParticipantID', 'Candidate'])
+    #ABC12X is one typo from both ABC123 and ABC124, so even a confidence of 0 doesn't merge it
+    assert proposals.loc[('ABC12X', 'ABC123'), 'Ambiguous'] and proposals.loc[('ABC12X', 'ABC124'), 'Ambiguous']
+    assert not proposals.loc[proposals['Ambiguous'], 'Merged'].any()
+    assert proposals.loc[('XYZ78', 'XYZ789'), ['Entries', 'Merged']].tolist()==[2, True]
+    assert merged['ParticipantID'].tolist()==['ABC12X', 'XYZ789', 'XYZ789', 'ABC123', 'NAN']
+    #the questionnaire data given is left as it was
+    assert frame['ParticipantID'].tolist()==['ABC12X', 'XYZ78', 'XYZ78', 'ABC123', 'NAN']
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def test_no_automerge_only_suggests():
+    pidindex={'XYZ789': 0}
+    frame=pd.DataFrame({'ParticipantID': ['XYZ78']})
+    merged, proposals=pipeline.recover_pid_frame(frame, pidindex, pipeline.build_recovery_index(pidindex))
+    assert merged is frame
+    assert proposals['Candidate'].tolist()==['XYZ789'] and not proposals['Merged'].any()
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def test_synthetic_mistakes_recovered(synthetic_recovery):
+    pidindex, frame, proposals=synthetic_recovery['pidindex'], synthetic_recovery['frame'], synthetic_recovery['proposals']
+    unmatched=frame.loc[~frame['ParticipantID'].isin(pidindex), 'ParticipantID']
+    #the spaces and dashes synthetic_data adds only need tidying up, so they are suggested with full confidence
+    tidied=unmatched[unmatched.map(pipeline.normalise_pid).isin(pidindex)].unique()
+    assert len(tidied)
+    found=proposals.set_index('ParticipantID')
+    for pid in tidied:
+        assert found.loc[[pid], 'Candidate'].tolist()==[pipeline.normalise_pid(pid)]
+        assert found.loc[pid, 'Confidence']==1
+    #and the PIDs with a wrong last character are suggested at one typo or less
+    assert (proposals['Distance']<=1).all() and (proposals['Distance']>0).any()
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def test_synthetic_automerge(synthetic_recovery):
+    pidindex, frame, merged, proposals=(synthetic_recovery[key] for key in ['pidindex', 'frame', 'merged', 'proposals'])
+    expected=~proposals['Ambiguous'] & (proposals['Confidence']>=AUTOMERGE)
+    assert proposals['Merged'].equals(expected) and expected.any()
+    assert not proposals.loc[proposals['Ambiguous'], 'Merged'].any()
+    #every merged entry now has its PID from the data record, and nothing else was changed
+    merges=dict(zip(proposals.loc[proposals['Merged'], 'ParticipantID'], proposals.loc[proposals['Merged'], 'Candidate']))
+    changed=frame['ParticipantID']!=merged['ParticipantID']
+    assert (frame.loc[changed, 'ParticipantID'].map(merges)==merged.loc[changed, 'ParticipantID']).all()
+    assert merged.loc[changed, 'ParticipantID'].isin(pidindex).all()
+    assert merged['ParticipantID'].isin(pidindex).sum()==frame['ParticipantID'].isin(pidindex).sum()+changed.sum()
+    pd.testing.assert_frame_equal(frame.drop(columns='ParticipantID'), merged.drop(columns='ParticipantID'))
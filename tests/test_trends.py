@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Checks the completion trends: the running totals by day (add_prefix_counts and prefix_counts_between) against counting
+everything by hand, and trends brought up to date with extend_trends against the ones build_trends makes from scratch,
+both made up and from get_completion_data on the fake exports from benchmarks/synthetic_data.py with responses added
+to the bottom between runs, the way Qualtrics adds them.
+
+Functions [Order]:
+- synthetic_files(tmp_path_factory): Makes the fake data record and exports once for all the tests.
+
+- write_exports(files, folder, fraction): Copies the fake data record and the first part of each export into a folder.
+
+- run_trends(folder, trendsfile, options): Runs get_completion_data with trends on the files in a folder.
+
+- assert_trends_equal(expected, result): Checks two trends count the same things on the same days.
+
+- test_prefix_sums_match_counting() / test_extend_moves_changed_rows() / test_extend_rebuilds_when_export_shrinks() /
+  test_extend_matches_build(synthetic_files, tmp_path, monkeypatch, options): The checks.
+"""
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+import contextlib
+import io
+import os
+import shutil
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+from pid_completion import pipeline
+
+#benchmarks isn't a package, so synthetic_data is imported from its folder the same way run_benchmarks.py does
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+import synthetic_data
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+#The rows in the fake data record
+ROWS=1000
+#The fraction of each export the first run sees before the rest is added
+FIRST_FRACTION=0.6
+#The modes that can keep trends between runs, the statefile goes in the run's folder
+MODES={'columnar': {'columnar': True}, 'chunked': {'chunksize': 97}, 'statefile': {'statefile': 'state.pkl', 'chunksize': 97}}
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+@pytest.fixture(scope='module')
+def synthetic_files(tmp_path_factory):
+    """
+    Makes the fake data record and exports once for all the tests.
+
+    Arguments:
+        tmp_path_factory (pytest.TempPathFactory): Makes the folder they are saved in.
+
+    Returns:
+        dict: The file paths of the 'datarecord', 'CN' and 'POST' files.
+    """
+    return synthetic_data.generate(str(tmp_path_factory.mktemp('synthetic')), ROWS, seed=5)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def write_exports(files, folder, fraction=1.0):
+    """
+    Copies the fake data record and the first part of each export into a folder, keeping both header rows.
+
+    Arguments:
+        files (dict): The files from synthetic_files.
+        folder (str): The folder to copy them into, under the same names.
+        fraction (float): The fraction of each export's responses to copy.
+    """
+    shutil.copy(files['datarecord'], folder)
+    for key in ['CN', 'POST']:
+        with open(files[key], 'rb') as file:
+            lines=file.readlines()
+        responses=len(lines)-2
+        with open(os.path.join(folder, os.path.basename(files[key])), 'wb') as file:
+            file.writelines(lines[:2+int(responses*fraction)])
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def run_trends(folder, trendsfile, options):
+    """
+    Runs get_completion_data with trends by recorded date on the files in a folder, keeping the trends in trendsfile.
+
+    Arguments:
+        folder (str): The folder with the files in, which the output is saved in too.
+        trendsfile (str): Where the trends are kept between runs.
+        options (dict): The keyword arguments for the mode, see MODES.
+
+    Returns:
+        dict: The trends saved in trendsfile.
+    """
+    options={key: os.path.join(folder, value) if key=='statefile' else value for key, value in options.items()}
+    names={key: os.path.join(folder, name) for key, name in [('datarecord', synthetic_data.DATA_RECORD_FILE), ('CN', synthetic_data.CN_FILE),
+                                                             ('POST', synthetic_data.POST_FILE)]}
+    with contextlib.redirect_stdout(io.StringIO()):
+        pipeline.get_completion_data(names['datarecord'], names['CN'], pipeline.CNnames, names['POST'], pipeline.POSTnames,
+                                     outputfile=os.path.join(folder, 'Participant Completion Data.xlsx'), outputformat='csv',
+                                     trenddates='recorded', trendsfile=trendsfile, **options)
+    return pd.read_pickle(trendsfile)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def assert_trends_equal(expected, result):
+    """
+    Checks two trends count the same things on the same days. The running totals can have different amounts of room
+    left over, so only the days they have are compared.
+
+    Arguments:
+        expected (dict): The trends from build_trends.
+        result (dict): The trends from extend_trends.
+    """
+    for name in ['completion', 'pidformat']:
+        expectedsums, resultsums=expected[name], result[name]
+        assert (expectedsums['start'], expectedsums['days'])==(resultsums['start'], resultsums['days'])
+        np.testing.assert_array_equal(expectedsums['sums'][:expectedsums['days']+1], resultsums['sums'][:resultsums['days']+1])
+        np.testing.assert_array_equal(expectedsums['undated'], resultsums['undated'])
+    pd.testing.assert_frame_equal(expected['rows'], result['rows'])
+    assert expected['responses']==result['responses']
+    pd.testing.assert_frame_equal(pipeline.completion_trend(expected), pipeline.completion_trend(result))
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def test_prefix_sums_match_counting():
+    rng=np.random.default_rng(0)
+    prefixsums=pipeline.new_prefix_sums(4)
+    added=[]
+    #the later batches go before the first day as well as after the last, and some take things back out
+    for first, last in [(20, 30), (25, 40), (0, 10), (35, 60), (5, 50)]:
+        dates=pd.Series(pd.Timestamp('2023-07-01')+pd.to_timedelta(rng.integers(first, last, 200), unit='D'))
+        dates[rng.random(200)<0.1]=pd.NaT
+        columns=rng.integers(-1, 4, 200)
+        weights=rng.choice([1, 1, 1, -1], 200)
+        pipeline.add_prefix_counts(prefixsums, dates, columns, weights)
+        added.append(pd.DataFrame({'date': dates, 'column': columns, 'weight': weights}))
+    added=pd.concat(added, ignore_index=True)
+    added=added[added['column']>=0]
+    for start, end in [(None, None), ('2023-07-01', '2023-07-01'), ('2023-07-10', '2023-08-05'), ('2023-06-01', '2023-07-15'),
+                       ('2023-08-20', '2023-09-30'), ('2023-07-30', None)]:
+        dated=added['date'].notna()
+        if start is not None:
+            dated&=added['date']>=pd.Timestamp(start)
+        if end is not None:
+            dated&=added['date']<=pd.Timestamp(end)
+        expected=np.bincount(added.loc[dated, 'column'], added.loc[dated, 'weight'], minlength=4).astype(np.int64)
+        np.testing.assert_array_equal(pipeline.prefix_counts_between(prefixsums, start, end), expected)
+    undated=added[added['date'].isna()]
+    np.testing.assert_array_equal(prefixsums['undated'], np.bincount(undated['column'], undated['weight'], minlength=4).astype(np.int64))
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def test_extend_moves_changed_rows():
+    rowdates=pd.Series(pd.to_datetime(['2023-07-03', '2023-07-04', '2023-07-05', None]))
+    responses={'During session': (pd.to_datetime(['2023-07-03', '2023-07-04']).to_numpy(), np.array([True, False]))}
+    trends=pipeline.build_trends('recorded', np.array([0, 1, 2, 3]), rowdates, responses)
+    #row 1 now counts as something else, row 2 moved to another day, row 3 got a date and row 4 is new
+    newrowdates=pd.Series(pd.to_datetime(['2023-07-03', '2023-07-04', '2023-07-10', '2023-07-06', '2023-07-01']))
+    newcodes=np.array([0, 5, 2, 3, 7])
+    newresponses={'During session': (pd.to_datetime(['2023-07-03', '2023-07-04', '2023-07-01']).to_numpy(), np.array([True, False, True]))}
+    extended=pipeline.extend_trends(trends, 'recorded', newcodes, newrowdates, newresponses)
+    assert extended is trends
+    assert_trends_equal(pipeline.build_trends('recorded', newcodes, newrowdates, newresponses), extended)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+def test_extend_rebuilds_when_export_shrinks():
+    rowdates=pd.Series(pd.to_datetime(['2023-07-03', '2023-07-04']))
+    responses={'During session': (pd.to_datetime(['2023-07-03', '2023-07-04']).to_numpy(), np.array([True, False]))}
+    trends=pipeline.build_trends('recorded', np.array([0, 1]), rowdates, responses)
+    #an export with fewer responses than were counted can't just have been added to, so nothing of the old trends is kept
+    fewer={'During session': (pd.to_datetime(['2023-07-04']).to_numpy(), np.array([True]))}
+    extended=pipeline.extend_trends(trends, 'recorded', np.array([0, 1]), rowdates, fewer)
+    assert extended is not trends
+    assert_trends_equal(pipeline.build_trends('recorded', np.array([0, 1]), rowdates, fewer), extended)
+#--------------------------------------------------------------------------------------------------------------------------------------------#
+@pytest.mark.parametrize('options', list(MODES.values()), ids=list(MODES))
+def test_extend_matches_build(synthetic_files, tmp_path, monkeypatch, options):
+    extendeddir, builtdir=tmp_path/'extended', tmp_path/'built'
+    extendeddir.mkdir()
+    builtdir.mkdir()
+    write_exports(synthetic_files, str(extendeddir), FIRST_FRACTION)
+    first=run_trends(str(extendeddir), str(extendeddir/'trends.pkl'), options)
+    write_exports(synthetic_files, str(extendeddir))
+    #the responses were only added to the bottom, so the saved trends must be brought up to date rather than made again
+    with monkeypatch.context() as patch:
+        patch.setattr(pipeline, 'build_trends', lambda *arguments, **keywords: pytest.fail("The trends were made again"))
+        extended=run_trends(str(extendeddir), str(extendeddir/'trends.pkl'), options)
+    write_exports(synthetic_files, str(builtdir))
+    built=run_trends(str(builtdir), str(builtdir/'trends.pkl'), options)
+    assert first['responses']!=built['responses']
+    assert_trends_equal(built, extended)
+    #every row of the data record which is counted (see encode_completion) is counted once, on its day or as undated
+    completion=built['completion']
+    assert len(built['rows'])==ROWS
+    assert pipeline.prefix_counts_between(completion).sum()+completion['undated'].sum()==(built['rows']['code']>=0).sum()